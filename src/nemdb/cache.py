@@ -0,0 +1,255 @@
+"""Size bounded file cache with an on-disk manifest.
+
+The manifest (`_manifest.json` at the root of the cache) records for every cached
+file its size, its last access time and whether its content was ingested into the
+parquet datasets. When the cache grows over its byte budget, ingested files are
+evicted first, then the least recently used ones.
+
+Two caches are kept: the raw archives downloaded from NEMWEB, in `Config.TEMP_DIR`,
+and the parquet files read from remote datasets, in `Config.SCAN_CACHE_DIR`, which
+mirrors the directories of the datasets.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from .config import Config
+from .logger import log
+
+MANIFEST = "_manifest.json"
+SIDECARS = (".meta.json",)
+
+
+class FileCache:
+    """Keeps a directory of cached files under a byte budget.
+
+    Parameters
+    ----------
+    root : str
+        Directory holding the cached files.
+    max_bytes : int, optional
+        Byte budget of the cache, unbounded if None.
+    max_age : float, optional
+        Files not accessed for more than `max_age` seconds are evicted, never if None.
+    recursive : bool
+        Cache the files of the sub directories, named by their path from the root.
+    """
+
+    def __init__(
+        self, root, max_bytes: int = None, max_age: float = None, recursive=False
+    ):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.recursive = recursive
+        self._lock = threading.RLock()
+        self._pinned = set()
+        self._entries = None
+
+    @property
+    def manifest_path(self):
+        return self.root / MANIFEST
+
+    @property
+    def entries(self) -> dict:
+        """Manifest entries by file name, loaded from disk on first use."""
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            return self._entries
+
+    def _load(self):
+        """Reads the manifest, merged with the files present in the directory."""
+        entries = self._scan()
+        try:
+            with open(self.manifest_path) as f:
+                known = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            known = {}
+        for name, entry in known.items():
+            if name in entries:
+                entries[name]["last_access"] = entry["last_access"]
+                entries[name]["ingested"] = entry["ingested"]
+        return entries
+
+    def _scan(self):
+        """Builds the manifest entries from the files in the directory."""
+        entries = {}
+        if not self.root.exists():
+            return entries
+        paths = self.root.rglob("*") if self.recursive else self.root.iterdir()
+        for path in paths:
+            if not path.is_file() or self._is_internal(path.name):
+                continue
+            stat = path.stat()
+            entries[self._name(path)] = {
+                "size": stat.st_size,
+                "last_access": stat.st_mtime,
+                "ingested": False,
+            }
+        return entries
+
+    def _name(self, path) -> str:
+        """Name of a cached file in the manifest."""
+        if self.recursive:
+            return Path(path).relative_to(self.root).as_posix()
+        return os.path.basename(path)
+
+    @staticmethod
+    def _is_internal(name):
+        return (
+            name.startswith(MANIFEST)
+            or name.endswith(".part")
+            or name.endswith(".tmp")
+            or any(name.endswith(sidecar) for sidecar in SIDECARS)
+        )
+
+    def _save(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def rebuild(self):
+        """Rebuilds the manifest from the files in the directory."""
+        with self._lock:
+            self._entries = None
+            _ = self.entries
+            self._save()
+
+    def add(self, path):
+        """Records a new file in the cache, pins it and evicts files over the budget."""
+        name = self._name(path)
+        with self._lock:
+            self.entries[name] = {
+                "size": os.path.getsize(path),
+                "last_access": time.time(),
+                "ingested": False,
+            }
+            self._pinned.add(name)
+            self.evict()
+
+    def touch(self, path):
+        """Records an access to a cached file and pins it."""
+        name = self._name(path)
+        with self._lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                self.add(path)
+                return
+            entry["last_access"] = time.time()
+            self._pinned.add(name)
+            self._save()
+
+    def touch_all(self, paths):
+        """Records an access to cached or new files, pins them and evicts once."""
+        now = time.time()
+        with self._lock:
+            for path in paths:
+                name = self._name(path)
+                entry = self.entries.get(name)
+                if entry is None:
+                    entry = self.entries[name] = {
+                        "size": os.path.getsize(path),
+                        "ingested": False,
+                    }
+                entry["last_access"] = now
+                self._pinned.add(name)
+            self.evict()
+
+    def mark_ingested(self, path):
+        """Flags the file as written to the parquet datasets, it will be evicted first."""
+        name = self._name(path)
+        with self._lock:
+            if name in self.entries:
+                self.entries[name]["ingested"] = True
+            self._pinned.discard(name)
+            self._save()
+
+    def release(self, path):
+        """Unpins a file so it can be evicted."""
+        with self._lock:
+            self._pinned.discard(self._name(path))
+
+    def size(self):
+        """Total size of the cached files in bytes."""
+        return sum(entry["size"] for entry in self.entries.values())
+
+    def evict(self):
+        """Removes files until the cache is within budget.
+
+        Expired files are removed first, then ingested files and then the least recently
+        used ones. Files pinned by this process are never removed.
+        """
+        with self._lock:
+            now = time.time()
+            candidates = sorted(
+                (name for name in self.entries if name not in self._pinned),
+                key=lambda name: (
+                    not self.entries[name]["ingested"],
+                    self.entries[name]["last_access"],
+                ),
+            )
+            total = self.size()
+            for name in candidates:
+                entry = self.entries[name]
+                expired = (
+                    self.max_age is not None
+                    and now - entry["last_access"] > self.max_age
+                )
+                over_budget = self.max_bytes is not None and total > self.max_bytes
+                if not (expired or over_budget):
+                    continue
+                self._remove(name)
+                total -= entry["size"]
+            self._save()
+
+    def _remove(self, name):
+        log.info("Evicting %s from cache %s", name, self.root)
+        for suffix in ("", *SIDECARS):
+            try:
+                os.remove(self.root / f"{name}{suffix}")
+            except FileNotFoundError:
+                pass
+        del self.entries[name]
+        directory = (self.root / name).parent
+        while directory != self.root:
+            try:
+                directory.rmdir()
+            except OSError:
+                break
+            directory = directory.parent
+
+
+_RAW_CACHE = None
+_RAW_CACHE_LOCK = threading.Lock()
+
+
+def raw_cache() -> FileCache:
+    """Returns the cache of raw archives in `Config.TEMP_DIR`."""
+    global _RAW_CACHE
+    with _RAW_CACHE_LOCK:
+        if _RAW_CACHE is None or _RAW_CACHE.root != Path(Config.TEMP_DIR):
+            _RAW_CACHE = FileCache(Config.TEMP_DIR)
+        _RAW_CACHE.max_bytes = Config.TEMP_DIR_MAX_BYTES
+        _RAW_CACHE.max_age = Config.TEMP_DIR_MAX_AGE
+        return _RAW_CACHE
+
+
+_SCAN_CACHE = None
+_SCAN_CACHE_LOCK = threading.Lock()
+
+
+def scan_cache() -> FileCache:
+    """Returns the cache of the files of remote datasets in `Config.SCAN_CACHE_DIR`."""
+    global _SCAN_CACHE
+    with _SCAN_CACHE_LOCK:
+        if _SCAN_CACHE is None or _SCAN_CACHE.root != Path(Config.SCAN_CACHE_DIR):
+            _SCAN_CACHE = FileCache(Config.SCAN_CACHE_DIR, recursive=True)
+        _SCAN_CACHE.max_bytes = Config.SCAN_CACHE_MAX_BYTES
+        _SCAN_CACHE.max_age = Config.SCAN_CACHE_MAX_AGE
+        return _SCAN_CACHE
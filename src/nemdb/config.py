@@ -9,7 +9,25 @@ class Config:
 
     CACHE_DIR = Path.home() / ".nemweb_cache"
     FILESYSTEM = "local"
+    FILESYSTEM_OPTIONS = {}
     TEMP_DIR = Path(gettempdir()) / ".nemweb_temp"
+    TEMP_DIR_MAX_BYTES = 20 * 2**30
+    TEMP_DIR_MAX_AGE = None
+    SCAN_CACHE_DIR = Path(gettempdir()) / ".nemweb_scan_cache"
+    SCAN_CACHE_MAX_BYTES = 20 * 2**30
+    SCAN_CACHE_MAX_AGE = None
+    LISTING_TTL = 600  # seconds
+    MAX_CONNECTIONS_PER_HOST = 4
+    HTTP_POOL_HOSTS = 10
+    HTTP_TIMEOUT = (10, 60)  # connect, read
+    HTTP_RETRIES = 3
+    HTTP_BACKOFF = 0.5
+    STREAM_MEMORY_BYTES = 256 * 2**20
+    COMPACT_TARGET_BYTES = 128 * 2**20
+    ROW_GROUP_SIZE = 64 * 1024
+    DATA_PAGE_SIZE = 32 * 2**10
+    SNAPSHOT_RETENTION = 24 * 3600  # seconds
+    WRITE_PROFILE = None
 
     @classmethod
     def set_cache_dir(cls, cache_dir):
@@ -18,7 +36,103 @@ class Config:
         log.info("Set cache directory to %s", cls.CACHE_DIR)
 
     @classmethod
-    def set_filesystem(cls, filesystem):
-        """Sets the cache directory location."""
+    def set_filesystem(cls, filesystem, **options):
+        """Sets the fsspec filesystem of the datasets and its options, such as credentials."""
         cls.FILESYSTEM = filesystem
+        cls.FILESYSTEM_OPTIONS = options
         log.info("Set filesystem to %s", cls.FILESYSTEM)
+
+    @classmethod
+    def set_temp_dir_limits(cls, max_bytes=None, max_age=None):
+        """Sets the byte budget and the maximum age in seconds of the raw archive cache."""
+        cls.TEMP_DIR_MAX_BYTES = max_bytes
+        cls.TEMP_DIR_MAX_AGE = max_age
+        log.info(
+            "Set raw archive cache limits to %s bytes, %s seconds",
+            cls.TEMP_DIR_MAX_BYTES,
+            cls.TEMP_DIR_MAX_AGE,
+        )
+
+    @classmethod
+    def set_scan_cache(cls, cache_dir=None, max_bytes=None, max_age=None):
+        """Sets the local cache of the files scanned from remote datasets and its limits."""
+        if cache_dir is not None:
+            cls.SCAN_CACHE_DIR = cache_dir
+        cls.SCAN_CACHE_MAX_BYTES = max_bytes
+        cls.SCAN_CACHE_MAX_AGE = max_age
+        log.info(
+            "Set scan cache to %s, limited to %s bytes, %s seconds",
+            cls.SCAN_CACHE_DIR,
+            cls.SCAN_CACHE_MAX_BYTES,
+            cls.SCAN_CACHE_MAX_AGE,
+        )
+
+    @classmethod
+    def set_listing_ttl(cls, ttl):
+        """Sets how long in seconds NEMWEB directory listings are reused without a request."""
+        cls.LISTING_TTL = ttl
+        log.info("Set listing TTL to %s seconds", cls.LISTING_TTL)
+
+    @classmethod
+    def set_max_connections_per_host(cls, max_connections):
+        """Sets the maximum number of concurrent requests sent to a single host."""
+        cls.MAX_CONNECTIONS_PER_HOST = max_connections
+        log.info("Set max connections per host to %s", cls.MAX_CONNECTIONS_PER_HOST)
+
+    @classmethod
+    def set_stream_memory(cls, max_bytes):
+        """Sets the approximate memory budget of the streaming (low memory) ingestion."""
+        cls.STREAM_MEMORY_BYTES = max_bytes
+        log.info("Set streaming memory budget to %s bytes", cls.STREAM_MEMORY_BYTES)
+
+    @classmethod
+    def set_compact_target(cls, target_bytes):
+        """Sets the approximate size of the files merged by compaction."""
+        cls.COMPACT_TARGET_BYTES = target_bytes
+        log.info("Set compaction target to %s bytes", cls.COMPACT_TARGET_BYTES)
+
+    @classmethod
+    def set_snapshot_retention(cls, retention):
+        """Sets how long in seconds the files of replaced snapshots are kept for readers."""
+        cls.SNAPSHOT_RETENTION = retention
+        log.info("Set snapshot retention to %s seconds", cls.SNAPSHOT_RETENTION)
+
+    @classmethod
+    def set_parquet_layout(cls, row_group_size=None, data_page_size=None):
+        """Sets the rows per row group and the data page size in bytes of the parquet files."""
+        if row_group_size is not None:
+            cls.ROW_GROUP_SIZE = row_group_size
+        if data_page_size is not None:
+            cls.DATA_PAGE_SIZE = data_page_size
+        log.info(
+            "Set parquet row groups to %s rows, data pages to %s bytes",
+            cls.ROW_GROUP_SIZE,
+            cls.DATA_PAGE_SIZE,
+        )
+
+    @classmethod
+    def set_write_profile(cls, profile):
+        """Sets the write profile of every table, None to use the profile of each table."""
+        cls.WRITE_PROFILE = profile
+        log.info("Set write profile to %s", cls.WRITE_PROFILE)
+
+    @classmethod
+    def set_http_options(
+        cls, timeout=None, retries=None, backoff=None, pool_hosts=None
+    ):
+        """Sets the timeout, retries, backoff factor and number of host pools of the HTTP client."""
+        if timeout is not None:
+            cls.HTTP_TIMEOUT = timeout
+        if retries is not None:
+            cls.HTTP_RETRIES = retries
+        if backoff is not None:
+            cls.HTTP_BACKOFF = backoff
+        if pool_hosts is not None:
+            cls.HTTP_POOL_HOSTS = pool_hosts
+        log.info(
+            "Set HTTP options timeout=%s retries=%s backoff=%s pool_hosts=%s",
+            cls.HTTP_TIMEOUT,
+            cls.HTTP_RETRIES,
+            cls.HTTP_BACKOFF,
+            cls.HTTP_POOL_HOSTS,
+        )
@@ -11,11 +11,24 @@ from nemdb.dnsp import (
     united_energy,
 )
 from nemdb import log
-from contextlib import suppress
+from nemdb.cache import scan_cache
+from nemdb.pipeline import Period, populate_periods
+from nemdb.storage import (
+    Journal,
+    PartitionManifest,
+    PartitionSpec,
+    compact_partition,
+    write_partitions,
+)
+from nemdb.storage import journal
+from nemdb.storage.catalog import catalog_frame, partition_stats
+from nemdb.storage.manifest import file_id
+from nemdb.storage.partitioning import scan_partitions
+from nemdb.storage.remote import ReadThroughCache
 
 
+import functools
 import fsspec
-from tqdm import tqdm
 import pandas as pd
 import polars as pl
 
@@ -42,6 +55,10 @@ def read_all_zss(year: int):
             continue
 
 
+TIME_COLUMN = "time"
+CATALOG_COLUMNS = ["zss", "network"]
+
+
 class DNSPDataSource:
     def __init__(
         self,
@@ -63,14 +80,53 @@ class DNSPDataSource:
         self.low_memory = False
 
         self.path = f"{config.CACHE_DIR}/{table_name}"
-        self.fs = fsspec.filesystem(config.FILESYSTEM)
+        self.fs = fsspec.filesystem(config.FILESYSTEM, **config.FILESYSTEM_OPTIONS)
         self.fs.makedirs(f"{config.CACHE_DIR}/{table_name}", exist_ok=True)
+        self.manifest = PartitionManifest(
+            self.fs,
+            self.path,
+            stats=functools.partial(
+                partition_stats,
+                self.fs,
+                time_column=TIME_COLUMN,
+                distinct_columns=CATALOG_COLUMNS,
+            ),
+        )
+        self.scan_files = ReadThroughCache(self.fs, scan_cache)
+        self.journal = Journal(self.fs, self.path, table_name)
 
-    def scan(self, *args, **kwargs):
-        """scans the parquet dataset with polars"""
-        kwargs_ = {"hive_partitioning": True, "allow_missing_columns": True}
-        kwargs_.update(kwargs if kwargs is None else {})
-        return pl.scan_parquet(self.path, *args, **kwargs_)
+    def scan(self, *args, version: int = None, **kwargs):
+        """scans the files of a snapshot of the parquet dataset with polars, the latest by default"""
+        if version is None:
+            self.manifest.refresh()
+        files = self.manifest.files(version)
+        if not files:
+            return pl.scan_parquet(
+                f"{self.path}/**/*.parquet",
+                *args,
+                hive_partitioning=True,
+                allow_missing_columns=True,
+            )
+        relative = [path[len(self.path) + 1 :] for path in files]
+        return scan_partitions(
+            list(zip(files, relative)),
+            PartitionSpec(self.partitions[:-1], period=["year"]),
+            *args,
+            scan=self.scan_files.scan,
+            **kwargs,
+        )
+
+    def rebuild_manifest(self):
+        """Rebuilds the manifest of completed partitions from the dataset directory."""
+        self.manifest.rebuild()
+
+    def catalog(self) -> pl.DataFrame:
+        """The yearly partitions and their statistics, without opening files.
+
+        Every partition has its number of files, rows and bytes, the min and max
+        time and the number of distinct zone substations and networks.
+        """
+        return catalog_frame(self.table_name, self.manifest.catalog(), TIME_COLUMN)
 
     def read(self, *args, **kwargs):
         """Reads the parquet dataset with polars
@@ -81,59 +137,150 @@ class DNSPDataSource:
         return self.scan(self, *args, **kwargs).collect()
 
     def add_data(self, year, month, **kwargs):
-        name = self.table_name
-        partition_cols = self.partitions
-        for network, df in read_all_zss(year):
-            data = df.with_columns(
+        frames = self.download_period(year, month)
+        if frames is None:
+            return
+        self.write_period(self.parse_period(frames, year, month), year, month, **kwargs)
+
+    def download_period(self, year, month):
+        """Download stage of populate, returns the loads of each network for the year."""
+        frames = list(read_all_zss(year))
+        if not frames:
+            return None
+        self.journal.record(year, None, journal.DOWNLOAD)
+        return frames
+
+    def parse_period(self, frames, year, month, executor=None):
+        """Parse stage of populate, adds the partition columns to the loads."""
+        datas = [
+            df.with_columns(
                 pl.lit(network, pl.String).alias("network"),
                 pl.lit(year, pl.Int32).alias("year"),
-            ).sort(partition_cols + self.table_primary_keys)
+            ).sort(self.partitions + self.table_primary_keys)
+            for network, df in frames
+        ]
+        self.journal.record(year, None, journal.PARSE)
+        return datas
+
+    def write_period(self, datas, year, month, **kwargs):
+        """Write stage of populate, writes the loads to the parquet dataset.
 
+        The files are published by a single commit of the manifest, replacing the
+        files of a previous write of the year.
+        """
+        name = f"{self.table_name}-{file_id()}"
+        self.journal.record(year, None, journal.WRITE)
+        files = []
+        for data in datas:
             log.debug(
                 "Writing data for %s - %s, at location %s",
                 self.table_name,
                 year,
                 f"{name}-{{i}}.parquet",
             )
-            data.write_parquet(
+            files += write_partitions(
+                data,
                 self.path,
-                use_pyarrow=True,
-                pyarrow_options={
-                    "partition_cols": partition_cols,
-                    "existing_data_behavior": "overwrite_or_ignore",
-                    "basename_template": f"{name}-{{i}}.parquet",
-                },
+                self.partitions,
+                f"{name}-{{i}}.parquet",
+                fs=self.fs,
                 **kwargs,
             )
+        self.manifest.add(year, None, files)
+        self.journal.record(year, None, journal.COMMIT)
 
-    def populate(self, date_slice: slice, force_new: bool = False):
+    def missing_periods(self, date_slice: slice, force_new: bool = False):
+        """Returns the (year, None) periods of the date range that are not in the dataset yet.
+
+        Years interrupted by a previous run are cleaned up and returned with the
+        missing ones.
+        """
+        interrupted = self.journal.recover(self.manifest)
+        for year, _ in interrupted:
+            log.info("Resuming interrupted populate of %s %s", self.table_name, year)
         date_range = pd.date_range(
             start=date_slice.start, end=date_slice.stop, freq="MS"
         )
-        log.info(
-            "Populating database with data from %s to %s", date_range[0], date_range[-1]
-        )
+        periods = []
         years = date_range.year.unique()
-        for year in tqdm(years):
+        for year in map(int, years):
             # Check if data already exists in tables before adding
-            data_exists = False
-            if not force_new:
-                with suppress(pl.exceptions.ComputeError, FileNotFoundError, Exception):
-                    log.info(
-                        "Checking if data already exists for %s %s",
-                        self.table_name,
-                        year,
-                    )
-                    check = self.scan().filter(pl.col("year") == year).head()
-                    data_exists = len(check.collect()) > 0
+            data_exists = (
+                not force_new
+                and (year, None) in self.manifest
+                and (year, None) not in interrupted
+            )
             if not data_exists:
-                self.add_data(year=year, month=None)
+                periods.append((year, None))
             else:
                 log.info(
                     "Data already exists for %s %s, skipping download. Use force_new=True to overwrite.",
                     self.table_name,
                     year,
                 )
+        return periods
+
+    def populate(
+        self,
+        date_slice: slice,
+        force_new: bool = False,
+        jobs: int = 1,
+        parse_jobs: int = 1,
+        write_jobs: int = 1,
+        parse_processes: bool = False,
+        compact: bool = False,
+    ):
+        log.info(
+            "Populating database with data from %s to %s",
+            date_slice.start,
+            date_slice.stop,
+        )
+        periods = self.missing_periods(date_slice, force_new=force_new)
+        populate_periods(
+            [Period(self, year, month) for year, month in periods],
+            jobs=jobs,
+            parse_jobs=parse_jobs,
+            write_jobs=write_jobs,
+            parse_processes=parse_processes,
+            desc=self.table_name,
+        )
+        if compact:
+            self.compact(periods)
+        self.vacuum()
+
+    def vacuum(self, retention: float = None) -> list[str]:
+        """Removes the files no longer listed by the snapshots of the dataset.
+
+        Returns the paths of the removed files.
+        """
+        if retention is None:
+            retention = self.config.SNAPSHOT_RETENTION
+        writing = {
+            (entry["year"], None, None) for entry in self.journal.incomplete().values()
+        }
+        return self.manifest.expire(retention, keep=writing)
+
+    def compact(self, periods: list[tuple] = None, target_bytes: int = None):
+        """Merges the small files of the (year, None) partitions, all by default.
+
+        Returns the partitions that were compacted.
+        """
+        if periods is None:
+            periods = [(p["year"], None) for p in self.manifest.partitions.values()]
+        return [
+            period
+            for period in periods
+            if period in self.manifest
+            and compact_partition(
+                self.fs,
+                self.manifest,
+                self.journal,
+                period,
+                self.table_name,
+                self.table_primary_keys or [],
+                target_bytes or self.config.COMPACT_TARGET_BYTES,
+            )
+        ]
 
 
 if __name__ == "__main__":
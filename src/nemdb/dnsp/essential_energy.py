@@ -5,10 +5,8 @@
 import polars as pl
 import pandas as pd
 
-
-import requests
-
 import pandera as pa
+from nemdb import http
 from nemdb.dnsp.common import LoadSchema
 from nemdb.utils import download_file_to_bytesio
 
@@ -34,29 +32,27 @@ def get_url(year: int):
     if year != 2024:
         return None
 
-    with requests.Session() as s:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:136.0) Gecko/20100101 Firefox/136.0",
-            # "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8",
-            # "Accept-Encoding": "gzip, deflate",
-            # "Accept-Language": "en-GB,en-US;q=0.8,en;q=0.6",
-            # "Connection": "keep-alive",
-            # "DNT": "1",
-            # "Host": "www.essentialenergy.com.au",
-            # "Referer": ,
-            # "Upgrade-Insecure-Requests": "1",
-            # "Cookie": "JSESSIONID=5F0C8AF27E4C1E0EDEE55F7B9E8AA5C4; _ga=GA1.3.1433753942.1593115043; _gid=GA1.3.1353433574.1593115043; _gat_UA-1053426-4=1",
-        }
-        resp1 = requests.get(
-            "https://www.essentialenergy.com.au/our-network/network-projects/zone-substation-reports",
-            headers=headers,
-        )
-        r = s.get(
-            "https://www.essentialenergy.com.au/ext/schools/EE-Zone-Substation-Load-Data-2023-24.zip",
-            stream=True,
-            headers=headers,
-            cookies=resp1.cookies,
-        )
+    headers = {
+        "User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:136.0) Gecko/20100101 Firefox/136.0",
+        # "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8",
+        # "Accept-Encoding": "gzip, deflate",
+        # "Accept-Language": "en-GB,en-US;q=0.8,en;q=0.6",
+        # "Connection": "keep-alive",
+        # "DNT": "1",
+        # "Host": "www.essentialenergy.com.au",
+        # "Referer": ,
+        # "Upgrade-Insecure-Requests": "1",
+        # "Cookie": "JSESSIONID=5F0C8AF27E4C1E0EDEE55F7B9E8AA5C4; _ga=GA1.3.1433753942.1593115043; _gid=GA1.3.1353433574.1593115043; _gat_UA-1053426-4=1",
+    }
+    resp1 = http.get(
+        "https://www.essentialenergy.com.au/our-network/network-projects/zone-substation-reports",
+        headers=headers,
+    )
+    url = "https://www.essentialenergy.com.au/ext/schools/EE-Zone-Substation-Load-Data-2023-24.zip"
+    with (
+        http.host_slot(url),
+        http.get(url, stream=True, headers=headers, cookies=resp1.cookies) as r,
+    ):
         return r.content
 
 
@@ -0,0 +1,123 @@
+"""Shared HTTP client used by the NEMWEB and DNSP fetchers.
+
+All requests go through a single `requests.Session` so that connections are kept
+alive and reused across calls instead of paying a TCP and TLS handshake per file.
+The session is configured from `Config`:
+
+- `HTTP_POOL_HOSTS`: number of per-host connection pools kept alive.
+- `MAX_CONNECTIONS_PER_HOST`: size of each pool, and the number of concurrent
+  requests sent to a single host.
+- `HTTP_TIMEOUT`: (connect, read) timeout in seconds.
+- `HTTP_RETRIES` and `HTTP_BACKOFF`: retries on connection errors and on throttling
+  or server error statuses, with exponential backoff.
+"""
+
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .config import Config
+
+# NEMWEB answers with 403 rather than 429 when it throttles clients.
+RETRY_STATUSES = (403, 429, 500, 502, 503, 504)
+
+_SESSION = None
+_SESSION_KEY = None
+_SESSION_LOCK = threading.Lock()
+
+_HOST_SLOTS: dict[str, threading.BoundedSemaphore] = {}
+_HOST_SLOTS_LOCK = threading.Lock()
+_HELD_SLOTS = threading.local()
+
+
+def _session_key():
+    return (
+        Config.HTTP_POOL_HOSTS,
+        Config.MAX_CONNECTIONS_PER_HOST,
+        Config.HTTP_RETRIES,
+        Config.HTTP_BACKOFF,
+    )
+
+
+def _build_session():
+    retry = Retry(
+        total=Config.HTTP_RETRIES,
+        backoff_factor=Config.HTTP_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=("GET", "HEAD"),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=Config.HTTP_POOL_HOSTS,
+        pool_maxsize=Config.MAX_CONNECTIONS_PER_HOST,
+        max_retries=retry,
+        pool_block=True,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Returns the shared session, rebuilt if the HTTP configuration changed."""
+    global _SESSION, _SESSION_KEY
+    with _SESSION_LOCK:
+        key = _session_key()
+        if _SESSION is None or key != _SESSION_KEY:
+            if _SESSION is not None:
+                _SESSION.close()
+            _SESSION = _build_session()
+            _SESSION_KEY = key
+        return _SESSION
+
+
+@contextmanager
+def host_slot(url):
+    """Blocks until a connection slot is available for the host of the url.
+
+    NEMWEB answers with 403 when too many requests are sent at once, the number of
+    concurrent requests per host is bounded by `Config.MAX_CONNECTIONS_PER_HOST`.
+    Slots are reentrant within a thread.
+    """
+    host = urlparse(url).netloc
+    held = _HELD_SLOTS.__dict__.setdefault("hosts", set())
+    if host in held:
+        yield
+        return
+    with _HOST_SLOTS_LOCK:
+        if host not in _HOST_SLOTS:
+            _HOST_SLOTS[host] = threading.BoundedSemaphore(
+                Config.MAX_CONNECTIONS_PER_HOST
+            )
+        slot = _HOST_SLOTS[host]
+    with slot:
+        held.add(host)
+        try:
+            yield
+        finally:
+            held.discard(host)
+
+
+def get(url, **kwargs) -> requests.Response:
+    """Sends a GET request through the shared session.
+
+    The host slot is held for the duration of the call. Callers streaming the
+    response body should hold `host_slot(url)` until the body is consumed.
+    """
+    kwargs.setdefault("timeout", Config.HTTP_TIMEOUT)
+    with host_slot(url):
+        return get_session().get(url, **kwargs)
+
+
+def head(url, **kwargs) -> requests.Response:
+    """Sends a HEAD request through the shared session."""
+    kwargs.setdefault("timeout", Config.HTTP_TIMEOUT)
+    kwargs.setdefault("allow_redirects", True)
+    with host_slot(url):
+        return get_session().head(url, **kwargs)
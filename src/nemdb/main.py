@@ -5,8 +5,27 @@ from pathlib import Path
 
 from nemdb import Config
 from nemdb.nemweb import NEMWEBManager
+from nemdb.storage import PartitionSpec
+from nemdb.storage.profiles import PROFILES
 from datetime import datetime
 
+filesystem_option = click.option(
+    "--filesystem_option",
+    multiple=True,
+    help="Option of the filesystem as KEY=VALUE, such as credentials, may be repeated.",
+)
+
+
+def _filesystem_options(options):
+    """Parses the KEY=VALUE options of the filesystem."""
+    parsed = {}
+    for option in options:
+        key, sep, value = option.partition("=")
+        if not sep:
+            raise click.BadParameter(f"{option!r} is not KEY=VALUE")
+        parsed[key.strip()] = value.strip()
+    return parsed
+
 
 @click.command()
 @click.option(
@@ -16,6 +35,7 @@ from datetime import datetime
     default=Path.home() / ".nemweb_cache",
 )
 @click.option("--filesystem", default="file", help="filesystem to use")
+@filesystem_option
 @click.option(
     "--date_range",
     prompt="Date",
@@ -23,17 +43,217 @@ from datetime import datetime
 )
 @click.option("--table", prompt="Table", help="Which table to load", default="all")
 @click.option("--force_new", is_flag=True)
-def populate(location, filesystem, date_range, table, force_new):
+@click.option(
+    "--jobs",
+    default=1,
+    type=int,
+    help="Number of (table, month) archives downloaded concurrently.",
+)
+@click.option(
+    "--parse_jobs",
+    default=1,
+    type=int,
+    help="Number of archives parsed concurrently.",
+)
+@click.option(
+    "--write_jobs",
+    default=1,
+    type=int,
+    help="Number of partitions written concurrently.",
+)
+@click.option(
+    "--parse_processes",
+    is_flag=True,
+    help="Parse archives in worker processes instead of threads.",
+)
+@click.option(
+    "--compact",
+    is_flag=True,
+    help="Merge the small files of the partitions written once populate is done.",
+)
+@click.option(
+    "--row_group_size",
+    default=None,
+    type=int,
+    help="Number of rows of the row groups of the parquet files.",
+)
+@click.option(
+    "--data_page_size",
+    default=None,
+    type=int,
+    help="Approximate size in bytes of the data pages of the parquet files.",
+)
+@click.option(
+    "--profile",
+    default=None,
+    type=click.Choice(list(PROFILES)),
+    help="Compression and encodings of the files, the profile of each table by default.",
+)
+@click.option(
+    "--raw_cache_gib",
+    default=None,
+    type=float,
+    help="Disk budget of the raw archive cache in GiB, older archives are evicted.",
+)
+def populate(
+    location,
+    filesystem,
+    filesystem_option,
+    date_range,
+    table,
+    force_new,
+    jobs,
+    parse_jobs,
+    write_jobs,
+    parse_processes,
+    compact,
+    row_group_size,
+    data_page_size,
+    profile,
+    raw_cache_gib,
+):
     click.echo(f"Fetching data for {date_range} to {location}")
     from_date, to_date = date_range.split("->")
     from_date = datetime.strptime(from_date.strip(), "%Y-%m-%d")
     to_date = datetime.strptime(to_date.strip(), "%Y-%m-%d")
 
     Config.set_cache_dir(location)
-    Config.set_filesystem(filesystem)
+    Config.set_filesystem(filesystem, **_filesystem_options(filesystem_option))
+    if raw_cache_gib is not None:
+        Config.set_temp_dir_limits(max_bytes=int(raw_cache_gib * 2**30))
+    if row_group_size is not None or data_page_size is not None:
+        Config.set_parquet_layout(row_group_size, data_page_size)
+    if profile is not None:
+        Config.set_write_profile(profile)
+    dbs = NEMWEBManager(Config)
+    db_table = dbs if table == "all" else getattr(dbs, table)
+    db_table.populate(
+        slice(from_date, to_date),
+        force_new=force_new,
+        jobs=jobs,
+        parse_jobs=parse_jobs,
+        write_jobs=write_jobs,
+        parse_processes=parse_processes,
+        compact=compact,
+    )
+
+
+def _has_partitions(source, rebuild: bool) -> bool:
+    """Whether the table has written partitions.
+
+    Reading the manifest of a table without one rebuilds it from the files of the
+    dataset and writes it, which is only done when asked with `--rebuild`.
+    """
+    if not rebuild and not source.manifest.exists():
+        return False
+    return bool(source.manifest.partitions)
+
+
+@click.command()
+@click.option(
+    "--location",
+    help="Where the data is written.",
+    default=Path.home() / ".nemweb_cache",
+)
+@click.option("--filesystem", default="file", help="filesystem to use")
+@filesystem_option
+@click.option("--table", help="Which table to report on", default="all")
+@click.option(
+    "--column",
+    multiple=True,
+    help="Filtered column, the primary keys stored in the files by default.",
+)
+@click.option("--probes", default=20, type=int, help="Number of values probed.")
+@click.option(
+    "--rebuild",
+    is_flag=True,
+    help="Rebuild the manifest of the tables written without one.",
+)
+def pruning(location, filesystem, filesystem_option, table, column, probes, rebuild):
+    """Reports the row groups read by equality filters on the tables."""
+    Config.set_cache_dir(str(location))
+    Config.set_filesystem(filesystem, **_filesystem_options(filesystem_option))
+    dbs = NEMWEBManager(Config)
+    tables = dbs.tables if table == "all" else [table]
+    for name in tables:
+        source = getattr(dbs, name)
+        if not hasattr(source, "pruning") or not _has_partitions(source, rebuild):
+            continue
+        for report in source.pruning(list(column) or None, probes):
+            click.echo(
+                f"{name}.{report.column}: {report.row_groups_read:.1f} of "
+                f"{report.row_groups} row groups, {report.rows_read:.2%} of rows read, "
+                f"sort position {report.sort_position}, "
+                f"page index {report.page_index:.0%}"
+            )
+
+
+@click.command()
+@click.option(
+    "--location",
+    help="Where the data is written.",
+    default=Path.home() / ".nemweb_cache",
+)
+@click.option("--filesystem", default="file", help="filesystem to use")
+@filesystem_option
+@click.option("--table", prompt="Table", help="Which table to benchmark")
+@click.option("--month", prompt="Month", help='The month written: "%Y-%m".')
+@click.option(
+    "--profile",
+    multiple=True,
+    type=click.Choice(list(PROFILES)),
+    help="Profile measured, all of them by default.",
+)
+def benchmark(location, filesystem, filesystem_option, table, month, profile):
+    """Writes a month of a table with each write profile and measures the files."""
+    Config.set_cache_dir(str(location))
+    Config.set_filesystem(filesystem, **_filesystem_options(filesystem_option))
+    month = datetime.strptime(month.strip(), "%Y-%m")
+    source = getattr(NEMWEBManager(Config), table)
+    for report in source.benchmark(month.year, month.month, profiles=list(profile)):
+        click.echo(
+            f"{table} {report.profile}: {report.bytes / 2**20:.2f} MiB in "
+            f"{report.files} files, {report.rows} rows, "
+            f"write {report.write_seconds:.2f} s, scan {report.scan_seconds * 1000:.1f} ms"
+        )
+
+
+@click.command()
+@click.option(
+    "--location",
+    help="Where the data is written.",
+    default=Path.home() / ".nemweb_cache",
+)
+@click.option("--filesystem", default="file", help="filesystem to use")
+@filesystem_option
+@click.option("--table", prompt="Table", help="Which table to migrate", default="all")
+@click.option(
+    "--partitioning",
+    default=None,
+    help=(
+        'The new partitions, such as "DUID", "day:SETTLEMENTDATE", "hash:DUID:16" '
+        'or "none", the partitioning declared for the table by default.'
+    ),
+)
+@click.option(
+    "--rebuild",
+    is_flag=True,
+    help="Rebuild the manifest of the tables written without one.",
+)
+def migrate(location, filesystem, filesystem_option, table, partitioning, rebuild):
+    """Rewrites the tables with a new partitioning."""
+    Config.set_cache_dir(str(location))
+    Config.set_filesystem(filesystem, **_filesystem_options(filesystem_option))
     dbs = NEMWEBManager(Config)
-    if table == "all":
-        dbs.populate(slice(from_date, to_date), force_new=force_new)
-    else:
-        db_table = getattr(dbs, table)
-        db_table.populate(slice(from_date, to_date), force_new=force_new)
+    tables = dbs.tables if table == "all" else [table]
+    for name in tables:
+        source = getattr(dbs, name)
+        if not hasattr(source, "migrate") or not _has_partitions(source, rebuild):
+            continue
+        spec = None
+        if partitioning is not None:
+            spec = PartitionSpec.parse(partitioning, source.partitioning.period)
+        migrated = source.migrate(spec)
+        click.echo(
+            f"{name}: rewrote {len(migrated)} partitions as {source.partitioning}"
+        )
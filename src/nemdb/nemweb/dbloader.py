@@ -7,28 +7,57 @@ This offers a compressed parquet based backend for the MMSDM tables instead of t
 used in nempy.
 """
 
-from contextlib import suppress
-from functools import lru_cache
+import functools
+import os
+import tempfile
+import threading
 import polars as pl
 import pandas as pd
 import fsspec
 
-from datetime import datetime
-
-from tqdm import tqdm
+from datetime import datetime, timedelta
 
 from nemdb import log as logger
 from .utils import cache_response_zip
-from .nemweb import read_bids
+from .nemweb import bidmove_archive
+from . import reader
+from .reader import read_mmsdm
+from .records import read_record
+from .dimensions import dimensions
+from .schema import TableSchema
 
 from nemdb import Config
+from nemdb.cache import raw_cache, scan_cache
+from nemdb.pipeline import Period, populate_periods
+from nemdb.storage import (
+    Journal,
+    PartitionManifest,
+    PartitionSpec,
+    StreamingPartitionWriter,
+    benchmark_profile,
+    compact_partition,
+    get_profile,
+    merge_partition,
+    pruning_report,
+    write_partitions,
+)
+from nemdb.storage import journal
+from nemdb.storage.catalog import catalog_frame, overlaps, partition_stats
+from nemdb.storage.manifest import file_id, partition_key
+from nemdb.storage.partitioning import (
+    hive_values,
+    load_spec,
+    save_spec,
+    scan_partitions,
+)
+from nemdb.storage.profiles import PROFILES
+from nemdb.storage.remote import ReadThroughCache
 from nemdb.dnsp import DNSPDataSource
 
 
 URL = "http://nemweb.com.au/Data_Archive/Wholesale_Electricity/MMSDM/{year}/MMSDM_{year}_{month:02d}/MMSDM_Historical_Data_SQLLoader/DATA/PUBLIC_DVD_{table}_{year}{month:02d}010000.zip"
 URL_ALT = "http://nemweb.com.au/Data_Archive/Wholesale_Electricity/MMSDM/{year}/MMSDM_{year}_{month:02d}/MMSDM_Historical_Data_SQLLoader/DATA/PUBLIC_ARCHIVE%23{table}%23FILE01%23{year}{month:02d}010000.zip"
 
-STRPTIME = "%Y/%m/%d %H:%M:%S"
 DTYPES = {
     "ENTRYTYPE": pl.Categorical,
     "NORMALSTATUS": pl.String,
@@ -203,6 +232,27 @@ DTYPES = {
 }
 
 
+TIME_TYPES = (pl.Datetime, pl.Date)
+# Identifier columns whose distinct values are counted by the catalog
+CATALOG_COLUMNS = ["DUID", "REGIONID"]
+
+
+def _parse_type(dtype):
+    if dtype == pl.Categorical:
+        return pl.String
+    if dtype.is_integer():
+        return pl.Int64
+    if dtype.is_float():
+        return pl.Float64
+    return dtype
+
+
+# Numeric columns are parsed wide and stored with the types of the schema of their
+# table, see nemdb.nemweb.schema. Categorical columns are parsed as strings and written
+# as codes into the dictionaries of nemdb.nemweb.dimensions.
+PARSE_DTYPES = {k: _parse_type(v) for k, v in DTYPES.items()}
+
+
 class NEMWEBManager:
     """Interface for accessing historical inputs for NEM spot market dispatch (NEMDE).
 
@@ -285,6 +335,11 @@ class NEMWEBManager:
         Coefficients of demand terms in interconnector loss functions.
     DISPATCHINTERCONNECTORRES : InputsBySettlementDate
         Record of which interconnector were used in a particular dispatch interval.
+    BIDMOVE_PRICE : ByBidDay
+        Unit price bids by market day, from the daily BIDMOVE_COMPLETE reports.
+    BIDMOVE_VOLUME : ByBidDay
+        Unit volume bids by 5 min dispatch intervals, from the daily BIDMOVE_COMPLETE
+        reports.
 
     """
 
@@ -367,6 +422,7 @@ class NEMWEBManager:
                 "SS_WIND_AVAILABILITY",
             ],
             table_primary_keys=["SETTLEMENTDATE", "REGIONID"],
+            profile="hot",
         )
         self.DISPATCHLOAD = BySettlementDate(
             config=config,
@@ -407,7 +463,7 @@ class NEMWEBManager:
                 "UIGF",
             ],
             table_primary_keys=["SETTLEMENTDATE", "DUID"],
-            add_partitions=["DUID"],
+            partitioning=PartitionSpec(hash_column="DUID", buckets=16),
         )
         self.DISPATCHPRICE = BySettlementDate(
             config=config,
@@ -429,6 +485,7 @@ class NEMWEBManager:
                 "LOWERREGROP",
             ],
             table_primary_keys=["SETTLEMENTDATE", "REGIONID"],
+            profile="hot",
         )
         self.DUDETAILSUMMARY = ByStartEnd(
             config=config,
@@ -493,6 +550,7 @@ class NEMWEBManager:
                 "ENTRYTYPE",
             ],
             table_primary_keys=["VERSIONNO", "DUID"],
+            profile="archive",
         )
         self.BIDPEROFFER_D = BySettlementDate(
             config=config,
@@ -527,6 +585,7 @@ class NEMWEBManager:
             ],
             table_primary_keys=["SETTLEMENTDATE", "DUID"],
             low_memory=True,
+            profile="archive",
         )
         self.DISPATCHCONSTRAINT = BySettlementDate(
             config=config,
@@ -685,6 +744,58 @@ class NEMWEBManager:
                 "VERSIONNO",
             ],
         )
+        self.BIDMOVE_PRICE = ByBidDay(
+            config=config,
+            table_name="BIDMOVE_PRICE",
+            record="BID_BIDDAYOFFER_D",
+            table_columns=[
+                "SETTLEMENTDATE",
+                "DUID",
+                "BIDTYPE",
+                "PRICEBAND1",
+                "PRICEBAND2",
+                "PRICEBAND3",
+                "PRICEBAND4",
+                "PRICEBAND5",
+                "PRICEBAND6",
+                "PRICEBAND7",
+                "PRICEBAND8",
+                "PRICEBAND9",
+                "PRICEBAND10",
+            ],
+            table_primary_keys=["DUID", "BIDTYPE"],
+        )
+        self.BIDMOVE_VOLUME = ByBidDay(
+            config=config,
+            table_name="BIDMOVE_VOLUME",
+            record="BID_BIDPEROFFER_D",
+            table_columns=[
+                "SETTLEMENTDATE",
+                "INTERVAL_DATETIME",
+                "DUID",
+                "BIDTYPE",
+                "MAXAVAIL",
+                "FIXEDLOAD",
+                "ENABLEMENTMIN",
+                "ENABLEMENTMAX",
+                "LOWBREAKPOINT",
+                "HIGHBREAKPOINT",
+                "BANDAVAIL1",
+                "BANDAVAIL2",
+                "BANDAVAIL3",
+                "BANDAVAIL4",
+                "BANDAVAIL5",
+                "BANDAVAIL6",
+                "BANDAVAIL7",
+                "BANDAVAIL8",
+                "BANDAVAIL9",
+                "BANDAVAIL10",
+                "ROCUP",
+                "ROCDOWN",
+            ],
+            table_primary_keys=["DUID", "BIDTYPE", "INTERVAL_DATETIME"],
+            interval_column="INTERVAL_DATETIME",
+        )
 
     def __repr__(self):
         source = self.config.CACHE_DIR
@@ -708,34 +819,84 @@ class NEMWEBManager:
         """
         return self._active_tables
 
-    def populate(self, date_slice: slice, force_new: bool = False):
-        """Fetch data for all active tables and populate the parquet datasets."""
+    def populate(
+        self,
+        date_slice: slice,
+        force_new: bool = False,
+        jobs: int = 1,
+        parse_jobs: int = 1,
+        write_jobs: int = 1,
+        parse_processes: bool = False,
+        compact: bool = False,
+    ):
+        """Fetch data for all active tables and populate the parquet datasets.
+
+        The (table, month) archives go through a download, parse and write pipeline.
+        `jobs` archives are downloaded concurrently, with requests to each host bounded
+        by `Config.MAX_CONNECTIONS_PER_HOST`, while `parse_jobs` archives are parsed and
+        `write_jobs` partitions are written. With `parse_processes` the archives are
+        parsed in a pool of worker processes, which frees the GIL for large backfills.
+        With `compact` the small files of the partitions written are merged once they
+        are all written.
+        """
         logger.info(
             "Populating database with data from %s to %s",
             date_slice.start,
             date_slice.stop,
         )
-        with (
-            pl.StringCache()
-        ):  # Ensures consistent Categorical values across all tables
-            for table in tqdm(self.active_tables()):
-                table_: DataSource = getattr(self, table)
-                table_.populate(date_slice, force_new=force_new)
-
-    @staticmethod
-    @lru_cache(maxsize=4)
-    def read_bids(year: int, month: int, day: int):
-        """Read bid data for a specific date
-
-        NOTE This method reads data for the specific date, zips are cached locally
-        But not persisted in the database yet because of the size.
+        periods = []
+        for table in dict.fromkeys(self.active_tables()):
+            table_: DataSource = getattr(self, table)
+            periods.extend(
+                Period(table_, *period)
+                for period in table_.missing_periods(date_slice, force_new)
+            )
+        populate_periods(
+            periods,
+            jobs=jobs,
+            parse_jobs=parse_jobs,
+            write_jobs=write_jobs,
+            parse_processes=parse_processes,
+            desc="populate",
+        )
+        if compact:
+            for period in periods:
+                period.source.compact([period.key])
+        for table in dict.fromkeys(self.active_tables()):
+            getattr(self, table).vacuum()
+
+    def catalog(self, tables: list[str] = None) -> pl.DataFrame:
+        """The partitions of the tables and their statistics, one row per partition.
+
+        Read from the manifests of the tables, all of them by default, without
+        opening their parquet files, see `DataSource.catalog`.
+        """
+        if tables is None:
+            tables = [
+                table
+                for table in self.tables
+                if hasattr(getattr(self, table), "catalog")
+            ]
+        return pl.concat(
+            [getattr(self, table).catalog() for table in tables],
+            how="diagonal_relaxed",
+        )
+
+    def read_bids(self, year: int, month: int, day: int):
+        """Read price and volume bids for a specific market day
+
+        The BIDMOVE_COMPLETE report of the day is added to the BIDMOVE_PRICE and
+        BIDMOVE_VOLUME datasets on first use.
         """
-        return read_bids(year, month, day)
+        day = datetime(year, month, day)
+        return (
+            self.BIDMOVE_PRICE.read_day(day).collect(),
+            self.BIDMOVE_VOLUME.read_day(day).collect(),
+        )
 
     def get_unit_volume_bids(self, date: str):
-        """Get unit volume bids for a specific date"""
-        date = datetime.strptime(date, "%Y/%m/%d %H:%M:%S")
-        _, volume = self.read_bids(date.year, date.month, date.day)
+        """Get unit volume bids for a specific dispatch interval"""
+        volume = self.BIDMOVE_VOLUME.get_data(date)
         return volume.with_columns(
             (pl.col("ROCUP") * 60).alias("RAMPUPRATE"),
             (pl.col("ROCDOWN") * 60).alias("RAMPDOWNRATE"),
@@ -766,8 +927,8 @@ class NEMWEBManager:
         ]
 
     def get_unit_price_bids(self, date):
-        date = datetime.strptime(date, "%Y/%m/%d %H:%M:%S")
-        price, _ = self.read_bids(date.year, date.month, date.day)
+        """Get unit price bids for the market day of a dispatch interval"""
+        price = self.BIDMOVE_PRICE.get_data(date)
         return price[
             [
                 "SETTLEMENTDATE",
@@ -816,8 +977,12 @@ def _archive_to_df(
     year: int,
     month: int,
     low_memory: bool = False,
+    dtypes: dict = DTYPES,
 ):
-    """Downloads a zipped csv file and converts it to a pandas DataFrame, returns the DataFrame.
+    """Reads a zipped csv file into a polars DataFrame, returns its header and the DataFrame.
+
+    The csv is streamed into Arrow, dates are parsed and columns projected and cast
+    while the file is read.
 
     Examples
     --------
@@ -863,7 +1028,8 @@ def _archive_to_df(
 
     Returns
     -------
-    pd.DataFrame
+    tuple[Header, pl.DataFrame]
+        The header of the file, read in the same pass as its data, and the data.
 
     Raises
     ------
@@ -871,45 +1037,37 @@ def _archive_to_df(
         If internet connection is down, nemweb is down or data requested is not on nemweb.
 
     """
-    # Read the file into a DataFrame.
-    available_cols = read_header(archive)
-    table_dtypes = {
-        k: DTYPES[k] for k in set(table_columns).intersection(available_cols)
-    }
-
-    data = pd.read_csv(
-        archive,
-        skiprows=1,
-        usecols=table_dtypes,
-        # dtype=table_dtypes,
+    # Missing columns are filled with nulls, the footer record is skipped by the reader
+    return read_mmsdm(archive, list(dict.fromkeys(table_columns)), dtypes)
+
+
+def _parse_archive_worker(archive, table_columns, year, month, out_path):
+    """Parses an archive in a worker process and writes it to an Arrow IPC file.
+
+    Columns are kept with their parse types, they are narrowed and encoded by the
+    parent process which owns the schema and the dictionaries. Returns the header of
+    the archive.
+    """
+    header, data = _archive_to_df(
+        archive, table_columns, year, month, dtypes=PARSE_DTYPES
     )
-    missing_columns = set(table_columns).difference(available_cols)
-    if len(missing_columns):
-        logger.info(
-            "Columns %s were not found in the file %s for %d-%d, filling with null values",
-            missing_columns,
-            table_columns,
-            year,
-            month,
-        )
-    data = data.assign(**{col: None for col in missing_columns})
-    date_types = [k for k in table_dtypes if table_dtypes[k] in (pl.Date, pl.Datetime)]
-    for col in date_types:
-        data[col] = pd.to_datetime(data[col], format=STRPTIME, errors="coerce")
-    # Discard last row of DataFrame
-    data = data[:-1]
-    return pl.from_dataframe(data).cast({k: DTYPES[k] for k in set(table_columns)})
+    data.write_ipc(out_path)
+    return header
 
 
 def read_header(file: str):
     """Returns the set of columns in the file"""
-    return set(pd.read_csv(file, skiprows=1, nrows=1).columns)
+    return set(reader.read_header(file).columns)
 
 
 class _MissingData(Exception):
     """Raise for nemweb not returning status 200 for file request."""
 
 
+class _SchemaWidened(Exception):
+    """Raised when the storage types of a table change while a month is streamed."""
+
+
 class DataSource:
     """Manages Market Management System (MMS) tables stored as parquet files.
 
@@ -917,6 +1075,9 @@ class DataSource:
     and retrieving data are added by sub classing.
     """
 
+    # The time key of the catalog, the first time column of the table if None
+    time_column: str = None
+
     def __init__(
         self,
         config: Config,
@@ -925,26 +1086,237 @@ class DataSource:
         table_primary_keys: list[str] = None,
         add_partitions: bool = None,
         low_memory: bool = False,
+        row_group_size: int = None,
+        partitioning: PartitionSpec = None,
+        profile: str = None,
     ):
-        """Creates a parquet dataset."""
+        """Creates a parquet dataset.
+
+        Files are written in row groups of `row_group_size` rows,
+        `Config.ROW_GROUP_SIZE` by default, sorted by the primary keys, and compressed
+        with the write profile `profile`, "default" if None, see `write_profile`. The
+        dataset is partitioned by `partitioning`, by `add_partitions` and month if
+        None, unless it was already written with another spec, see `migrate`.
+        """
         self.config = config
         self.table_name = table_name
         self.table_columns = table_columns
         self.table_primary_keys = table_primary_keys
-        self.partitions = (
-            add_partitions + ["year", "month"] if add_partitions else ["year", "month"]
+        self.declared_partitioning = partitioning or PartitionSpec(
+            columns=add_partitions or ()
         )
         self.low_memory = low_memory
+        self.row_group_size = row_group_size
+        if profile is not None:
+            get_profile(profile)
+        self.profile = profile
 
         self.path = f"{config.CACHE_DIR}/{table_name}/"
-        self.fs = fsspec.filesystem(config.FILESYSTEM)
+        self.fs = fsspec.filesystem(config.FILESYSTEM, **config.FILESYSTEM_OPTIONS)
         self.fs.makedirs(f"{config.CACHE_DIR}/{table_name}", exist_ok=True)
+        if self.time_column is None:
+            self.time_column = next(
+                (col for col in table_columns if DTYPES.get(col) in TIME_TYPES), None
+            )
+        self.manifest = PartitionManifest(
+            self.fs,
+            self.path,
+            levels=self.declared_partitioning.period,
+            stats=functools.partial(
+                partition_stats,
+                self.fs,
+                time_column=self.time_column,
+                distinct_columns=[
+                    col for col in CATALOG_COLUMNS if col in table_columns
+                ],
+            ),
+        )
+        self.scan_files = ReadThroughCache(self.fs, scan_cache)
+        self._partitioning = None
+        self._partitioning_stored = False
+        self.journal = Journal(self.fs, self.path, table_name)
+        self.dimensions = dimensions(self.fs, str(config.CACHE_DIR))
+        self.dimension_columns = [
+            col for col in table_columns if DTYPES.get(col) == pl.Categorical
+        ]
+        self.schema = TableSchema(
+            self.fs,
+            self.path,
+            table_name,
+            declared={
+                col: DTYPES[col]
+                for col in table_columns
+                if DTYPES.get(col) is not None and DTYPES[col].is_integer()
+            },
+        )
+        self._schema_lock = threading.Lock()
+
+    @property
+    def partitioning(self) -> PartitionSpec:
+        """The partitioning the dataset is written with.
+
+        It is the spec stored with the dataset, or the value partitions of the files
+        of a dataset written before specs were stored, the declared one otherwise.
+        """
+        if self._partitioning is None:
+            period = self.declared_partitioning.period
+            spec = load_spec(self.fs, self.path, period)
+            if spec is None:
+                files = [
+                    file
+                    for partition in self.manifest.partitions.values()
+                    for file in partition["files"]
+                ]
+                spec = (
+                    PartitionSpec.infer(files[0], period)
+                    if files
+                    else self.declared_partitioning
+                )
+            else:
+                self._partitioning_stored = True
+            if spec != self.declared_partitioning:
+                logger.warning(
+                    "%s is partitioned by %r instead of %r, use migrate to rewrite it",
+                    self.table_name,
+                    spec,
+                    self.declared_partitioning,
+                )
+            self._partitioning = spec
+        return self._partitioning
+
+    @property
+    def partitions(self) -> list[str]:
+        """The hive partition columns of the dataset."""
+        return self.partitioning.partitions
+
+    def scan(
+        self,
+        *args,
+        decode: bool = True,
+        version: int = None,
+        periods: list[tuple] = None,
+        **kwargs,
+    ):
+        """scans the parquet dataset with polars
+
+        The files of a snapshot of the manifest are scanned, the latest one or
+        `version`, so the scan is not affected by writes committed after it started,
+        limited to the partitions of `periods` if given, see `prune`. The files of a remote
+        dataset are scanned from local copies, downloaded when a query first reads
+        them, see `Config.set_scan_cache`: a query filtering on other columns than the
+        partitions reads every file, limit it to the `periods` it needs. Numeric columns are cast to the storage types of the
+        table, read again with the manifest, as the files written before a column was
+        widened keep their narrower type.
+        Categorical columns are decoded to the Enum of their dictionary, or left as
+        integer codes if `decode` is False.
+        """
+        if version is None:
+            self.manifest.refresh()
+        self.schema.refresh()
+        files = self.manifest.files(version, periods)
+        empty = not files and periods is not None
+        if empty:
+            # The schema of the dataset, without rows
+            files = self.manifest.files(version)[:1]
+        if files:
+            relative = [path[len(self.path) :] for path in files]
+            data = scan_partitions(
+                list(zip(files, relative)),
+                self.partitioning,
+                *args,
+                scan=self.scan_files.scan,
+                **kwargs,
+            )
+        else:
+            data = pl.scan_parquet(
+                f"{self.path}**/*.parquet",
+                *args,
+                hive_partitioning=True,
+                allow_missing_columns=True,
+            )
+        if empty:
+            data = data.clear()
+        data = self.schema.cast(data, narrow=False)
+        if not decode:
+            return data
+        return self.dimensions.decode(data, self.dimension_columns)
+
+    def encode(self, data: pl.DataFrame) -> pl.DataFrame:
+        """Replaces the categorical columns by their codes, partition columns are kept."""
+        return self.dimensions.encode(
+            data, self.dimension_columns, keep=self.partitions
+        )
+
+    def narrow(self, data: pl.DataFrame, version: str = None) -> pl.DataFrame:
+        """Casts the numeric columns to the storage types of the table.
+
+        Types are chosen for new columns and widened for the columns that overflow,
+        and the precision lost by Float32 columns is logged.
+        """
+        self._check_schema(data, version)
+        return self.schema.cast(data)
+
+    def _check_schema(self, data: pl.DataFrame, version: str = None):
+        for report in self.schema.check(data, version):
+            if report.lossy:
+                logger.info(
+                    "%s values of %s.%s lose precision as %s, the largest error is %s",
+                    report.lossy,
+                    self.table_name,
+                    report.column,
+                    report.dtype,
+                    report.max_error,
+                )
+            if report.overflow:
+                logger.warning(
+                    "%s values of %s.%s do not fit %s, widening to %s",
+                    report.overflow,
+                    self.table_name,
+                    report.column,
+                    report.dtype,
+                    self.schema.dtypes[report.column],
+                )
+
+    @property
+    def write_profile(self):
+        """The compression and encodings of the files written.
+
+        `Config.WRITE_PROFILE` when set, the profile of the table otherwise.
+        """
+        return get_profile(self.config.WRITE_PROFILE or self.profile or "default")
+
+    def write_options(self, **kwargs) -> dict:
+        """The layout and profile of the files, overridden by kwargs."""
+        return {
+            "row_group_size": self.row_group_size or self.config.ROW_GROUP_SIZE,
+            "data_page_size": self.config.DATA_PAGE_SIZE,
+            "profile": self.write_profile,
+            **kwargs,
+        }
+
+    def rebuild_manifest(self):
+        """Rebuilds the manifest of completed partitions from the dataset directory."""
+        self.manifest.rebuild()
+
+    def catalog(self) -> pl.DataFrame:
+        """The partitions of the dataset and their statistics, without opening files.
 
-    def scan(self, *args, **kwargs):
-        """scans the parquet dataset with polars"""
-        kwargs_ = {"hive_partitioning": True, "allow_missing_columns": True}
-        kwargs_.update(kwargs if kwargs is None else {})
-        return pl.scan_parquet(self.path, *args, **kwargs_)
+        Every partition has its number of files, rows and bytes, the min and max of
+        the time key of the table and the number of distinct DUID and REGIONID.
+        """
+        return catalog_frame(self.table_name, self.manifest.catalog(), self.time_column)
+
+    def prune(self, low=None, high=None) -> list[tuple]:
+        """The periods whose time key may have values in [low, high], from the catalog.
+
+        Bounds of None are open, partitions without statistics are always kept.
+        """
+        self.manifest.refresh()
+        return [
+            (p["year"], p["month"], p["day"])
+            for p in self.manifest.partitions.values()
+            if overlaps(p, low, high)
+        ]
 
     def read(self, *args, **kwargs):
         """Reads the parquet dataset with polars
@@ -954,49 +1326,322 @@ class DataSource:
         """
         return self.scan(self, *args, **kwargs).collect()
 
-    def populate(self, date_slice: slice, force_new: bool = False):
-        """Adds data to the parquet dataset from a date range."""
+    def missing_periods(self, date_slice: slice, force_new: bool = False):
+        """Returns the (year, month) pairs of the date range that are not in the dataset yet.
+
+        Months interrupted by a previous run are cleaned up and returned with the
+        missing ones.
+        """
+        interrupted = self.journal.recover(self.manifest)
+        for period in interrupted:
+            logger.info(
+                "Resuming interrupted populate of %s %s",
+                self.table_name,
+                partition_key(*period),
+            )
         date_range = pd.date_range(
             start=date_slice.start, end=date_slice.stop, freq="MS"
         )
+        periods = []
+        for date in date_range:
+            year = date.year
+            month = date.month
+            # Check if data already exists in tables before adding
+            data_exists = (
+                not force_new
+                and (year, month) in self.manifest
+                and (year, month) not in interrupted
+            )
+            if not data_exists:
+                periods.append((year, month))
+            else:
+                logger.info(
+                    "Data already exists for %s %s / %s, skipping download. Use force_new=True to overwrite.",
+                    self.table_name,
+                    year,
+                    month,
+                )
+        return periods
+
+    def populate(
+        self,
+        date_slice: slice,
+        force_new: bool = False,
+        jobs: int = 1,
+        parse_jobs: int = 1,
+        write_jobs: int = 1,
+        parse_processes: bool = False,
+        compact: bool = False,
+    ):
+        """Adds data to the parquet dataset from a date range.
+
+        Months go through a download, parse and write pipeline, so that network, CPU
+        and disk work overlap.
+
+        Parameters
+        ----------
+        date_slice : slice
+            The range of dates to fetch, by month.
+        force_new : bool
+            Overwrite months already in the dataset.
+        jobs : int
+            Number of months downloaded concurrently.
+        parse_jobs : int
+            Number of months parsed concurrently.
+        write_jobs : int
+            Number of months written concurrently.
+        parse_processes : bool
+            Parse the archives in a pool of `parse_jobs` processes instead of threads.
+        compact : bool
+            Merge the small files of the months written once they are all written.
+        """
         logger.info(
-            "Populating database with data from %s to %s", date_range[0], date_range[-1]
+            "Populating database with data from %s to %s",
+            date_slice.start,
+            date_slice.stop,
         )
-        with (
-            pl.StringCache()
-        ):  # Ensures consistent Categorical values across all tables
-            for date in tqdm(date_range):
-                year = date.year
-                month = date.month
-                # Check if data already exists in tables before adding
-                data_exists = False
-                if not force_new:
-                    with suppress(
-                        pl.exceptions.ComputeError, FileNotFoundError, Exception
-                    ):
-                        logger.info(
-                            "Checking if data already exists for %s %s / %s",
-                            self.table_name,
-                            year,
-                            month,
-                        )
-                        check = (
-                            self.scan()
-                            .filter(pl.col("year") == year, pl.col("month") == month)
-                            .head()
-                        )
-                        data_exists = len(check.collect()) > 0
-                if not data_exists:
-                    self.add_data(year=year, month=month)
-                else:
-                    logger.info(
-                        "Data already exists for %s %s / %s, skipping download. Use force_new=True to overwrite.",
-                        self.table_name,
-                        year,
-                        month,
+        periods = self.missing_periods(date_slice, force_new=force_new)
+        populate_periods(
+            [Period(self, *period) for period in periods],
+            jobs=jobs,
+            parse_jobs=parse_jobs,
+            write_jobs=write_jobs,
+            parse_processes=parse_processes,
+            desc=self.table_name,
+        )
+        if compact:
+            self.compact(periods)
+        self.vacuum()
+
+    def vacuum(self, retention: float = None) -> list[str]:
+        """Removes the files no longer listed by the snapshots of the dataset.
+
+        Snapshots replaced more than `retention` seconds ago,
+        `Config.SNAPSHOT_RETENTION` by default, expire, and the files listed by none
+        of the remaining snapshots are removed, except the files of the partitions
+        that are being written. Returns the paths of the removed files.
+        """
+        if retention is None:
+            retention = self.config.SNAPSHOT_RETENTION
+        writing = {
+            (entry["year"], entry["month"], entry.get("day"))
+            for entry in self.journal.incomplete().values()
+        }
+        return self.manifest.expire(retention, keep=writing)
+
+    def compact(self, periods: list[tuple] = None, target_bytes: int = None):
+        """Merges the small files of the partitions into sorted files.
+
+        The small files of each directory of a partition are merged into files of
+        about `target_bytes`, `Config.COMPACT_TARGET_BYTES` by default, with their
+        rows sorted by the primary keys. Scans then list and open a few files per
+        partition whatever the number of writes that made it.
+
+        Parameters
+        ----------
+        periods : list[tuple], optional
+            The (year, month) or (year, month, day) of the partitions to compact, all
+            the partitions of the dataset if None.
+        target_bytes : int, optional
+            Approximate size of the merged files.
+
+        Returns
+        -------
+        list[tuple]
+            The partitions that were compacted.
+        """
+        if periods is None:
+            periods = [
+                tuple(p[k] for k in ("year", "month", "day") if p[k] is not None)
+                for p in self.manifest.partitions.values()
+            ]
+        return [
+            period
+            for period in periods
+            if period in self.manifest
+            and compact_partition(
+                self.fs,
+                self.manifest,
+                self.journal,
+                period,
+                self.table_name,
+                self.table_primary_keys or [],
+                target_bytes or self.config.COMPACT_TARGET_BYTES,
+                **self.write_options(),
+            )
+        ]
+
+    def pruning(self, columns: list[str] = None, probes: int = 20):
+        """Reports how well filters on the columns are pruned by the file statistics.
+
+        Parameters
+        ----------
+        columns : list[str], optional
+            The filtered columns, the primary keys stored in the files by default.
+        probes : int
+            Number of values probed per column.
+
+        Returns
+        -------
+        list[PruningReport]
+        """
+        if columns is None:
+            columns = [
+                col
+                for col in self.table_primary_keys or []
+                if col not in self.partitions
+            ]
+        return [
+            pruning_report(self.fs, self.manifest.files(), col, probes)
+            for col in columns
+        ]
+
+    def benchmark(
+        self, year: int, month: int, day: int = None, profiles: list[str] = None
+    ):
+        """Writes a period with each write profile and measures the files.
+
+        The archive of the period is downloaded and parsed once, then written with
+        every profile to a local temporary directory and scanned back. The dataset
+        itself is left as it is.
+
+        Parameters
+        ----------
+        year : int
+            The year of the period.
+        month : int
+            The month of the period.
+        day : int, optional
+            The day of the period, for tables published daily.
+        profiles : list[str], optional
+            The names of the profiles measured, all of them by default.
+
+        Returns
+        -------
+        list[ProfileReport]
+            The size of the files and the write and scan times of each profile.
+        """
+        period = (year, month) if day is None else (year, month, day)
+        archive = self.fetch_archive(*period)
+        try:
+            data = self._add_partitions(self.read_archive(archive, *period), *period)
+        finally:
+            raw_cache().release(archive)
+        data = self.schema.cast(data)
+        options = self.write_options()
+        del options["profile"]
+        os.makedirs(self.config.TEMP_DIR, exist_ok=True)
+        reports = []
+        with tempfile.TemporaryDirectory(dir=self.config.TEMP_DIR) as tmp_dir:
+            for profile in profiles or PROFILES:
+                reports.append(
+                    benchmark_profile(
+                        data,
+                        f"{tmp_dir}/{profile}",
+                        self.partitions,
+                        profile,
+                        sort_cols=self.table_primary_keys,
+                        **options,
                     )
+                )
+                logger.info("Benchmarked %s: %s", self.table_name, reports[-1])
+        return reports
+
+    def migrate(self, partitioning: PartitionSpec = None) -> list[tuple]:
+        """Rewrites the dataset with another partitioning.
+
+        The partitions whose files are not laid out as `partitioning`, the declared
+        partitioning by default, are read, partitioned again and written under new
+        names. They are published together by a single commit of the manifest, with
+        the new spec, so scans see the dataset in one layout or the other. The old
+        files are removed when the snapshots listing them expire. The partitions are
+        journaled as rewritten until the commit, so the files being written are not
+        vacuumed, and are removed by recovery if the migration is interrupted.
+
+        Parameters
+        ----------
+        partitioning : PartitionSpec, optional
+            The new partitioning, its period must be the period of the dataset.
+
+        Returns
+        -------
+        list[tuple]
+            The partitions that were rewritten.
+        """
+        spec = partitioning or self.declared_partitioning
+        previous = self.partitioning
+        if spec.period != previous.period:
+            raise ValueError(
+                f"Cannot migrate {self.table_name} from {previous.period}"
+                f" periods to {spec.period}"
+            )
+        written = {}
+        self._partitioning = spec
+        try:
+            for partition in list(self.manifest.partitions.values()):
+                if all(spec.matches(file) for file in partition["files"]):
+                    continue
+                period = (partition["year"], partition["month"], partition["day"])
+                self.journal.record(*period[:2], journal.REWRITE, day=period[2])
+                written[period] = self._migrate_period(period, partition["files"])
+            with self._schema_lock:
+                self.manifest.add_all(written)
+                save_spec(self.fs, self.path, spec)
+                self._partitioning_stored = True
+            for year, month, day in written:
+                self.journal.record(year, month, journal.COMMIT, day=day)
+        except BaseException:
+            self._partitioning = previous
+            raise
+        logger.info(
+            "Migrated %s partitions of %s to %r", len(written), self.table_name, spec
+        )
+        return [tuple(p for p in period if p is not None) for period in written]
+
+    def _migrate_period(self, period: tuple, files: list[str]):
+        """Writes the files of a partition with the current partitioning."""
+        frames = []
+        for file in files:
+            with self.fs.open(f"{self.manifest.path}/{file}", "rb") as f:
+                data = pl.read_parquet(f)
+            frames.append(
+                data.with_columns(
+                    pl.lit(value).alias(col)
+                    for col, value in hive_values(file).items()
+                    if col in self.table_columns and col not in data.columns
+                )
+            )
+        data = pl.concat(frames, how="diagonal_relaxed")
+        # Identifiers are stored as codes or as strings depending on the partitioning,
+        # the strings are added to the dictionaries when the data is encoded again
+        codes = [
+            col
+            for col in self.dimension_columns
+            if col in data.columns and data.schema[col].is_integer()
+        ]
+        data = self.dimensions.decode(data, codes).with_columns(
+            pl.col(col).cast(pl.String)
+            for col in self.dimension_columns
+            if col in data.columns
+        )
+        return write_partitions(
+            self._add_partitions(self.encode(self.schema.cast(data)), *period),
+            self.path,
+            self.partitions,
+            f"{self.table_name}-{file_id()}-{{i}}.parquet",
+            sort_cols=self.table_primary_keys,
+            fs=self.fs,
+            **self.write_options(),
+        )
+
+    def _store_partitioning(self):
+        """Stores the partitioning with the dataset the first time it is written."""
+        with self._schema_lock:
+            if not self._partitioning_stored:
+                save_spec(self.fs, self.path, self.partitioning)
+                self._partitioning_stored = True
 
-    def add_data(self, year: int, month: int, **kwargs):
+    def add_data(self, year: int, month: int, day: int = None, **kwargs):
         """Download data for the given table and time, replace any existing data.
 
         Parameters
@@ -1005,167 +1650,339 @@ class DataSource:
             The year to download data for.
         month : int
             The month to download data for.
+        day : int, optional
+            The day to download data for, for tables published daily.
 
         Return
         ------
         None
         """
-        name = self.table_name
-        partition_cols = self.partitions
-
-        if self.low_memory:
-            self._add_data_low_memory(year, month, name, **kwargs)
+        archive = self.download_period(year, month, day)
+        if archive is None:
             return
+        self.write_period(
+            self.parse_period(archive, year, month, day), year, month, day, **kwargs
+        )
+
+    def upsert(self, year: int, month: int, day: int = None):
+        """Merges the archive of a period into the dataset by primary key.
+
+        For corrected archives republished by AEMO: rows with a new key are inserted,
+        rows whose values changed are updated and rows no longer in the archive are
+        deleted. Only the files holding updated or deleted rows are rewritten, and
+        the period is published by a single commit. The archive is read in memory,
+        also in low memory mode.
 
+        Parameters
+        ----------
+        year : int
+            The year to merge.
+        month : int
+            The month to merge.
+        day : int, optional
+            The day to merge, for tables published daily.
+
+        Returns
+        -------
+        MergeReport
+            The rows inserted, updated and deleted and the number of files rewritten,
+            None if the archive is missing.
+        """
+        period = (year, month) if day is None else (year, month, day)
+        archive = self.download_period(*period)
+        if archive is None:
+            return None
         try:
-            data = (
-                self.fetch_data(year, month)
-                .with_columns(
-                    pl.lit(year, pl.Int32).alias("year"),
-                    pl.lit(month, pl.Int8).alias("month"),
-                )
-                .sort(partition_cols + self.table_primary_keys)
-            )
+            data = self._add_partitions(self.read_archive(archive, *period), *period)
+        finally:
+            raw_cache().release(archive)
+        self._store_partitioning()
+        report = merge_partition(
+            self.fs,
+            self.manifest,
+            self.journal,
+            period,
+            self.schema.cast(data),
+            self.partitions,
+            self.table_primary_keys or [],
+            self.table_name,
+            **self.write_options(),
+        )
+        raw_cache().mark_ingested(archive)
+        return report
+
+    def download_period(self, year: int, month: int, day: int = None):
+        """Download stage of populate, returns the archive path or None if it is missing."""
+        period = (year, month) if day is None else (year, month, day)
+        try:
+            archive = self.fetch_archive(*period)
         except _MissingData:
             logger.error(
-                "No data available for %s %s / %s", self.table_name, year, month
+                "No data available for %s %s", self.table_name, partition_key(*period)
             )
-            return
+            return None
+        try:
+            self.journal.record(year, month, journal.DOWNLOAD, day=day)
+        except BaseException:
+            raw_cache().release(archive)
+            raise
+        return archive
+
+    def release_period(self, payload, year: int, month: int, day: int = None):
+        """Unpins the archive of a period dropped before it was written."""
+        archive = payload[0] if isinstance(payload, tuple) else payload
+        raw_cache().release(archive)
+
+    def parse_period(
+        self, archive: str, year: int, month: int, day: int = None, executor=None
+    ):
+        """Parse stage of populate, returns the archive and the data to write.
 
-        logger.debug(
-            "Writing data for %s %s / %s, at location %s",
-            self.table_name,
-            year,
-            month,
-            f"{name}-{{i}}.parquet",
+        The archive is parsed in a worker process when a process pool `executor` is
+        given. In low memory mode the archive is read in chunks by the write stage
+        instead.
+        """
+        if self.low_memory:
+            self.journal.record(year, month, journal.PARSE, day=day)
+            return archive, None
+        period = (year, month) if day is None else (year, month, day)
+        try:
+            if executor is None:
+                data = self.read_archive(archive, *period)
+            else:
+                data = self._read_archive_in_worker(executor, archive, *period)
+            data = self._add_partitions(data, year, month, day)
+        except BaseException:
+            raw_cache().release(archive)
+            raise
+        self.journal.record(year, month, journal.PARSE, day=day)
+        return archive, data
+
+    def _add_partitions(self, data, year: int, month: int, day: int = None):
+        """Adds the partition columns of the period and sorts the rows."""
+        data = data.with_columns(
+            pl.lit(year, pl.Int32).alias("year"),
+            pl.lit(month, pl.Int8).alias("month"),
+            *([] if day is None else [pl.lit(day, pl.Int8).alias("day")]),
         )
-        data.write_parquet(
-            self.path,
-            use_pyarrow=True,
-            pyarrow_options={
-                "partition_cols": partition_cols,
-                "existing_data_behavior": "overwrite_or_ignore",
-                "basename_template": f"{name}-{{i}}.parquet",
-            },
-            **kwargs,
+        return self.partitioning.add_columns(data).sort(
+            self.partitions + self.table_primary_keys
         )
 
-    def _add_data_low_memory(self, year, month, name, **kwargs):
-        logger.info("Fetching data (low memory mode) for %s %s / %s", name, year, month)
+    def _read_archive_in_worker(self, executor, archive, year, month):
+        parsed_dir = os.path.join(self.config.TEMP_DIR, "parsed")
+        os.makedirs(parsed_dir, exist_ok=True)
+        fd, out_path = tempfile.mkstemp(
+            suffix=".arrow",
+            prefix=f"{self.table_name}_{year}{month:02d}-",
+            dir=parsed_dir,
+        )
+        os.close(fd)
         try:
-            archive = _get_archive(name, year, month)
-            self._archive_to_df_low_memory(
-                archive, name, self.table_columns, year, month, self.path, **kwargs
-            )
-            return None
-        except _MissingData:
-            logger.error(
-                "No data available for %s %s / %s", self.table_name, year, month
-            )
-            return
+            header = executor.submit(
+                _parse_archive_worker,
+                archive,
+                self.table_columns,
+                year,
+                month,
+                out_path,
+            ).result()
+            data = pl.read_ipc(out_path, memory_map=False)
+        finally:
+            os.remove(out_path)
+        return self.encode(self.narrow(data, header.version))
+
+    def write_period(self, parsed, year: int, month: int, day: int = None, **kwargs):
+        """Write stage of populate, writes the month to the parquet dataset.
+
+        The files are written under new names and published by a single commit of
+        the manifest once they are all written, replacing the files of a previous
+        write of the month, which are removed when the snapshots listing them expire.
+        """
+        name = self.table_name
+        archive, data = parsed
+        kwargs = self.write_options(**kwargs)
+        self._store_partitioning()
+        self.journal.record(year, month, journal.WRITE, day=day)
+        basename = f"{name}-{file_id()}"
+        try:
+            if self.low_memory:
+                logger.info(
+                    "Reading data (low memory mode) for %s %s / %s", name, year, month
+                )
+                files = self._archive_to_df_low_memory(
+                    archive, name, self.table_columns, year, month, self.path, **kwargs
+                )
+            else:
+                logger.debug(
+                    "Writing data for %s %s / %s, at location %s",
+                    name,
+                    year,
+                    month,
+                    f"{basename}-{{i}}.parquet",
+                )
+                files = write_partitions(
+                    self.schema.cast(data),
+                    self.path,
+                    self.partitions,
+                    f"{basename}-{{i}}.parquet",
+                    sort_cols=self.table_primary_keys,
+                    fs=self.fs,
+                    **kwargs,
+                )
+        finally:
+            raw_cache().release(archive)
+        self.manifest.add(year, month, files, day=day)
+        self.journal.record(year, month, journal.COMMIT, day=day)
+        raw_cache().mark_ingested(archive)
 
     def _archive_to_df_low_memory(
         self, archive, name, table_columns, year, month, path, **kwargs
     ):
-        partition_cols = self.partitions
+        """Streams the archive to the dataset with a bounded memory.
 
-        # Read the file into a DataFrame.
-        available_cols = read_header(archive)
-        table_dtypes = {
-            k: DTYPES[k] for k in set(table_columns).intersection(available_cols)
-        }
-        missing_columns = set(table_columns).difference(available_cols)
-        if len(missing_columns):
-            logger.info(
-                "Columns %s were not found in the file %s for %d-%d, filling with null values",
-                missing_columns,
-                table_columns,
-                year,
-                month,
-            )
+        The csv is parsed in blocks and written through one parquet writer per
+        partition, memory is bounded by `Config.STREAM_MEMORY_BYTES` whatever the
+        size of the month. The storage types are fixed by the first block, the month
+        is streamed again if a later block widens them.
+        """
+        while True:
+            try:
+                return self._stream_archive(
+                    archive, name, table_columns, year, month, path, **kwargs
+                )
+            except _SchemaWidened:
+                logger.info(
+                    "Storage types of %s changed, streaming %s / %s again",
+                    name,
+                    year,
+                    month,
+                )
 
-        reader = pd.read_csv(
-            archive,
-            skiprows=1,
-            usecols=table_dtypes,
-            chunksize=1_000_000,
-            # dtype=table_dtypes,
+    def _stream_archive(
+        self, archive, name, table_columns, year, month, path, **kwargs
+    ):
+        budget = self.config.STREAM_MEMORY_BYTES
+        # Each parsing thread holds a few blocks, the resident memory of the parser
+        # levels off around 30 times the block size
+        writer = StreamingPartitionWriter(
+            self.fs,
+            path,
+            self.partitions,
+            f"{name}-{file_id()}-0.parquet",
+            sort_cols=self.table_primary_keys,
+            max_buffer_bytes=budget // 2,
+            **{
+                k: v
+                for k, v in kwargs.items()
+                if k in ("row_group_size", "data_page_size", "profile")
+            },
         )
-        for j, data in enumerate(reader):
-            data = data.assign(**{col: None for col in missing_columns})
-            date_types = [
-                k for k in table_dtypes if table_dtypes[k] in (pl.Date, pl.Datetime)
-            ]
-            for col in date_types:
-                data[col] = pd.to_datetime(data[col], format=STRPTIME, errors="coerce")
-
-            data = (
-                pl.from_dataframe(data)
-                .cast({k: DTYPES[k] for k in set(table_columns)})
-                .with_columns(
-                    pl.lit(year, pl.Int32).alias("year"),
-                    pl.lit(month, pl.Int8).alias("month"),
-                )
-                .sort(partition_cols + self.table_primary_keys)
-            )
+        dtypes = None
+        try:
+            with reader.open_mmsdm_batches(
+                archive,
+                list(dict.fromkeys(table_columns)),
+                PARSE_DTYPES,
+                block_size=max(budget // 128, 1 << 20),
+            ) as (header, batches):
+                for data in batches:
+                    self._check_schema(data, header.version)
+                    if dtypes is None:
+                        dtypes = self.schema.dtypes
+                    elif self.schema.dtypes != dtypes:
+                        raise _SchemaWidened()
+                    writer.write(
+                        self.partitioning.add_columns(
+                            self.encode(self.schema.cast(data, dtypes)).with_columns(
+                                pl.lit(year, pl.Int32).alias("year"),
+                                pl.lit(month, pl.Int8).alias("month"),
+                            )
+                        )
+                    )
+        except BaseException:
+            for file_path, _ in writer.abort():
+                self.fs.rm(file_path)
+            raise
+        return writer.close()
+
+    def fetch_archive(self, year, month):
+        """Downloads the archive of the month to the raw cache and returns its path."""
+        logger.info("Fetching data for %s %s / %s", self.table_name, year, month)
+        return _get_archive(self.table_name, year, month)
 
-            logger.debug(
-                "Writing data for %s %s / %s, at location %s",
-                self.table_name,
-                year,
-                month,
-                f"{name}-{j}.parquet",
-            )
-            data.write_parquet(
-                path,
-                use_pyarrow=True,
-                pyarrow_options={
-                    "partition_cols": partition_cols,
-                    "existing_data_behavior": "overwrite_or_ignore",
-                    "basename_template": f"{name}-{j}-{{i}}.parquet",
-                },
-                **kwargs,
-            )
+    def read_archive(self, archive, year, month):
+        """Reads the table columns from a downloaded archive."""
+        header, data = _archive_to_df(
+            archive,
+            self.table_columns,
+            year,
+            month,
+            low_memory=self.low_memory,
+            dtypes=PARSE_DTYPES,
+        )
+        return self.encode(self.narrow(data, header.version))
 
     def fetch_data(self, year, month):
-        logger.info("Fetching data for %s %s / %s", self.table_name, year, month)
-        archive = _get_archive(self.table_name, year, month)
-        return _archive_to_df(
-            archive, self.table_columns, year, month, low_memory=self.low_memory
-        )
+        archive = self.fetch_archive(year, month)
+        try:
+            data = self.read_archive(archive, year, month)
+        finally:
+            raw_cache().release(archive)
+        return self.dimensions.decode(data, self.dimension_columns)
 
     def get_data(self):
         return self.read()
 
 
 class BySettlementDate(DataSource):
+    time_column = "SETTLEMENTDATE"
+
     def get_data(self, date_time):
         date_time = datetime.strptime(date_time, "%Y/%m/%d %H:%M:%S")
-        return self.scan().filter(pl.col("SETTLEMENTDATE") == date_time).collect()
+        return (
+            self.scan(periods=self.prune(date_time, date_time))
+            .filter(pl.col("SETTLEMENTDATE") == date_time)
+            .collect()
+        )
 
 
 class ByIntervalDate(DataSource):
+    time_column = "INTERVAL_DATETIME"
+
     def get_data(self, date_time):
         date_time = datetime.strptime(date_time, "%Y/%m/%d %H:%M:%S")
-        return self.scan().filter(pl.col("INTERVAL_DATETIME") == date_time).collect()
+        return (
+            self.scan(periods=self.prune(date_time, date_time))
+            .filter(pl.col("INTERVAL_DATETIME") == date_time)
+            .collect()
+        )
 
 
 class BySettlementDay(DataSource):
+    time_column = "SETTLEMENTDATE"
+
     def get_data(self, date_time):
         # Convert to datetime object
         date_time = datetime.strptime(date_time, "%Y/%m/%d")
         # Change date_time provided so any time less than 04:05:00 will have the previous days date.
-        date_time = date_time - datetime.timedelta(hours=4, seconds=1)
+        date_time = date_time - timedelta(hours=4, seconds=1)
         # Convert to date
         date_time = date_time.date()
-        return self.scan().filter(pl.col("SETTLEMENTDATE") == date_time).collect()
+        return (
+            self.scan(periods=self.prune(date_time, date_time))
+            .filter(pl.col("SETTLEMENTDATE") == date_time)
+            .collect()
+        )
 
 
 class ByStartEnd(DataSource):
+    time_column = "START_DATE"
+
     def get_data(self, date_time):
         date_time = datetime.strptime(date_time, "%Y/%m/%d")
         return (
-            self.scan()
+            self.scan(periods=self.prune(high=date_time))
             .filter(
                 (pl.col("START_DATE") <= date_time)
                 & (pl.col("END_DATE").is_null() | (pl.col("END_DATE") >= date_time))
@@ -1175,6 +1992,8 @@ class ByStartEnd(DataSource):
 
 
 class ByEffectiveDateVersionNo(DataSource):
+    time_column = "EFFECTIVEDATE"
+
     def get_data(self, date_time):
         date_time = datetime.strptime(date_time, "%Y/%m/%d")
         ids = [
@@ -1183,9 +2002,125 @@ class ByEffectiveDateVersionNo(DataSource):
             if key not in ["EFFECTIVEDATE", "VERSIONNO"]
         ]
         return (
-            self.scan()
+            self.scan(periods=self.prune(high=date_time))
             .filter((pl.col("EFFECTIVEDATE") <= date_time))
             .sort(self.table_primary_keys)
             .unique(subset=ids, keep="last")
             .collect()
         )
+
+
+def trading_day(date_time: datetime):
+    """Returns the market day of a dispatch interval, market days start at 04:05."""
+    return (date_time - timedelta(hours=4, seconds=1)).date()
+
+
+class ByBidDay(DataSource):
+    """A sub-table of the BIDMOVE_COMPLETE daily reports.
+
+    Each report is stored in its own (year, month, day) partition, sorted by DUID and
+    written in small row groups, so a lookup for a unit reads a single row group.
+
+    Parameters
+    ----------
+    record : str
+        The sub-table of the report, as `{group}_{table}` of its `I` record.
+    interval_column : str, optional
+        Column of the dispatch interval the bids apply to, bids of the whole market day
+        are returned by `get_data` if None.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        table_name: str,
+        record: str,
+        table_columns: list[str],
+        table_primary_keys: list[str],
+        interval_column: str = None,
+    ):
+        super().__init__(
+            config,
+            table_name,
+            table_columns,
+            table_primary_keys,
+            row_group_size=16_384,
+            partitioning=PartitionSpec(period=["year", "month", "day"]),
+        )
+        self.record = record
+        self.interval_column = interval_column
+
+    def missing_periods(self, date_slice: slice, force_new: bool = False):
+        """Returns the (year, month, day) of the date range that are not in the dataset yet."""
+        interrupted = self.journal.recover(self.manifest)
+        for period in interrupted:
+            logger.info(
+                "Resuming interrupted populate of %s %s",
+                self.table_name,
+                partition_key(*period),
+            )
+        date_range = pd.date_range(
+            start=date_slice.start, end=date_slice.stop, freq="D"
+        )
+        periods = []
+        for date in date_range:
+            period = (date.year, date.month, date.day)
+            if force_new or period not in self.manifest or period in interrupted:
+                periods.append(period)
+            else:
+                logger.info(
+                    "Data already exists for %s %s, skipping download. Use force_new=True to overwrite.",
+                    self.table_name,
+                    partition_key(*period),
+                )
+        return periods
+
+    def fetch_archive(self, year, month, day):
+        """Downloads the report of the day to the raw cache and returns its path."""
+        logger.info("Fetching data for %s %s", self.table_name, (year, month, day))
+        try:
+            return bidmove_archive(year, month, day)
+        except (FileNotFoundError, ValueError) as e:
+            raise _MissingData(str(e)) from e
+
+    def read_archive(self, archive, year, month, day):
+        """Reads the table columns from the sub-table of a downloaded report."""
+        data = read_record(archive, self.record)
+        missing = [col for col in self.table_columns if col not in data.columns]
+        data = (
+            data.with_columns(pl.lit(None).alias(col) for col in missing)
+            .select(self.table_columns)
+            .cast(
+                {
+                    col: PARSE_DTYPES[col]
+                    for col in self.table_columns
+                    if col in PARSE_DTYPES
+                }
+            )
+        )
+        return self.encode(self.narrow(data))
+
+    def _read_archive_in_worker(self, executor, archive, year, month, day):
+        # The sections are already parsed by the threads of the Arrow reader
+        return self.read_archive(archive, year, month, day)
+
+    def ensure_day(self, day):
+        """Adds the report of the market day to the dataset if it is not there yet."""
+        if (day.year, day.month, day.day) not in self.manifest:
+            self.add_data(day.year, day.month, day.day)
+
+    def read_day(self, day) -> pl.LazyFrame:
+        """Scans the bids of a market day, adding the day to the dataset if needed."""
+        self.ensure_day(day)
+        return self.scan(periods=[(day.year, day.month, day.day)]).filter(
+            pl.col("year") == day.year,
+            pl.col("month") == day.month,
+            pl.col("day") == day.day,
+        )
+
+    def get_data(self, date_time):
+        date_time = datetime.strptime(date_time, "%Y/%m/%d %H:%M:%S")
+        bids = self.read_day(trading_day(date_time))
+        if self.interval_column is not None:
+            bids = bids.filter(pl.col(self.interval_column) == date_time)
+        return bids.collect()
@@ -0,0 +1,235 @@
+"""Persisted dictionaries of the identifiers of the MMS tables.
+
+Identifier columns such as `DUID`, `REGIONID` or `CONSTRAINTID` are written to the
+parquet datasets as integer codes into a dictionary shared by every table and every
+month. The dictionaries live in `{CACHE_DIR}/_dimensions/{name}.json` and are append
+only: a value keeps its code once it is added, and a newer version of a dictionary
+only adds values at its end, so codes written by any run decode with the latest one.
+
+Scans decode the codes to `pl.Enum` of the dictionary, so joins and group-bys across
+tables and years run on the integer codes, without a global string cache and without
+merging the dictionaries of the files.
+
+A dictionary is extended under a lock file next to it, `{name}.json.lock`, created
+exclusively, so processes extending it at once, such as concurrent populate runs,
+each add their values to the latest version instead of overwriting each other's.
+"""
+
+import json
+import threading
+
+import polars as pl
+
+from nemdb.logger import log
+from nemdb.storage.locks import file_lock
+
+DIRECTORY = "_dimensions"
+
+# Columns holding the same identifiers share a dictionary
+DOMAINS = {
+    "REGIONFROM": "REGIONID",
+    "REGIONTO": "REGIONID",
+    "FROMREGION": "REGIONID",
+    "TOREGION": "REGIONID",
+    "CONSTRAINTID": "GENCONID",
+}
+
+
+def domain(column: str) -> str:
+    """Returns the name of the dictionary of a column."""
+    return DOMAINS.get(column, column)
+
+
+class Dimension:
+    """An append-only dictionary of the values of an identifier.
+
+    Parameters
+    ----------
+    fs : fsspec.AbstractFileSystem
+        Filesystem of the datasets.
+    path : str
+        Directory of the dictionaries.
+    name : str
+        Name of the dictionary.
+    """
+
+    def __init__(self, fs, path: str, name: str):
+        self.fs = fs
+        self.path = f"{path.rstrip('/')}/{name}.json"
+        self.name = name
+        self._lock = threading.Lock()
+        self._values = None
+        self._version = 0
+        self._index: set = set()
+        self._modified = None
+
+    @property
+    def values(self) -> list[str]:
+        with self._lock:
+            if self._values is None:
+                self._load()
+            return list(self._values)
+
+    @property
+    def version(self) -> int:
+        with self._lock:
+            if self._values is None:
+                self._load()
+            return self._version
+
+    @property
+    def dtype(self) -> pl.Enum:
+        """The Enum of the values, the codes written to the datasets are its indices."""
+        return pl.Enum(self.values)
+
+    def _stamp(self):
+        """The modification time of the file, None if it does not exist."""
+        try:
+            return self.fs.modified(self.path)
+        except FileNotFoundError:
+            return None
+        except NotImplementedError:
+            # Read again every time on the filesystems without modification times
+            return object()
+
+    def _load(self):
+        self._modified = self._stamp()
+        try:
+            with self.fs.open(self.path, "r") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            stored = {"version": 0, "values": []}
+        self._values = stored["values"]
+        self._version = stored["version"]
+        self._index = set(self._values)
+
+    def _save(self):
+        self.fs.makedirs(self.path.rsplit("/", 1)[0], exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with self.fs.open(tmp_path, "w") as f:
+            json.dump(
+                {"name": self.name, "version": self._version, "values": self._values},
+                f,
+            )
+        self.fs.mv(tmp_path, self.path)
+
+    def refresh(self, force: bool = False):
+        """Reads the dictionary again if another process changed it since it was read."""
+        with self._lock:
+            if force or self._values is None or self._stamp() != self._modified:
+                self._load()
+
+    def extend(self, values) -> bool:
+        """Adds the values not in the dictionary yet, returns whether it changed.
+
+        The dictionary is read again under its lock file before it is extended, so
+        values added by other processes are kept, and saved before the new codes are
+        used.
+        """
+        values = [value for value in values if value is not None]
+        with self._lock:
+            if self._values is None:
+                self._load()
+            if all(value in self._index for value in values):
+                return False
+            self.fs.makedirs(self.path.rsplit("/", 1)[0], exist_ok=True)
+            with file_lock(self.fs, f"{self.path}.lock"):
+                self._load()
+                new = [
+                    value for value in dict.fromkeys(values) if value not in self._index
+                ]
+                if not new:
+                    return False
+                self._values.extend(new)
+                self._index.update(new)
+                self._version += 1
+                self._save()
+        log.debug(
+            "Added %s values to dictionary %s, version %s",
+            len(new),
+            self.name,
+            self._version,
+        )
+        return True
+
+
+class Dimensions:
+    """The dictionaries of the identifier columns of a cache directory."""
+
+    def __init__(self, fs, path: str):
+        self.fs = fs
+        self.path = f"{path.rstrip('/')}/{DIRECTORY}"
+        self._lock = threading.Lock()
+        self._dimensions: dict[str, Dimension] = {}
+
+    def __getitem__(self, column: str) -> Dimension:
+        name = domain(column)
+        with self._lock:
+            if name not in self._dimensions:
+                self._dimensions[name] = Dimension(self.fs, self.path, name)
+            return self._dimensions[name]
+
+    def encode(
+        self, data: pl.DataFrame, columns: list[str], keep: list[str] = ()
+    ) -> pl.DataFrame:
+        """Replaces the values of the columns by their codes, extending the dictionaries.
+
+        The values of the `keep` columns, such as hive partition columns, are added to
+        the dictionaries but the columns are left as strings.
+        """
+        columns = [col for col in columns if col in data.columns]
+        for col in columns:
+            self[col].extend(data[col].cast(pl.String).unique().sort().to_list())
+        return data.with_columns(
+            pl.col(col).cast(pl.String).cast(self[col].dtype).to_physical()
+            for col in columns
+            if col not in keep
+        )
+
+    def decode(self, data, columns: list[str]):
+        """Casts the columns to the Enum of their dictionary.
+
+        Works on DataFrames and LazyFrames. Codes are cast directly, string columns,
+        such as hive partition columns, are looked up by value. The dictionaries are
+        read again if other processes added values to them since they were read, and
+        extended with the values of the string columns, such as the partitions of a
+        dataset written before the dictionaries.
+        """
+        schema = data.collect_schema()
+        columns = [col for col in columns if col in schema]
+        strings = [col for col in columns if not schema[col].is_integer()]
+        for col in columns:
+            self[col].refresh()
+        if isinstance(data, pl.DataFrame):
+            for col in columns:
+                if col not in strings and (data[col].max() or 0) >= len(
+                    self[col].values
+                ):
+                    self[col].refresh(force=True)
+        if strings:
+            unique = data.select(
+                pl.col(col).cast(pl.String).unique().sort().implode() for col in strings
+            )
+            if isinstance(unique, pl.LazyFrame):
+                unique = unique.collect()
+            for col in strings:
+                self[col].extend(unique[col][0].to_list())
+        return data.with_columns(
+            pl.col(col).cast(self[col].dtype)
+            if schema[col].is_integer()
+            else pl.col(col).cast(pl.String).cast(self[col].dtype)
+            for col in columns
+        )
+
+
+_DIMENSIONS: dict[str, Dimensions] = {}
+_DIMENSIONS_LOCK = threading.Lock()
+
+
+def dimensions(fs, path: str) -> Dimensions:
+    """Returns the dictionaries of the cache directory, shared by its datasets."""
+    key = f"{fs.protocol}:{path.rstrip('/')}"
+    with _DIMENSIONS_LOCK:
+        if key not in _DIMENSIONS:
+            _DIMENSIONS[key] = Dimensions(fs, path)
+        return _DIMENSIONS[key]
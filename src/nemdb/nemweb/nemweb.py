@@ -1,16 +1,28 @@
 from functools import lru_cache
-import requests
+import hashlib
+import os
+import re
 import tempfile
+import threading
+import time
 import zipfile
 from io import BytesIO
 
-from bs4 import BeautifulSoup
 import tqdm
 
 import polars as pl
 import pandas as pd
 
-from .utils import retry, cache_response_zip
+from nemdb import Config, http
+from .records import read_records
+from .utils import (
+    cache_response_zip,
+    conditional_headers,
+    read_meta,
+    response_validators,
+    retry,
+    write_meta,
+)
 
 NEMWEB_ARCHIVE = "https://nemweb.com.au/Reports/Archive/"
 MMSDM = "https://nemweb.com.au/Data_Archive/Wholesale_Electricity/MMSDM/{year}/MMSDM_{year}_{month:02d}/MMSDM_Historical_Data_SQLLoader/DATA/PUBLIC_DVD_{data}"
@@ -19,32 +31,25 @@ BIDMOVE = "https://nemweb.com.au/Reports/Current/Bidmove_Complete/"
 
 def read_bids(year, month, day):
     """Returns price and volume bids for the given day."""
+    price, volume = list(read_records(bidmove_archive(year, month, day)).values())[:2]
+    return price, volume
+
+
+def bidmove_archive(year, month, day):
+    """Downloads the BIDMOVE_COMPLETE report of the day to the cache, returns its path.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the report of the day is not published in the Current reports.
+    """
     file = "PUBLIC_BIDMOVE_COMPLETE_{year}{month:02d}{day:02d}".format(
         year=year, month=month, day=day
     )
-    files = __read_files_available(BIDMOVE, format=".zip")
-    file = [f for f in files if file in f][0]
-    file = cache_response_zip(file)
-    with zipfile.ZipFile(file, "r") as z, z.open(z.namelist()[0]) as f:
-        first = True
-        dfs = []
-        out = BytesIO()
-        for line in f:
-            line_ = line.decode("utf-8")
-            if not (line_.startswith("D") or line_.startswith("I")):
-                continue
-            if first and line_.startswith("I"):
-                first = False
-            elif line_.startswith("I"):
-                # continue
-                out.seek(0)
-                dfs.append(pl.read_csv(out))
-                out.truncate(0)
-            out.write(line)  # assuming the file is comma-separated
-
-        out.seek(0)
-        dfs.append(pl.read_csv(out))
-        return dfs[0], dfs[1]
+    files = [f for f in __read_files_available(BIDMOVE, format=".zip") if file in f]
+    if not files:
+        raise FileNotFoundError(f"{file} is not available on {BIDMOVE}")
+    return cache_response_zip(files[0])
 
 
 def read_genunits(year: int, month: int) -> pl.DataFrame:
@@ -166,7 +171,8 @@ def read_archived_rooftop_pv() -> pl.DataFrame:
     dfs = []
     # Download the zip file
     for f in tqdm.tqdm(files):
-        response = requests.get(f)
+        response = http.get(f)
+        response.raise_for_status()
         zip_file = zipfile.ZipFile(BytesIO(response.content))
         # For each inner zip file, read all CSV files
         # Extract all inner zip files
@@ -187,7 +193,8 @@ def read_archived_demand_actuals() -> pl.DataFrame:
     dfs = []
     # Download the zip file
     for f in tqdm.tqdm(files):
-        response = requests.get(f)
+        response = http.get(f)
+        response.raise_for_status()
         zip_file = zipfile.ZipFile(BytesIO(response.content))
         # For each inner zip file, read all CSV files
         # Extract all inner zip files
@@ -256,19 +263,66 @@ def read_demand_forecast(date: str = None) -> pl.DataFrame:
 @lru_cache(maxsize=256)
 @retry(tries=2, delay=1, return_on_failure=pd.DataFrame())
 def __fetch(f):
-    return pd.read_csv(f, skiprows=1)
+    response = http.get(f)
+    response.raise_for_status()
+    return pd.read_csv(
+        BytesIO(response.content),
+        skiprows=1,
+        compression="zip" if f.lower().endswith(".zip") else None,
+    )
 
 
 def __read_files_available(url, format=".zip"):
-    # TODO REGEX
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, "html.parser")
-    files = [f"{url}/{tag.text}" for tag in soup.find_all("a") if format in tag.text]
+    """Lists the files linked from a NEMWEB directory page.
+
+    Listings are memoized in process and in a sidecar in `Config.TEMP_DIR` for
+    `Config.LISTING_TTL` seconds, calls within the TTL do not hit the network. Past the
+    TTL the page is revalidated with a conditional request, and only downloaded and
+    parsed again when the server reports it changed.
+    """
+    files = [f"{url}/{link}" for link in __read_links(url) if format in link]
     if len(files) == 0:
         raise ValueError("No files available for the selected url")
     return files
 
 
+_LINK = re.compile(rb"<a\s[^>]*>([^<]+)</a>", re.IGNORECASE)
+_LISTINGS: dict[str, dict] = {}
+_LISTINGS_LOCK = threading.Lock()
+
+
+def __parse_links(html: bytes) -> list[str]:
+    """Extracts the text of the anchors of a directory page."""
+    return [link.decode().strip() for link in _LINK.findall(html)]
+
+
+def __read_links(url) -> list[str]:
+    listing = os.path.join(
+        Config.TEMP_DIR, "listings", hashlib.sha1(url.encode()).hexdigest()
+    )
+    with _LISTINGS_LOCK:
+        cached = _LISTINGS.get(url) or read_meta(listing)
+    if cached and time.time() - cached.get("fetched", 0) < Config.LISTING_TTL:
+        return cached["links"]
+
+    response = http.get(url, headers=conditional_headers(cached) if cached else {})
+    if response.status_code == 304:
+        cached = {**cached, "fetched": time.time()}
+    else:
+        response.raise_for_status()
+        cached = {
+            "url": url,
+            **response_validators(response.headers),
+            "fetched": time.time(),
+            "links": __parse_links(response.content),
+        }
+    os.makedirs(os.path.dirname(listing), exist_ok=True)
+    write_meta(listing, cached)
+    with _LISTINGS_LOCK:
+        _LISTINGS[url] = cached
+    return cached["links"]
+
+
 def __process_demand(df: pd.DataFrame) -> pl.DataFrame:
     return (
         pl.from_pandas(df)
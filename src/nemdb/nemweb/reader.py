@@ -0,0 +1,266 @@
+"""Reader of the MMSDM csv files straight into Arrow.
+
+An MMSDM file is made of a `C` header record, an `I` record with the column names,
+the `D` data records and a `C` footer record. The zipped csv is streamed to the Arrow
+csv reader, which parses the dates, casts and projects the columns as it reads the
+file, so the data is materialised once.
+
+The `I` record is read from the start of the decompressed stream, and the same stream
+is then handed to the parser, so each archive is opened and inflated once. Headers are
+cached by (table, version) of the `I` record.
+"""
+
+import threading
+import zipfile
+from contextlib import contextmanager
+from typing import Iterator, NamedTuple
+
+import polars as pl
+import pyarrow as pa
+from pyarrow import csv
+
+from nemdb.logger import log
+
+STRPTIME = "%Y/%m/%d %H:%M:%S"
+
+_ARROW_TYPES = {
+    pl.Float32: pa.float32(),
+    pl.Float64: pa.float64(),
+    pl.Int8: pa.int8(),
+    pl.Int16: pa.int16(),
+    pl.Int32: pa.int32(),
+    pl.Int64: pa.int64(),
+    # Dates are written with a time of day, they are parsed as timestamps
+    pl.Date: pa.timestamp("us"),
+    pl.Datetime: pa.timestamp("us"),
+}
+
+
+def arrow_type(dtype) -> pa.DataType:
+    """Returns the Arrow type a column is parsed as, categories are parsed as strings."""
+    for pl_type, pa_type in _ARROW_TYPES.items():
+        if dtype == pl_type:
+            return pa_type
+    return pa.string()
+
+
+@contextmanager
+def open_member(path: str):
+    """Opens the csv file, or the first member of the archive when it is zipped."""
+    if not zipfile.is_zipfile(path):
+        with open(path, "rb") as f:
+            yield f
+        return
+    with zipfile.ZipFile(path) as archive:
+        with archive.open(archive.namelist()[0]) as f:
+            yield f
+
+
+class Header(NamedTuple):
+    """Columns of the `I` record of an MMSDM file."""
+
+    table: str
+    version: str
+    columns: tuple[str, ...]
+
+    def missing(self, columns) -> list[str]:
+        """Returns the columns that are not in the file."""
+        return [col for col in columns if col not in self.columns]
+
+
+_HEADERS: dict[tuple[str, str], tuple[bytes, Header]] = {}
+_HEADERS_LOCK = threading.Lock()
+
+
+def sniff_header(f) -> Header:
+    """Reads the `C` and `I` records from the start of the stream.
+
+    The stream is left at the first data record. Headers are cached by the table and
+    version of the `I` record, a header already seen is not parsed again.
+    """
+    f.readline()
+    line = f.readline().rstrip(b"\r\n")
+    record, group, table, version = line.split(b",", 4)[:4]
+    if record != b"I":
+        raise ValueError(f"Expected an I record, found {line[:80]!r}")
+    key = (f"{group.decode()}_{table.decode()}", version.decode())
+    with _HEADERS_LOCK:
+        cached = _HEADERS.get(key)
+        if cached is not None and cached[0] == line:
+            return cached[1]
+        header = Header(*key, tuple(line.decode().split(",")))
+        _HEADERS[key] = (line, header)
+    return header
+
+
+@contextmanager
+def open_mmsdm(path: str):
+    """Opens an MMSDM file and reads its header, yields the header and the stream.
+
+    The stream is positioned at the first data record.
+    """
+    with open_member(path) as f:
+        yield sniff_header(f), f
+
+
+def read_header(path: str) -> Header:
+    """Returns the header of an MMSDM file."""
+    with open_mmsdm(path) as (header, _):
+        return header
+
+
+class InvalidRows:
+    """Handler of the rows whose number of fields differs from the header.
+
+    The `C` footer and the records of other tables are skipped. The data records of
+    the table which are malformed are skipped and counted, and reported once the
+    file is read.
+    """
+
+    def __init__(self, header: Header):
+        self.header = header
+        self.table = tuple(header.columns[1:3])
+        self.malformed = 0
+        self.first = None
+        self._lock = threading.Lock()
+
+    def __call__(self, row) -> str:
+        record, *table = row.text.split(",", 3)[:3]
+        if record == "C" or tuple(table) != self.table:
+            return "skip"
+        with self._lock:
+            self.malformed += 1
+            if self.first is None:
+                self.first = row
+        return "skip"
+
+    def report(self):
+        """Logs the malformed data records skipped."""
+        if not self.malformed:
+            return
+        log.warning(
+            "Skipped %s malformed records of %s version %s, expected %s fields, "
+            "the first has %s: %r",
+            self.malformed,
+            self.header.table,
+            self.header.version,
+            self.first.expected_columns,
+            self.first.actual_columns,
+            self.first.text[:200],
+        )
+
+
+def read_options(header: Header, block_size: int = None) -> csv.ReadOptions:
+    kwargs = {} if block_size is None else {"block_size": block_size}
+    return csv.ReadOptions(column_names=list(header.columns), **kwargs)
+
+
+def parse_options(invalid_rows: InvalidRows) -> csv.ParseOptions:
+    return csv.ParseOptions(invalid_row_handler=invalid_rows)
+
+
+def convert_options(columns: list[str], dtypes: dict) -> csv.ConvertOptions:
+    return csv.ConvertOptions(
+        include_columns=columns,
+        include_missing_columns=True,
+        column_types={col: arrow_type(dtypes[col]) for col in columns if col in dtypes},
+        timestamp_parsers=[STRPTIME],
+        strings_can_be_null=True,
+    )
+
+
+def read_mmsdm(path: str, columns: list[str], dtypes: dict):
+    """Reads the header and the columns of an MMSDM csv file, zipped or not.
+
+    Columns absent from the file are filled with nulls. The header is read from the
+    stream handed to the parser, the file is opened once.
+
+    Parameters
+    ----------
+    path : str
+        Path to the csv file or to the zip archive containing it.
+    columns : list[str]
+        Columns to read, in order.
+    dtypes : dict
+        Polars type of the columns, the type of the others is inferred.
+
+    Returns
+    -------
+    tuple[Header, pl.DataFrame]
+    """
+    with open_mmsdm(path) as (header, f):
+        log_missing(header, columns)
+        invalid_rows = InvalidRows(header)
+        table = csv.read_csv(
+            f,
+            read_options=read_options(header),
+            parse_options=parse_options(invalid_rows),
+            convert_options=convert_options(columns, dtypes),
+        )
+    invalid_rows.report()
+    return header, to_polars(table, columns, dtypes)
+
+
+def read_mmsdm_csv(path: str, columns: list[str], dtypes: dict) -> pl.DataFrame:
+    """Reads the columns of an MMSDM csv file, zipped or not, see `read_mmsdm`."""
+    return read_mmsdm(path, columns, dtypes)[1]
+
+
+@contextmanager
+def open_mmsdm_batches(path: str, columns: list[str], dtypes: dict, block_size: int):
+    """Opens an MMSDM csv file, zipped or not, to stream its columns in batches.
+
+    Yields the header and an iterator of the batches. The member is inflated as it
+    is read, and each batch holds the rows of a block of `block_size` bytes of the
+    csv, so memory does not depend on the size of the file.
+    """
+    with open_mmsdm(path) as (header, f):
+        log_missing(header, columns)
+        invalid_rows = InvalidRows(header)
+        batches = csv.open_csv(
+            f,
+            read_options=read_options(header, block_size),
+            parse_options=parse_options(invalid_rows),
+            convert_options=convert_options(columns, dtypes),
+        )
+        yield header, (to_polars(batch, columns, dtypes) for batch in batches)
+    invalid_rows.report()
+
+
+def iter_mmsdm_batches(
+    path: str, columns: list[str], dtypes: dict, block_size: int
+) -> Iterator[pl.DataFrame]:
+    """Streams the columns of an MMSDM csv file, zipped or not, in batches.
+
+    See `open_mmsdm_batches`.
+    """
+    with open_mmsdm_batches(path, columns, dtypes, block_size) as (_, batches):
+        yield from batches
+
+
+_LOGGED: set = set()
+
+
+def log_missing(header: Header, columns):
+    """Logs the requested columns absent from the file, once per table version."""
+    missing = header.missing(columns)
+    key = (header.table, header.version, tuple(missing))
+    if not missing or key in _LOGGED:
+        return
+    _LOGGED.add(key)
+    log.info(
+        "Columns %s were not found in %s version %s, filling with null values",
+        missing,
+        header.table,
+        header.version,
+    )
+
+
+def to_polars(table: pa.Table | pa.RecordBatch, columns, dtypes) -> pl.DataFrame:
+    """Converts the parsed columns to polars, with dates and categories cast.
+
+    Columns without a type keep the type inferred by the csv reader.
+    """
+    return pl.from_arrow(table).cast(
+        {col: dtypes[col] for col in columns if col in dtypes}
+    )
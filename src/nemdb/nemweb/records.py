@@ -0,0 +1,109 @@
+"""Splitter of the AEMO files holding several record types and sub-tables.
+
+Reports such as BIDMOVE_COMPLETE or the Current dispatch reports hold several tables,
+each starting with its own `I` record followed by its `D` records, and the file ends
+with a `C` record. The boundaries of the sub-tables are found on the raw bytes with
+`bytes.find`, and each section is parsed by the Arrow csv reader from a zero-copy
+slice of the buffer.
+"""
+
+import bisect
+from typing import NamedTuple
+
+import polars as pl
+import pyarrow as pa
+from pyarrow import csv
+
+from .reader import STRPTIME, open_member
+
+
+class Section(NamedTuple):
+    """A sub-table of an AEMO file: its `I` record and the `D` records that follow."""
+
+    table: str
+    version: str
+    start: int
+    end: int
+
+
+def _line_starts(data: bytes, record: bytes) -> list[int]:
+    """Returns the offsets of the lines starting with the record type."""
+    starts = [0] if data.startswith(record + b",") else []
+    pattern = b"\n" + record + b","
+    pos = data.find(pattern)
+    while pos != -1:
+        starts.append(pos + 1)
+        pos = data.find(pattern, pos + 1)
+    return starts
+
+
+def split_sections(data: bytes) -> list[Section]:
+    """Finds the sub-tables of an AEMO file, in the order they appear."""
+    headers = _line_starts(data, b"I")
+    ends = sorted(headers[1:] + _line_starts(data, b"C") + [len(data)])
+    sections = []
+    for start in headers:
+        end = ends[bisect.bisect_right(ends, start)]
+        header = data[start : data.find(b"\n", start)]
+        _, group, table, version = header.split(b",", 4)[:4]
+        sections.append(
+            Section(f"{group.decode()}_{table.decode()}", version.decode(), start, end)
+        )
+    return sections
+
+
+def parse_section(buffer: pa.Buffer, section: Section) -> pl.DataFrame:
+    """Parses a section of the buffer into a DataFrame.
+
+    Column types are inferred, and timestamps in the AEMO format are parsed.
+    """
+    table = csv.read_csv(
+        pa.BufferReader(buffer.slice(section.start, section.end - section.start)),
+        convert_options=csv.ConvertOptions(
+            timestamp_parsers=[STRPTIME], strings_can_be_null=True
+        ),
+    )
+    return pl.from_arrow(table)
+
+
+def read_sections(data: bytes) -> dict[str, pl.DataFrame]:
+    """Parses every sub-table of an AEMO file, returns them by table name.
+
+    Parameters
+    ----------
+    data : bytes
+        The content of the csv file.
+
+    Returns
+    -------
+    dict[str, pl.DataFrame]
+        DataFrames by `{group}_{table}` of their `I` record, in file order.
+    """
+    buffer = pa.py_buffer(data)
+    return {
+        section.table: parse_section(buffer, section)
+        for section in split_sections(data)
+    }
+
+
+def read_records(path: str) -> dict[str, pl.DataFrame]:
+    """Reads the sub-tables of an AEMO csv file, zipped or not."""
+    with open_member(path) as f:
+        data = f.read()
+    return read_sections(data)
+
+
+def read_record(path: str, table: str) -> pl.DataFrame:
+    """Reads one sub-table of an AEMO csv file, the other sections are not parsed.
+
+    Raises
+    ------
+    KeyError
+        If the file has no sub-table with that name.
+    """
+    with open_member(path) as f:
+        data = f.read()
+    for section in split_sections(data):
+        if section.table == table:
+            return parse_section(pa.py_buffer(data), section)
+    raise KeyError(f"No {table} records in {path}")
@@ -0,0 +1,271 @@
+"""Registry of the storage types of the numeric columns of each table.
+
+The csv files are parsed with wide types, Int64 and Float64, and every table keeps its
+own storage types in `{table}/_schema.json`. The first time a column is seen its type
+is chosen: integers get the type the MMS data model declares for the column, or
+`MIN_INTEGER` for the others, wider only if `HEADROOM` times the observed range needs
+it, since the first month seen does not bound the values of the later ones. Quantities
+get Float32, whose values are kept to the published precision in most cases, and
+prices are always stored as Float64.
+
+The types only change when new values would not fit: an integer column that overflows
+is widened and the schema gets a new revision, under a lock file next to the schema
+so concurrent writers each widen the latest one. The files already written keep their
+types, scans cast them to the current ones and never narrow a column, in case another
+process widened it since the schema was read. Precision lost by Float32 columns is
+measured and reported at ingest.
+
+The schema also records the AEMO data model versions, from the `I` record of the files,
+it was applied to.
+"""
+
+import json
+import re
+import threading
+from typing import NamedTuple
+
+import numpy as np
+import polars as pl
+import pyarrow.parquet as pq
+
+from nemdb.storage.locks import file_lock
+
+SCHEMA = "_schema.json"
+
+HEADROOM = 16
+# Integers not declared by the data model, such as ids and counters, are at least
+MIN_INTEGER = pl.Int32
+# Half the last decimal published by AEMO, errors below are not a loss of precision
+TOLERANCE = 5e-6
+PRICES = re.compile(r"^(RRP|\w*ROP|PRICEBAND\d+|MARGINALVALUE)$")
+
+INTEGERS = [pl.Int8, pl.Int16, pl.Int32, pl.Int64]
+FLOAT32_MAX = float(np.finfo(np.float32).max)
+_TYPES = {str(dtype): dtype for dtype in INTEGERS + [pl.Float32, pl.Float64]}
+
+
+def narrowest_integer(low: int, high: int):
+    """Returns the narrowest signed integer type holding the range."""
+    for dtype in INTEGERS:
+        info = np.iinfo(str(dtype).lower())
+        if info.min <= low and high <= info.max:
+            return dtype
+    raise OverflowError(f"[{low}, {high}] does not fit in {INTEGERS[-1]}")
+
+
+class ColumnReport(NamedTuple):
+    """What storing a column with its type costs for a partition."""
+
+    column: str
+    dtype: str
+    overflow: int
+    lossy: int
+    max_error: float
+
+
+class TableSchema:
+    """Storage types of the numeric columns of a table, persisted with the dataset.
+
+    Parameters
+    ----------
+    fs : fsspec.AbstractFileSystem
+        Filesystem of the dataset.
+    path : str
+        Root directory of the dataset.
+    table : str
+        Name of the table.
+    declared : dict, optional
+        The integer types of the columns in the MMS data model.
+    """
+
+    def __init__(self, fs, path: str, table: str, declared: dict = None):
+        self.fs = fs
+        self.path = path.rstrip("/")
+        self.table = table
+        self.declared = declared or {}
+        self._lock = threading.RLock()
+        self._schema = None
+
+    @property
+    def schema_path(self):
+        return f"{self.path}/{SCHEMA}"
+
+    @property
+    def _stored(self) -> dict:
+        with self._lock:
+            if self._schema is None:
+                try:
+                    with self.fs.open(self.schema_path, "r") as f:
+                        self._schema = json.load(f)
+                except FileNotFoundError:
+                    self._schema = self._from_dataset()
+            return self._schema
+
+    def refresh(self):
+        """Reads the schema again, to see the columns widened by other processes."""
+        with self._lock:
+            self._schema = None
+
+    @property
+    def dtypes(self) -> dict:
+        """Storage type of every column seen so far."""
+        with self._lock:
+            return {col: _TYPES[name] for col, name in self._stored["dtypes"].items()}
+
+    @property
+    def revision(self) -> int:
+        """Incremented every time a column is widened."""
+        return self._stored["revision"]
+
+    @property
+    def versions(self) -> dict:
+        """The revision of the schema last applied to each AEMO data model version."""
+        return dict(self._stored["versions"])
+
+    def _from_dataset(self) -> dict:
+        """Starts from the types of the files already written, if any."""
+        dtypes = {}
+        files = self.fs.glob(f"{self.path}/**/*.parquet")
+        if files:
+            with self.fs.open(files[0], "rb") as f:
+                schema = pl.from_arrow(pq.read_schema(f).empty_table()).schema
+            dtypes = {
+                col: str(dtype) for col, dtype in schema.items() if str(dtype) in _TYPES
+            }
+        return {"table": self.table, "revision": 0, "dtypes": dtypes, "versions": {}}
+
+    def _save(self):
+        self.fs.makedirs(self.path, exist_ok=True)
+        tmp_path = f"{self.schema_path}.tmp"
+        with self.fs.open(tmp_path, "w") as f:
+            json.dump(self._schema, f, indent=1)
+        self.fs.mv(tmp_path, self.schema_path)
+
+    def check(self, data: pl.DataFrame, version: str = None) -> list[ColumnReport]:
+        """Chooses the types of new columns and widens the columns that overflow.
+
+        Parameters
+        ----------
+        data : pl.DataFrame
+            The parsed data, with Int64 and Float64 columns.
+        version : str, optional
+            The AEMO data model version of the file.
+
+        Returns
+        -------
+        list[ColumnReport]
+            The overflow and precision loss of the numeric columns.
+        """
+        numeric = [col for col, dtype in data.schema.items() if dtype.is_numeric()]
+        stats = {}
+        if numeric:
+            stats = data.select(
+                expr for col in numeric for expr in _stats_exprs(col)
+            ).row(0, named=True)
+        reports = []
+        self.fs.makedirs(self.path, exist_ok=True)
+        with self._lock, file_lock(self.fs, f"{self.schema_path}.lock"):
+            self._schema = None
+            stored = self._stored
+            changed = False
+            for col in numeric:
+                low, high = stats[f"{col}:min"], stats[f"{col}:max"]
+                if low is None:
+                    continue
+                is_float = data.schema[col].is_float()
+                current = stored["dtypes"].get(col)
+                if current is None:
+                    stored["dtypes"][col] = str(
+                        _choose(col, low, high, is_float, self.declared.get(col))
+                    )
+                    changed = True
+                elif not _fits(_TYPES[current], low, high) or (
+                    is_float and _TYPES[current] in INTEGERS
+                ):
+                    widened = _choose(col, low, high, is_float, self.declared.get(col))
+                    overflow = data.select(_lost(col, _TYPES[current]).sum()).item()
+                    reports.append(ColumnReport(col, current, overflow, 0, 0.0))
+                    stored["dtypes"][col] = str(widened)
+                    stored["revision"] += 1
+                    changed = True
+            if (
+                version is not None
+                and stored["versions"].get(version) != stored["revision"]
+            ):
+                stored["versions"][version] = stored["revision"]
+                changed = True
+            if changed:
+                self._save()
+            dtypes = self.dtypes
+        for col in numeric:
+            if dtypes.get(col) == pl.Float32 and data.schema[col] == pl.Float64:
+                error = (data[col] - data[col].cast(pl.Float32).cast(pl.Float64)).abs()
+                lossy = int((error > TOLERANCE).sum())
+                if lossy:
+                    reports.append(
+                        ColumnReport(col, "Float32", 0, lossy, float(error.max()))
+                    )
+        return reports
+
+    def cast(self, data, dtypes: dict = None, narrow: bool = True):
+        """Casts the numeric columns to their storage types, the current ones by default.
+
+        Columns wider than their storage type are left as they are unless `narrow`.
+        """
+        dtypes = self.dtypes if dtypes is None else dtypes
+        schema = data.collect_schema()
+        return data.cast(
+            {
+                col: dtype
+                for col, dtype in dtypes.items()
+                if col in schema and (narrow or not _wider(schema[col], dtype))
+            }
+        )
+
+
+def _wider(dtype, storage) -> bool:
+    order = [*INTEGERS, pl.Float32, pl.Float64]
+    if dtype not in order or storage not in order:
+        return False
+    return order.index(dtype) > order.index(storage)
+
+
+def _stats_exprs(col):
+    return (
+        pl.col(col).min().cast(pl.Float64).alias(f"{col}:min"),
+        pl.col(col).max().cast(pl.Float64).alias(f"{col}:max"),
+    )
+
+
+def _lost(col, dtype) -> pl.Expr:
+    """The values the type cannot hold."""
+    if dtype == pl.Float32:
+        return pl.col(col).abs() > FLOAT32_MAX
+    info = np.iinfo(str(dtype).lower())
+    return (
+        (pl.col(col) < info.min)
+        | (pl.col(col) > info.max)
+        | (pl.col(col).cast(pl.Float64) % 1 != 0)
+    )
+
+
+def _fits(dtype, low, high) -> bool:
+    if dtype == pl.Float64:
+        return True
+    if dtype == pl.Float32:
+        return max(abs(low), abs(high)) <= FLOAT32_MAX
+    info = np.iinfo(str(dtype).lower())
+    return info.min <= low and high <= info.max
+
+
+def _choose(col, low, high, is_float, declared=None):
+    if is_float:
+        if PRICES.match(col) or not _fits(pl.Float32, low, high):
+            return pl.Float64
+        return pl.Float32
+    try:
+        dtype = narrowest_integer(int(low) * HEADROOM, int(high) * HEADROOM)
+    except OverflowError:
+        dtype = narrowest_integer(int(low), int(high))
+    floor = declared if declared in INTEGERS else MIN_INTEGER
+    return max(dtype, floor, key=INTEGERS.index)
@@ -1,31 +1,212 @@
 import requests
 import os
 import functools
+import json
+import threading
+import zipfile
 import polars as pl
 
 from time import sleep
 
-from nemdb import Config
+from nemdb import Config, http
+from nemdb.cache import raw_cache
+from nemdb.http import host_slot
 from nemdb.logger import log as logger
 
 
-def cache_response_zip(url):
-    """Write in cache the file from the url and return the path to the file."""
+CHUNK_SIZE = 1 << 16  # 64 KiB
+
+
+def cache_response_zip(url, revalidate: bool = True):
+    """Write in cache the file from the url and return the path to the file.
+
+    The response is streamed in chunks to a `.part` file which is renamed once the
+    download is complete, so an interrupted download is never mistaken for a cached
+    file. Interrupted downloads are resumed with an HTTP Range request on the next
+    call. Calls for the same file wait for each other, so a single stream writes the
+    `.part` file and the others read the cached file.
+
+    Failed requests are retried by the shared session, see `nemdb.http`, with the
+    configured backoff.
+
+    The ETag, Last-Modified and Content-Length of the response are kept in a
+    `.meta.json` sidecar. A cached file is checked against its sidecar, and when
+    `revalidate` is True against the server with a single HEAD request, it is
+    downloaded again only if it is corrupt or was republished.
+
+    Files are recorded in the raw archive cache, which evicts older files once it
+    grows over `Config.TEMP_DIR_MAX_BYTES`.
+    """
     base_name = os.path.basename(url)
     path = os.path.join(Config.TEMP_DIR, base_name)
-    if os.path.exists(path):
-        logger.info("reading from cache: %s", path)
-        return path
-    logger.info("Requesting file form %s", url)
-    response = requests.get(url)
+    with _path_lock(path):
+        if os.path.exists(path):
+            meta = read_meta(path)
+            if not _is_intact(path, meta):
+                logger.warning("Cached file %s is corrupt, downloading again", path)
+                os.remove(path)
+            elif not revalidate or _is_fresh(url, path, meta):
+                logger.info("reading from cache: %s", path)
+                raw_cache().touch(path)
+                return path
+            else:
+                logger.info("File %s was republished, downloading again", url)
+                os.remove(path)
+        os.makedirs(Config.TEMP_DIR, exist_ok=True)
+        part_path = f"{path}.part"
+        logger.info("Requesting file form %s", url)
+        try:
+            with host_slot(url):
+                meta = _stream_to_file(url, part_path)
+        except requests.RequestException as e:
+            raise ValueError(f"Failed to download {url}: {e}") from e
+        if meta is None:
+            raise ValueError(f"Download of {url} is incomplete")
+        logger.info("Writing response to cache: %s", path)
+        os.replace(part_path, path)
+        write_meta(path, {"url": url, **meta})
+        os.remove(f"{part_path}.meta.json")
+        raw_cache().add(path)
+    return path
+
+
+_PATH_LOCKS: dict[str, threading.Lock] = {}
+_PATH_LOCKS_LOCK = threading.Lock()
+
+
+def _path_lock(path) -> threading.Lock:
+    """Returns the lock of the downloads to a cached file."""
+    with _PATH_LOCKS_LOCK:
+        return _PATH_LOCKS.setdefault(str(path), threading.Lock())
+
+
+def _stream_to_file(url, path):
+    """Streams the url into path, resuming after the bytes already written to path.
+
+    Returns the validators of the file once it is complete, None if the download is
+    incomplete, raises ValueError if the server refuses the request.
+    """
+    offset = os.path.getsize(path) if os.path.exists(path) else 0
+    headers = {}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        validator = read_meta(path).get("etag")
+        if validator:
+            # Send the whole file instead if it changed since the first attempt
+            headers["If-Range"] = validator
+    with http.get(url, headers=headers, stream=True) as response:
+        if response.status_code == 416:
+            # The range starts at or past the end of the file
+            total = response.headers.get("Content-Range", "").rpartition("/")[-1]
+            if total.isdigit() and int(total) == offset:
+                return {**read_meta(path), "content_length": offset}
+            os.remove(path)
+            write_meta(path, {})
+            return None
+        if response.status_code not in (200, 206):
+            raise ValueError(f"Failed to download {url}")
+        meta = response_validators(response.headers)
+        if response.status_code == 206:
+            logger.info("Resuming download of %s from byte %d", url, offset)
+            total = response.headers.get("Content-Range", "").rpartition("/")[-1]
+            meta["content_length"] = int(total) if total.isdigit() else None
+            mode = "ab"
+        else:
+            mode = "wb"
+        if "Content-Encoding" in response.headers:
+            # Content-Length is the size of the encoded payload
+            meta["content_length"] = None
+        write_meta(path, meta)
+        with open(path, mode) as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+    expected = meta["content_length"]
+    if expected is not None and os.path.getsize(path) != expected:
+        return None
+    meta["content_length"] = os.path.getsize(path)
+    return meta
+
+
+def _is_intact(path, meta):
+    """Checks the size of the cached file against its sidecar, and the zip directory."""
+    expected = meta.get("content_length")
+    if expected is not None and os.path.getsize(path) != expected:
+        return False
+    if path.lower().endswith(".zip") and not zipfile.is_zipfile(path):
+        return False
+    return True
+
+
+def _is_fresh(url, path, meta):
+    """Asks the server with a HEAD request whether the cached file is up to date.
+
+    The cached file is assumed fresh when the server cannot be reached.
+    """
+    try:
+        response = http.head(url)
+    except requests.RequestException as e:
+        logger.warning("Could not revalidate %s, using cached file: %s", url, e)
+        return True
     if response.status_code != 200:
-        raise ValueError(f"Failed to download {url}")
-    logger.info("Writing response to cache: %s", path)
+        logger.warning(
+            "Could not revalidate %s (status %s), using cached file",
+            url,
+            response.status_code,
+        )
+        return True
+    remote = response_validators(response.headers)
+    fresh = _same_validators(meta, remote, local_size=os.path.getsize(path))
+    if fresh and meta.get("etag") is None:
+        # Cached before sidecars were written, record the validators
+        write_meta(path, {"url": url, **remote})
+    return fresh
 
-    with open(path, "wb") as f:
-        f.write(response.content)
 
-    return path
+def _same_validators(local, remote, local_size=None):
+    if local.get("etag") and remote.get("etag"):
+        return local["etag"] == remote["etag"]
+    if local.get("last_modified") and remote.get("last_modified"):
+        return local["last_modified"] == remote["last_modified"]
+    if remote.get("content_length") is not None:
+        return remote["content_length"] == local_size
+    return True
+
+
+def response_validators(headers):
+    """Returns the cache validators of a response."""
+    length = headers.get("Content-Length", "")
+    return {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "content_length": int(length) if length.isdigit() else None,
+    }
+
+
+def conditional_headers(meta):
+    """Returns the headers of a conditional request for the cached validators."""
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+
+def read_meta(path):
+    """Reads the metadata sidecar of a cached file, empty if there is none."""
+    try:
+        with open(f"{path}.meta.json") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_meta(path, meta):
+    """Atomically writes the metadata sidecar of a cached file."""
+    meta_path = f"{path}.meta.json"
+    with open(f"{meta_path}.tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(f"{meta_path}.tmp", meta_path)
 
 
 def cache_to_parquet(file_path):
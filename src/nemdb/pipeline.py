@@ -0,0 +1,193 @@
+"""Staged pipeline with bounded queues between stages.
+
+Each stage runs on its own pool of threads, so that the download of the next month
+overlaps the parsing of the current one and the write of the previous one. Queues
+between stages are bounded to keep a limited number of items in memory.
+"""
+
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+from typing import Callable, NamedTuple
+
+from tqdm import tqdm
+
+from .logger import log
+
+_DONE = object()
+
+
+class Stage(NamedTuple):
+    """A step of the pipeline.
+
+    `func` is called with the item produced by the previous stage and returns the item
+    passed to the next one, or None to drop the item. `discard`, if given, is called
+    with the items the stage drops unprocessed after a failure, to free what they hold.
+    """
+
+    name: str
+    func: Callable
+    workers: int = 1
+    discard: Callable = None
+
+
+def run_pipeline(items, stages: list[Stage], queue_size: int = 2, desc=None):
+    """Runs the items through the stages.
+
+    Stops feeding new items after the first exception raised by a stage, and
+    re-raises it once the running items are done.
+    """
+    items = list(items)
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    remaining = [stage.workers for stage in stages]
+    lock = threading.Lock()
+    errors = []
+    progress = tqdm(total=len(items), desc=desc)
+
+    def work(i, stage):
+        inbox = queues[i]
+        outbox = queues[i + 1] if i + 1 < len(stages) else None
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+            if errors:
+                # Drain the queue without processing after a failure
+                if stage.discard is not None:
+                    try:
+                        stage.discard(item)
+                    except Exception as e:
+                        log.error(
+                            "Stage %s failed to discard an item: %s", stage.name, e
+                        )
+                continue
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                log.error("Stage %s failed: %s", stage.name, e)
+                with lock:
+                    errors.append(e)
+                continue
+            if result is None or outbox is None:
+                with lock:
+                    progress.update()
+                continue
+            outbox.put(result)
+        with lock:
+            remaining[i] -= 1
+            last = remaining[i] == 0
+        if last and outbox is not None:
+            for _ in range(stages[i + 1].workers):
+                outbox.put(_DONE)
+
+    threads = [
+        threading.Thread(target=work, args=(i, stage), name=f"{stage.name}-{j}")
+        for i, stage in enumerate(stages)
+        for j in range(stage.workers)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for item in items:
+            if errors:
+                break
+            queues[0].put(item)
+    finally:
+        for _ in range(stages[0].workers):
+            queues[0].put(_DONE)
+        for thread in threads:
+            thread.join()
+        progress.close()
+    if errors:
+        raise errors[0]
+
+
+class Period(NamedTuple):
+    """A month of a data source going through populate, a year if month is None."""
+
+    source: object
+    year: int
+    month: int | None
+    day: int | None = None
+    payload: object = None
+
+    @property
+    def key(self) -> tuple:
+        """Arguments identifying the period in the source stage methods."""
+        if self.day is None:
+            return self.year, self.month
+        return self.year, self.month, self.day
+
+
+def _download(period: Period):
+    payload = period.source.download_period(*period.key)
+    return None if payload is None else period._replace(payload=payload)
+
+
+def _parse(period: Period, executor=None):
+    payload = period.source.parse_period(period.payload, *period.key, executor=executor)
+    return period._replace(payload=payload)
+
+
+def _write(period: Period):
+    period.source.write_period(period.payload, *period.key)
+
+
+def _release(period: Period):
+    release = getattr(period.source, "release_period", None)
+    if release is not None:
+        release(period.payload, *period.key)
+
+
+def populate_periods(
+    periods, jobs=1, parse_jobs=1, write_jobs=1, parse_processes=False, desc=None
+):
+    """Downloads, parses and writes the periods with overlapping stages.
+
+    Sources implement `download_period`, `parse_period` and `write_period`. The next
+    month downloads while the current one is parsed and the previous one is written.
+    Sources holding resources for a downloaded or parsed period, such as a pinned
+    archive, also implement `release_period`, called for the periods dropped when
+    the pipeline stops after a failure.
+
+    Parameters
+    ----------
+    periods : list[Period]
+        The periods to add to their data sources.
+    jobs : int
+        Number of concurrent downloads.
+    parse_jobs : int
+        Number of archives parsed concurrently.
+    write_jobs : int
+        Number of partitions written concurrently.
+    parse_processes : bool
+        Parse in a pool of `parse_jobs` worker processes instead of threads. Workers
+        are spawned rather than forked, as forking a process running polars threads
+        can deadlock.
+    """
+    with ExitStack() as stack:
+        executor = None
+        if parse_processes:
+            executor = stack.enter_context(
+                ProcessPoolExecutor(
+                    max_workers=parse_jobs,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            )
+        run_pipeline(
+            periods,
+            [
+                Stage("download", _download, jobs),
+                Stage(
+                    "parse",
+                    partial(_parse, executor=executor),
+                    parse_jobs,
+                    discard=_release,
+                ),
+                Stage("write", _write, write_jobs, discard=_release),
+            ],
+            desc=desc,
+        )
@@ -0,0 +1,23 @@
+from .compaction import compact_partition
+from .journal import Journal
+from .manifest import PartitionManifest
+from .partitioning import PartitionSpec
+from .profiles import WriteProfile, benchmark_profile, get_profile
+from .pruning import pruning_report
+from .upsert import MergeReport, merge_partition
+from .writer import StreamingPartitionWriter, write_partitions
+
+__all__ = [
+    "benchmark_profile",
+    "compact_partition",
+    "get_profile",
+    "Journal",
+    "merge_partition",
+    "MergeReport",
+    "PartitionManifest",
+    "PartitionSpec",
+    "pruning_report",
+    "StreamingPartitionWriter",
+    "write_partitions",
+    "WriteProfile",
+]
@@ -0,0 +1,142 @@
+"""Statistics of the partitions of a dataset, kept in its manifest.
+
+Every partition committed to the manifest records, next to its files and rows, the
+bytes of its files, the range of the time key of the table and the number of
+distinct values of its identifier columns, such as DUID or REGIONID. Together they
+form the catalog of the dataset: which periods exist, how large they are and what
+they hold, answered without opening a parquet file, and used to choose the
+partitions a query scans.
+
+The range of the time key is read from the statistics of the row groups in the
+footers, the distinct values from the identifier columns only, which are dictionary
+encoded codes, or from the hive paths for value partitions.
+"""
+
+from datetime import date, datetime
+
+import polars as pl
+import pyarrow.parquet as pq
+
+from .partitioning import hive_values
+
+
+def partition_stats(
+    fs, paths: list[str], time_column: str = None, distinct_columns: list[str] = ()
+) -> dict:
+    """Returns the catalog entry of the files of a partition.
+
+    Parameters
+    ----------
+    fs : fsspec.AbstractFileSystem
+        Filesystem of the dataset.
+    paths : list[str]
+        The files of the partition.
+    time_column : str, optional
+        The time key whose range is recorded.
+    distinct_columns : list[str]
+        Columns whose distinct values are counted.
+
+    Returns
+    -------
+    dict
+        The `bytes` of the files, the `min` and `max` of the time key, as ISO
+        strings, and the `distinct` values of each column found in the files.
+    """
+    size = 0
+    low = high = None
+    distinct = {}
+    for path in paths:
+        partitions = hive_values(path)
+        with fs.open(path, "rb") as f:
+            size += f.size
+            parquet = pq.ParquetFile(f)
+            names = parquet.metadata.schema.names
+            if time_column in names:
+                index = names.index(time_column)
+                for i in range(parquet.metadata.num_row_groups):
+                    statistics = parquet.metadata.row_group(i).column(index).statistics
+                    if statistics is None or not statistics.has_min_max:
+                        continue
+                    low = _min(low, statistics.min)
+                    high = _max(high, statistics.max)
+            for col in distinct_columns:
+                if col in partitions:
+                    distinct.setdefault(col, set()).add(partitions[col])
+                elif col in names:
+                    values = parquet.read(columns=[col]).column(0).unique()
+                    distinct.setdefault(col, set()).update(values.to_pylist())
+    return {
+        "bytes": size,
+        "min": _isoformat(low),
+        "max": _isoformat(high),
+        "distinct": {col: len(values - {None}) for col, values in distinct.items()},
+    }
+
+
+def overlaps(partition: dict, low=None, high=None) -> bool:
+    """Whether the time key of a partition may have values in [low, high].
+
+    Partitions without statistics may hold any value.
+    """
+    if partition.get("min") is None or partition.get("max") is None:
+        return True
+    return (high is None or _parse(partition["min"]) <= _as_datetime(high)) and (
+        low is None or _as_datetime(low) <= _parse(partition["max"])
+    )
+
+
+def catalog_frame(table: str, partitions: list[dict], time_column: str = None):
+    """Returns the catalog of the partitions of a table, one row per partition."""
+    schema = {
+        "table": pl.String,
+        "year": pl.Int32,
+        "month": pl.Int8,
+        "day": pl.Int8,
+        "files": pl.Int32,
+        "rows": pl.Int64,
+        "bytes": pl.Int64,
+        "time_column": pl.String,
+        "min": pl.Datetime,
+        "max": pl.Datetime,
+    }
+    columns = sorted({col for p in partitions for col in p.get("distinct", {})})
+    schema.update({f"distinct_{col}": pl.Int64 for col in columns})
+    rows = [
+        {
+            "table": table,
+            "year": p["year"],
+            "month": p["month"],
+            "day": p["day"],
+            "files": len(p["files"]),
+            "rows": p["rows"],
+            "bytes": p.get("bytes"),
+            "time_column": time_column,
+            "min": _parse(p.get("min")),
+            "max": _parse(p.get("max")),
+            **{f"distinct_{col}": p.get("distinct", {}).get(col) for col in columns},
+        }
+        for p in partitions
+    ]
+    return pl.DataFrame(rows, schema=schema).sort("year", "month", "day")
+
+
+def _min(current, value):
+    return value if current is None or value < current else current
+
+
+def _max(current, value):
+    return value if current is None or value > current else current
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def _as_datetime(value):
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    return value
+
+
+def _parse(value: str):
+    return None if value is None else datetime.fromisoformat(value)
@@ -0,0 +1,164 @@
+"""Compaction of the small files of a parquet dataset.
+
+Chunked and repeated writes leave many small files in the leaf directories of a
+dataset, and scans then spend their time listing directories and reading footers.
+Compaction merges the small files of each leaf directory, sorts their rows by the
+primary keys across all of them, and writes them back as files of about
+`target_bytes`.
+
+The merged files are written under new names and published by a single commit of
+the manifest, which replaces the small files they merge and keeps the files
+committed to the partition in the meantime. Scans of older snapshots keep reading
+the small files until they expire. The partition is recorded as being rewritten in
+the journal until the commit, so the files of a compaction interrupted half way are
+cleaned up, and the partition, still committed with its small files, is not written
+again.
+"""
+
+import posixpath
+from collections import defaultdict
+
+import polars as pl
+import pyarrow.parquet as pq
+
+from nemdb.logger import log
+
+from . import journal as _journal
+from .manifest import file_id, partition_key
+from .writer import file_options
+
+
+def small_files(fs, paths: list[str], target_bytes: int) -> dict[str, list[str]]:
+    """Returns the directories holding several files smaller than half the target."""
+    directories = defaultdict(list)
+    for path in paths:
+        if fs.size(path) < target_bytes // 2:
+            directories[posixpath.dirname(path)].append(path)
+    return {
+        directory: sorted(files)
+        for directory, files in directories.items()
+        if len(files) > 1
+    }
+
+
+def merge_files(
+    fs,
+    paths: list[str],
+    directory: str,
+    basename: str,
+    sort_cols: list[str],
+    target_bytes: int,
+    row_group_size: int = None,
+    data_page_size: int = None,
+    profile=None,
+) -> list[tuple[str, int]]:
+    """Merges the files into sorted files of about `target_bytes` in the directory.
+
+    Returns the (path, rows) of the new files, named `{basename}-{id}-{i}.parquet`.
+    """
+    frames = []
+    for path in paths:
+        with fs.open(path, "rb") as f:
+            frames.append(pl.read_parquet(f))
+    data = pl.concat(frames, how="diagonal_relaxed")
+    sort_cols = [col for col in sort_cols if col in data.columns]
+    if sort_cols:
+        data = data.sort(sort_cols)
+    size = sum(fs.size(path) for path in paths)
+    rows_per_file = max(1, data.height * target_bytes // max(size, 1))
+    merged = []
+    prefix = f"{directory}/{basename}-{file_id()}"
+    for i, offset in enumerate(range(0, data.height, rows_per_file)):
+        part = data.slice(offset, rows_per_file)
+        path = f"{prefix}-{i}.parquet"
+        with fs.open(path, "wb") as f:
+            pq.write_table(
+                part.to_arrow(),
+                f,
+                row_group_size=row_group_size,
+                data_page_size=data_page_size,
+                **file_options(part.columns, sort_cols),
+                **(profile.options(part) if profile is not None else {}),
+            )
+        merged.append((path, part.height))
+    return merged
+
+
+def compact_partition(
+    fs,
+    manifest,
+    journal,
+    period: tuple,
+    basename: str,
+    sort_cols: list[str],
+    target_bytes: int,
+    row_group_size: int = None,
+    data_page_size: int = None,
+    profile=None,
+) -> bool:
+    """Merges the small files of a partition, returns whether it was compacted.
+
+    Parameters
+    ----------
+    fs : fsspec.AbstractFileSystem
+        Filesystem of the dataset.
+    manifest : PartitionManifest
+        Manifest of the dataset, updated with the new files.
+    journal : Journal
+        Journal of the dataset.
+    period : tuple
+        The (year, month) or (year, month, day) of the partition.
+    basename : str
+        Prefix of the names of the merged files.
+    sort_cols : list[str]
+        Columns the rows of the merged files are sorted by.
+    target_bytes : int
+        Approximate size of the merged files.
+    row_group_size : int, optional
+        Number of rows of the row groups of the merged files.
+    data_page_size : int, optional
+        Approximate size of the data pages of the merged files.
+    profile : WriteProfile, optional
+        Compression and encodings of the merged files, the pyarrow defaults if None.
+    """
+    files = [f"{manifest.path}/{file}" for file in manifest.get(*period)["files"]]
+    directories = small_files(fs, files, target_bytes)
+    if not directories:
+        return False
+    year, month, day = (*period, None)[:3]
+    merged = {path for paths in directories.values() for path in paths}
+    journal.record(year, month, _journal.REWRITE, day=day)
+    written = []
+    for directory, paths in directories.items():
+        written += merge_files(
+            fs,
+            paths,
+            directory,
+            f"{basename}-compact",
+            sort_cols,
+            target_bytes,
+            row_group_size=row_group_size,
+            data_page_size=data_page_size,
+            profile=profile,
+        )
+    replaced = []
+    for path in sorted(merged):
+        with fs.open(path, "rb") as f:
+            replaced.append((path, pq.ParquetFile(f).metadata.num_rows))
+    committed = manifest.replace(year, month, replaced, written, day=day)
+    journal.record(year, month, _journal.COMMIT, day=day)
+    if not committed:
+        log.info(
+            "%s %s was rewritten during its compaction, the merged files are dropped",
+            manifest.path,
+            partition_key(*period),
+        )
+        return False
+    log.info(
+        "Compacted %s files of %s %s into %s",
+        len(merged),
+        manifest.path,
+        partition_key(*period),
+        len(written),
+    )
+    return True
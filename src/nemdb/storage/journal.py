@@ -0,0 +1,190 @@
+"""Write-ahead journal of the partitions going through populate.
+
+Every table directory holds a `_journal.jsonl` to which a line is appended each time
+a partition reaches a stage of populate. A partition whose last record is not
+`COMMIT` was interrupted: if it had started writing, its files may be incomplete and
+are removed before the partition is written again. `REWRITE` records a committed
+partition being written again by a migration or a compaction, whose partial files
+are removed the same way without the partition being written again.
+
+Every entry records the host and process that wrote it. A partition is only
+recovered once that process is gone, or after `LEASE` seconds for the processes of
+other hosts, never while another process is still writing it.
+
+Object stores cannot append to a file, the journal of a remote dataset is written
+again with every entry instead, it stays small as it is compacted by every recovery.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+
+from nemdb.logger import log
+
+from .locks import file_lock
+from .manifest import file_id, partition_key
+from .remote import is_local
+
+JOURNAL = "_journal.jsonl"
+
+DOWNLOAD = "download"
+PARSE = "parse"
+WRITE = "write"
+REWRITE = "rewrite"
+COMMIT = "commit"
+# Seconds after which a partition written from another host is assumed abandoned
+LEASE = 24 * 3600
+
+
+class Journal:
+    """Append-only log of the (table, partition, stage) reached by populate.
+
+    Parameters
+    ----------
+    fs : fsspec.AbstractFileSystem
+        Filesystem of the dataset.
+    path : str
+        Root directory of the dataset.
+    table : str
+        Name of the table, recorded with every entry.
+    """
+
+    def __init__(self, fs, path: str, table: str):
+        self.fs = fs
+        self.path = path.rstrip("/")
+        self.table = table
+        self._lock = threading.Lock()
+
+    @property
+    def journal_path(self):
+        return f"{self.path}/{JOURNAL}"
+
+    def record(self, year: int, month: int | None, stage: str, day: int | None = None):
+        """Appends the stage reached by a partition."""
+        entry = {
+            "table": self.table,
+            "year": year,
+            "month": month,
+            "day": day,
+            "stage": stage,
+            "time": time.time(),
+            "owner": _owner(),
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            self.fs.makedirs(self.path, exist_ok=True)
+            with self._file_lock():
+                self._append(line)
+
+    def _file_lock(self):
+        return file_lock(self.fs, f"{self.journal_path}.lock")
+
+    def _append(self, line: str):
+        if is_local(self.fs):
+            with self.fs.open(self.journal_path, "a") as f:
+                f.write(line)
+            return
+        try:
+            with self.fs.open(self.journal_path, "r") as f:
+                lines = f.read()
+        except FileNotFoundError:
+            lines = ""
+        tmp_path = f"{self.journal_path}.{file_id()}.tmp"
+        with self.fs.open(tmp_path, "w") as f:
+            f.write(lines + line)
+        self.fs.mv(tmp_path, self.journal_path)
+
+    def entries(self) -> list[dict]:
+        """Reads the journal, ignoring a last line truncated by a crash."""
+        try:
+            with self.fs.open(self.journal_path, "r") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return []
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                log.warning("Ignoring truncated journal entry in %s", self.journal_path)
+        return entries
+
+    def incomplete(self) -> dict:
+        """Returns the last entry of every partition that was not committed."""
+        last = {}
+        for entry in self.entries():
+            last[partition_key(*_period(entry))] = entry
+        return {key: entry for key, entry in last.items() if entry["stage"] != COMMIT}
+
+    def compact(self):
+        """Rewrites the journal with the last entry of the uncommitted partitions."""
+        with self._lock:
+            if not self.fs.exists(self.journal_path):
+                return
+            with self._file_lock():
+                entries = list(self.incomplete().values())
+                tmp_path = f"{self.journal_path}.{file_id()}.tmp"
+                with self.fs.open(tmp_path, "w") as f:
+                    f.writelines(json.dumps(entry) + "\n" for entry in entries)
+                self.fs.mv(tmp_path, self.journal_path)
+
+    def recover(self, manifest) -> list[tuple]:
+        """Removes the files of the partitions interrupted while they were written.
+
+        Only the files listed by no snapshot of the manifest are removed, so readers
+        keep the last committed version of a partition whose rewrite was interrupted,
+        and the journal is compacted. The partitions still being written by another
+        process are left to it. Returns the (year, month) or (year, month, day) of the
+        interrupted partitions, to be written again, which excludes the interrupted
+        rewrites of committed partitions.
+        """
+        interrupted = []
+        referenced = None
+        for entry in self.incomplete().values():
+            if not _abandoned(entry):
+                continue
+            period = _period(entry)
+            if entry["stage"] != REWRITE:
+                interrupted.append(period)
+            if entry["stage"] not in (WRITE, REWRITE):
+                continue
+            log.warning(
+                "Write of %s %s was interrupted, removing its partial files",
+                self.table,
+                partition_key(*period),
+            )
+            if referenced is None:
+                referenced = manifest.referenced()
+            for path in manifest.files_on_disk(*period):
+                if manifest._relative(path) not in referenced:
+                    self.fs.rm(path)
+        self.compact()
+        return interrupted
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _abandoned(entry) -> bool:
+    """Whether the process which recorded the entry no longer writes its partition."""
+    owner = entry.get("owner")
+    if owner is None or owner == _owner():
+        return True
+    host, pid = owner.rsplit(":", 1)
+    if host != socket.gethostname() or os.name == "nt":
+        return time.time() - entry["time"] > LEASE
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def _period(entry) -> tuple:
+    period = (entry["year"], entry["month"], entry.get("day"))
+    return period if period[2] is not None else period[:2]
@@ -0,0 +1,55 @@
+"""Locks shared by the processes writing to a dataset.
+
+Writers in other processes, such as concurrent populate runs, publish their changes
+to the same manifest and dictionaries, which are read, changed and written again
+under a lock file next to them.
+"""
+
+import time
+from contextlib import contextmanager
+
+from nemdb.logger import log
+
+# Seconds after which a lock is assumed left by a crashed process
+LOCK_TIMEOUT = 60
+
+
+@contextmanager
+def file_lock(fs, path: str, timeout: float = LOCK_TIMEOUT, poll: float = 0.05):
+    """Holds a lock shared by the processes using the filesystem.
+
+    The lock is a file created exclusively, removed on release. A lock older than
+    `timeout` seconds is left by a process which died holding it and is broken.
+    """
+    unwritten = None
+    while True:
+        try:
+            with fs.open(path, "xb") as f:
+                f.write(str(time.time()).encode())
+            break
+        except FileExistsError:
+            try:
+                with fs.open(path, "rb") as f:
+                    created = float(f.read())
+                unwritten = None
+            except FileNotFoundError:
+                continue
+            except ValueError:
+                # Created and not written yet, aged from when it was first seen
+                unwritten = unwritten or time.time()
+                created = unwritten
+            if time.time() - created > timeout:
+                log.warning("Breaking the lock %s, held for over %ss", path, timeout)
+                try:
+                    fs.rm(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            time.sleep(poll)
+    try:
+        yield
+    finally:
+        try:
+            fs.rm(path)
+        except FileNotFoundError:
+            log.warning("The lock %s was broken while it was held", path)
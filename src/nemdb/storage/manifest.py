@@ -0,0 +1,443 @@
+"""Versioned manifest of the partitions written to a parquet dataset.
+
+Each table directory holds a `_manifest.json` listing the completed (year, month) or
+(year, month, day) partitions, their row counts and their files, so that populate can decide which months
+to skip without listing and opening the dataset.
+
+The manifest is the table format of the dataset: scans read the files it lists, not
+the files in the directory. Every change is a commit which writes the new snapshot to
+`_snapshots/{version}.json` then swaps `_manifest.json` in a single rename, so a
+reader sees all the files of a commit or none of them. Commits read, change and
+write the manifest under the lock file `_manifest.json.lock`, so the commits of
+concurrent processes are applied one after the other. Writers give their files
+unique names, see `file_id`, and never overwrite or remove the files of a snapshot:
+files that are no longer listed are removed once the snapshots listing them expire,
+so a scan started on an older snapshot can still read it.
+
+With a `stats` function, every partition also records the statistics of its files,
+see `catalog`.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+import pyarrow.parquet as pq
+
+from nemdb.logger import log
+
+from .locks import file_lock
+
+MANIFEST = "_manifest.json"
+SNAPSHOTS = "_snapshots"
+PERIOD = ("year", "month", "day")
+_HIVE_KEY = re.compile(r"(?:^|/)(year|month|day)=(\d+)(?=/)")
+
+
+def partition_key(year: int, month: int | None = None, day: int | None = None) -> str:
+    if month is None:
+        return f"{year}"
+    if day is None:
+        return f"{year}-{month:02d}"
+    return f"{year}-{month:02d}-{day:02d}"
+
+
+def file_id() -> str:
+    """Returns a unique id for the names of the files of a write."""
+    return uuid.uuid4().hex[:12]
+
+
+def partition_of(relative: str, levels: tuple = PERIOD):
+    """Returns the (year, month, day) of a file from its hive path.
+
+    Month and day are None when the dataset is not partitioned by them, or when they
+    are not in `levels`, such as the day buckets of a monthly dataset. Returns None if
+    the path has no year.
+    """
+    keys = {
+        key: int(value)
+        for key, value in _HIVE_KEY.findall(f"/{relative}")
+        if key in levels
+    }
+    if "year" not in keys:
+        return None
+    return keys["year"], keys.get("month"), keys.get("day")
+
+
+class PartitionManifest:
+    """Completed partitions of a table, with their row counts and files.
+
+    Parameters
+    ----------
+    fs : fsspec.AbstractFileSystem
+        Filesystem of the dataset.
+    path : str
+        Root directory of the dataset.
+    levels : tuple
+        The partitions of the periods, the other partitions are within a period.
+    stats : Callable[[list[str]], dict], optional
+        Returns the statistics of the files of a partition, recorded with it.
+    """
+
+    def __init__(self, fs, path: str, levels: tuple = PERIOD, stats=None):
+        self.fs = fs
+        self.path = path.rstrip("/")
+        self.levels = tuple(levels)
+        self.stats = stats
+        self._lock = threading.RLock()
+        self._partitions = None
+        self._version = 0
+
+    @property
+    def manifest_path(self):
+        return f"{self.path}/{MANIFEST}"
+
+    def _commit_lock(self):
+        """The lock of the manifest, held by the process committing to it."""
+        self.fs.makedirs(self.path, exist_ok=True)
+        return file_lock(self.fs, f"{self.manifest_path}.lock")
+
+    def exists(self) -> bool:
+        """Whether the dataset has a manifest, checked without rebuilding it."""
+        return self._partitions is not None or self.fs.exists(self.manifest_path)
+
+    def snapshot_path(self, version: int) -> str:
+        return f"{self.path}/{SNAPSHOTS}/{version:010d}.json"
+
+    @property
+    def partitions(self) -> dict:
+        """Partitions by key, loaded on first use and rebuilt if the file is missing."""
+        with self._lock:
+            self._ensure_loaded()
+            return self._partitions
+
+    @property
+    def version(self) -> int:
+        """Version of the current snapshot, incremented by every commit."""
+        with self._lock:
+            self._ensure_loaded()
+            return self._version
+
+    def _ensure_loaded(self):
+        if self._partitions is None and not self._load():
+            with self._commit_lock():
+                # Another process may have written it while waiting for the lock
+                if not self._load():
+                    self._rebuild()
+
+    def _load(self) -> bool:
+        """Reads the current snapshot, returns False if the dataset has none."""
+        try:
+            with self.fs.open(self.manifest_path, "r") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return False
+        self._partitions = stored["partitions"]
+        self._version = stored.get("version", 0)
+        return True
+
+    def refresh(self):
+        """Reads the current snapshot again, to see the commits of other processes."""
+        with self._lock:
+            if not self._load():
+                self._ensure_loaded()
+
+    def __contains__(self, period):
+        return partition_key(*period) in self.partitions
+
+    def get(self, year: int, month: int | None = None, day: int | None = None):
+        return self.partitions.get(partition_key(year, month, day))
+
+    def snapshot(self, version: int = None) -> dict:
+        """Partitions of a snapshot, the current one by default."""
+        with self._lock:
+            if version is None or version == self.version:
+                return dict(self.partitions)
+        try:
+            with self.fs.open(self.snapshot_path(version), "r") as f:
+                return json.load(f)["partitions"]
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"Snapshot {version} of {self.path} does not exist or has expired"
+            ) from None
+
+    def files(self, version: int = None, periods: list[tuple] = None) -> list[str]:
+        """Paths of the files of a snapshot, the current one by default.
+
+        Only the files of the (year, month) or (year, month, day) `periods` are
+        returned if given.
+        """
+        keys = None if periods is None else {partition_key(*p) for p in periods}
+        return [
+            f"{self.path}/{file}"
+            for key, partition in self.snapshot(version).items()
+            if keys is None or key in keys
+            for file in partition["files"]
+        ]
+
+    def versions(self) -> list[int]:
+        """Versions of the snapshots that have not expired."""
+        return sorted(
+            int(path.rsplit("/", 1)[-1].split(".")[0])
+            for path in self.fs.glob(f"{self.path}/{SNAPSHOTS}/*.json")
+        )
+
+    def commit(self, change):
+        """Applies `change` to the partitions of the latest snapshot and publishes it.
+
+        The current snapshot is read again under the lock of the manifest, so the
+        partitions committed by other processes are kept. The first commit of a
+        dataset without a manifest does not list the files on disk, which were not
+        committed.
+        """
+        with self._lock, self._commit_lock():
+            if not self._load() and self._partitions is None:
+                self._partitions = {}
+            change(self._partitions)
+            self._version += 1
+            self.save()
+
+    def add(
+        self,
+        year: int,
+        month: int | None,
+        files: list[tuple[str, int]],
+        day: int | None = None,
+    ):
+        """Records a completed partition from the (path, rows) of its files."""
+        self.add_all({(year, month, day): files})
+
+    def add_all(self, written: dict[tuple, list[tuple[str, int]]]):
+        """Records completed partitions, by (year, month, day), in a single commit."""
+        added = {
+            partition_key(year, month, day): {
+                "year": year,
+                "month": month,
+                "day": day,
+                "rows": sum(rows for _, rows in files),
+                "files": sorted(self._relative(path) for path, _ in files),
+                **(self.stats([path for path, _ in files]) if self.stats else {}),
+            }
+            for (year, month, day), files in written.items()
+        }
+        self.commit(lambda partitions: partitions.update(added))
+
+    def replace(
+        self,
+        year: int,
+        month: int | None,
+        removed: list[tuple[str, int]],
+        added: list[tuple[str, int]],
+        day: int | None = None,
+    ) -> bool:
+        """Replaces files of a partition by the (path, rows) of the files they became.
+
+        The other files of the partition at the time of the commit are kept, such as
+        the files committed by other writers since `removed` were read. Returns False,
+        without changing the partition, if it no longer lists all of `removed`.
+        """
+        key = partition_key(year, month, day)
+        removed = {self._relative(path): rows for path, rows in removed}
+        added = {self._relative(path): rows for path, rows in added}
+        partition = self.get(year, month, day)
+        current = partition["files"] if partition else []
+        expected = sorted([file for file in current if file not in removed] + [*added])
+        stats = (
+            self.stats([f"{self.path}/{file}" for file in expected])
+            if self.stats
+            else {}
+        )
+        replaced = []
+
+        def change(partitions):
+            partition = partitions.get(key)
+            if partition is None or not set(removed) <= set(partition["files"]):
+                return
+            files = sorted(
+                [file for file in partition["files"] if file not in removed] + [*added]
+            )
+            partitions[key] = {
+                "year": year,
+                "month": month,
+                "day": day,
+                "rows": partition["rows"] - sum(removed.values()) + sum(added.values()),
+                "files": files,
+                # The statistics of other files are computed again by catalog
+                **(stats if files == expected else {}),
+            }
+            replaced.append(key)
+
+        self.commit(change)
+        return bool(replaced)
+
+    def remove(self, year: int, month: int | None = None, day: int | None = None):
+        self.commit(
+            lambda partitions: partitions.pop(partition_key(year, month, day), None)
+        )
+
+    def save(self):
+        with self._lock:
+            self.fs.makedirs(f"{self.path}/{SNAPSHOTS}", exist_ok=True)
+            snapshot = {
+                "version": self._version,
+                "time": time.time(),
+                "partitions": self._partitions,
+            }
+            with self.fs.open(self.snapshot_path(self._version), "w") as f:
+                json.dump(snapshot, f)
+            tmp_path = f"{self.manifest_path}.{file_id()}.tmp"
+            with self.fs.open(tmp_path, "w") as f:
+                json.dump(snapshot, f, indent=1)
+            self.fs.mv(tmp_path, self.manifest_path)
+
+    def rebuild(self):
+        """Rebuilds the manifest from the parquet files in the dataset directory."""
+        with self._lock, self._commit_lock():
+            self._load()
+            self._rebuild()
+
+    def _rebuild(self):
+        with self._lock:
+            log.info("Rebuilding partition manifest of %s", self.path)
+            partitions = {}
+            for path in sorted(self.fs.glob(f"{self.path}/**/*.parquet")):
+                relative = self._relative(path)
+                period = partition_of(relative, self.levels)
+                if period is None:
+                    continue
+                year, month, day = period
+                with self.fs.open(path, "rb") as f:
+                    rows = pq.ParquetFile(f).metadata.num_rows
+                partition = partitions.setdefault(
+                    partition_key(year, month, day),
+                    {"year": year, "month": month, "day": day, "rows": 0, "files": []},
+                )
+                partition["rows"] += rows
+                partition["files"].append(relative)
+            if self.stats is not None:
+                for partition in partitions.values():
+                    files = [f"{self.path}/{file}" for file in partition["files"]]
+                    partition.update(self.stats(files))
+            self._partitions = partitions
+            self._version += 1
+            self.save()
+
+    def catalog(self) -> list[dict]:
+        """The partitions of the current snapshot with the statistics of their files.
+
+        The statistics of the partitions committed before they were recorded are
+        computed once and committed.
+        """
+        with self._lock:
+            self.refresh()
+            missing = {
+                key: partition["files"]
+                for key, partition in self.partitions.items()
+                if "bytes" not in partition
+            }
+        if missing and self.stats is not None:
+            computed = {
+                key: self.stats([f"{self.path}/{file}" for file in files])
+                for key, files in missing.items()
+            }
+
+            def change(partitions):
+                for key, stats in computed.items():
+                    if key in partitions and partitions[key]["files"] == missing[key]:
+                        partitions[key].update(stats)
+
+            self.commit(change)
+        return [dict(partition) for partition in self.partitions.values()]
+
+    def referenced(self) -> set[str]:
+        """Files listed by the snapshots that have not expired."""
+        with self._lock:
+            files = {
+                file
+                for partition in self.partitions.values()
+                for file in partition["files"]
+            }
+            for version in self.versions():
+                if version == self._version:
+                    continue
+                try:
+                    partitions = self.snapshot(version)
+                except FileNotFoundError:
+                    continue
+                files.update(
+                    file
+                    for partition in partitions.values()
+                    for file in partition["files"]
+                )
+            return files
+
+    def expire(self, retention: float, keep: set = frozenset()) -> list[str]:
+        """Removes the snapshots older than `retention` seconds and the unlisted files.
+
+        The current snapshot never expires. Files listed by none of the remaining
+        snapshots are removed, except those of the `keep` (year, month, day)
+        partitions, which may be being written. Returns the paths of the removed files.
+        """
+        with self._lock:
+            self.refresh()
+            now = time.time()
+            for version in self.versions():
+                if version == self._version:
+                    continue
+                path = self.snapshot_path(version)
+                try:
+                    with self.fs.open(path, "r") as f:
+                        created = json.load(f)["time"]
+                except (FileNotFoundError, ValueError):
+                    continue
+                if now - created > retention:
+                    self.fs.rm(path)
+            referenced = self.referenced()
+            removed = []
+            for path in self.fs.glob(f"{self.path}/**/*.parquet"):
+                relative = self._relative(path)
+                if (
+                    relative in referenced
+                    or partition_of(relative, self.levels) in keep
+                ):
+                    continue
+                self.fs.rm(path)
+                self._remove_empty_parents(path)
+                removed.append(path)
+        if removed:
+            log.info("Removed %s unlisted files of %s", len(removed), self.path)
+        return removed
+
+    def _remove_empty_parents(self, path: str):
+        directory = path.rsplit("/", 1)[0]
+        root = self.fs._strip_protocol(self.path)
+        while self.fs._strip_protocol(directory) != root:
+            try:
+                if self.fs.ls(directory):
+                    return
+                self.fs.rmdir(directory)
+            except (FileNotFoundError, OSError):
+                return
+            directory = directory.rsplit("/", 1)[0]
+
+    def files_on_disk(
+        self, year: int, month: int | None = None, day: int | None = None
+    ) -> list[str]:
+        """Lists the parquet files of a partition present in the dataset directory.
+
+        Unlike the files recorded in the manifest, these include the files of writes
+        that did not complete.
+        """
+        return [
+            path
+            for path in self.fs.glob(f"{self.path}/**/*.parquet")
+            if partition_of(self._relative(path), self.levels) == (year, month, day)
+        ]
+
+    def _relative(self, path: str) -> str:
+        path = self.fs._strip_protocol(path)
+        root = self.fs._strip_protocol(self.path)
+        return os.path.relpath(path, root).replace(os.sep, "/")
@@ -0,0 +1,252 @@
+"""Hive partitioning of the parquet datasets.
+
+A dataset is always partitioned by the period its archives are published for,
+`year=/month=`, or `year=/month=/day=` for daily reports, which is the unit tracked by
+the manifest and the journal. A `PartitionSpec` adds partitions around the period:
+
+- value partitions, a directory per value of a column ahead of the period, such as
+  `DUID=BW01/year=2024/month=1`, for columns with few values;
+- day buckets, a directory per day of a time column below each month,
+  `year=2024/month=1/day=15`;
+- hash buckets, a fixed number of directories below the period holding the rows of
+  the values of a column that hash to them, `year=2024/month=1/DUID_bucket=3`.
+
+Without any, the rows of a period are clustered by the primary keys and filters are
+pruned by the statistics of the row groups.
+
+The spec a dataset is written with is stored in `{table}/_partitioning.json`, every
+write of the dataset uses it until the dataset is migrated to another spec.
+"""
+
+import json
+import re
+import zlib
+from urllib.parse import unquote
+
+import polars as pl
+
+PARTITIONING = "_partitioning.json"
+_HIVE_KEY = re.compile(r"([^/=]+)=[^/]*(?=/)")
+_HIVE_VALUE = re.compile(r"([^/=]+)=([^/]*)(?=/)")
+
+
+class PartitionSpec:
+    """The hive partitions of a dataset.
+
+    Parameters
+    ----------
+    columns : list[str]
+        Columns partitioned by value, ahead of the period.
+    day : str, optional
+        Time column whose day partitions each month.
+    hash_column : str, optional
+        Column whose values are hashed to `buckets` partitions below the period.
+    buckets : int
+        Number of hash buckets.
+    period : list[str]
+        Partitions of the archives, ("year", "month") or ("year", "month", "day").
+    """
+
+    def __init__(
+        self,
+        columns: list[str] = (),
+        day: str = None,
+        hash_column: str = None,
+        buckets: int = 16,
+        period: list[str] = ("year", "month"),
+    ):
+        self.columns = tuple(columns)
+        self.day = day
+        self.hash_column = hash_column
+        self.buckets = buckets
+        self.period = tuple(period)
+        if day is not None and "day" in self.period:
+            raise ValueError("Daily periods cannot be bucketed by day")
+        if hash_column is not None and buckets < 1:
+            raise ValueError(f"Invalid number of hash buckets {buckets}")
+
+    @classmethod
+    def parse(cls, text: str, period: list[str] = ("year", "month")):
+        """Creates a spec from comma separated terms.
+
+        `DUID` partitions by value, `day:SETTLEMENTDATE` by day of a time column and
+        `hash:DUID:16` in hash buckets, `none` adds no partitions to the period.
+        """
+        kwargs = {"columns": []}
+        for term in text.split(","):
+            term = term.strip()
+            if term in ("", "none"):
+                continue
+            kind, *args = term.split(":")
+            if kind == "day" and len(args) == 1:
+                kwargs["day"] = args[0]
+            elif kind == "hash" and len(args) in (1, 2):
+                kwargs["hash_column"] = args[0]
+                if len(args) == 2:
+                    kwargs["buckets"] = int(args[1])
+            elif not args:
+                kwargs["columns"].append(term)
+            else:
+                raise ValueError(f"Invalid partitioning term {term!r}")
+        return cls(period=period, **kwargs)
+
+    @classmethod
+    def infer(cls, relative: str, period: list[str] = ("year", "month")):
+        """Returns the value partitions of a file path written before specs were stored."""
+        keys = _HIVE_KEY.findall(relative)
+        first = min((keys.index(key) for key in period if key in keys), default=0)
+        return cls(columns=keys[:first], period=period)
+
+    @property
+    def bucket_columns(self) -> list[str]:
+        """The partition columns derived from the columns of the table."""
+        columns = ["day"] if self.day is not None else []
+        if self.hash_column is not None:
+            columns.append(f"{self.hash_column}_bucket")
+        return columns
+
+    @property
+    def partitions(self) -> list[str]:
+        """The hive partition columns, in the order of the directories."""
+        return [*self.columns, *self.period, *self.bucket_columns]
+
+    def add_columns(self, data: pl.DataFrame) -> pl.DataFrame:
+        """Adds the day and hash bucket columns of the rows."""
+        if self.day is not None:
+            data = data.with_columns(
+                pl.col(self.day).dt.day().cast(pl.Int8).alias("day")
+            )
+        if self.hash_column is not None:
+            data = data.with_columns(
+                _hash_bucket(data[self.hash_column], self.buckets).alias(
+                    f"{self.hash_column}_bucket"
+                )
+            )
+        return data
+
+    def matches(self, relative: str) -> bool:
+        """Whether a file path of the dataset has the partitions of the spec."""
+        return _HIVE_KEY.findall(relative) == self.partitions
+
+    def to_dict(self) -> dict:
+        return {
+            "columns": list(self.columns),
+            "day": self.day,
+            "hash_column": self.hash_column,
+            "buckets": self.buckets,
+            "period": list(self.period),
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, PartitionSpec) and self.to_dict() == other.to_dict()
+
+    def __str__(self):
+        terms = list(self.columns)
+        if self.day is not None:
+            terms.append(f"day:{self.day}")
+        if self.hash_column is not None:
+            terms.append(f"hash:{self.hash_column}:{self.buckets}")
+        return ",".join(terms) or "none"
+
+    def __repr__(self):
+        return f"PartitionSpec({str(self)!r}, period={self.period})"
+
+
+def hive_values(relative: str) -> dict[str, str]:
+    """Returns the partition values of a file from its hive path."""
+    return {key: unquote(value) for key, value in _HIVE_VALUE.findall(relative)}
+
+
+def partition_row(relative: str, spec: PartitionSpec) -> pl.DataFrame:
+    """Returns the partition values of a file from its hive path, as a single row.
+
+    The period and bucket partitions are Int64 and the value partitions strings.
+    """
+    values = hive_values(relative)
+    return pl.DataFrame(
+        {col: [values.get(col)] for col in spec.partitions},
+        schema={col: pl.String for col in spec.partitions},
+    ).with_columns(
+        pl.col(col).cast(pl.Int64) for col in spec.partitions if col not in spec.columns
+    )
+
+
+def scan_file(path: str, partition: pl.DataFrame, *args, **kwargs) -> pl.LazyFrame:
+    """Scans a file with the partition columns of its `partition_row`."""
+    return pl.scan_parquet(path, *args, hive_partitioning=False, **kwargs).with_columns(
+        pl.lit(partition[col].item(), dtype).alias(col)
+        for col, dtype in partition.schema.items()
+    )
+
+
+def scan_partitions(
+    files: list[tuple[str, str]],
+    spec: PartitionSpec,
+    *args,
+    scan=scan_file,
+    **kwargs,
+) -> pl.LazyFrame:
+    """Scans the files of a dataset with the partition columns of their hive paths.
+
+    Each file is scanned on its own and its partition values are added as literals,
+    see `partition_row`. Polars infers hive partitions from a list of files wrongly:
+    once a filter leaves a single file, the partition columns keep the length of the
+    whole file. Columns missing from some files are filled with nulls, and columns
+    whose type differs between files get their supertype.
+
+    Parameters
+    ----------
+    files : list[tuple[str, str]]
+        The path each file is read from and its path in the dataset, whose
+        directories hold its partition values.
+    spec : PartitionSpec
+        The partitioning of the dataset.
+    scan : Callable
+        Scans a file with its partition row, `scan_file` by default, such as
+        `ReadThroughCache.scan` for the files of a remote dataset.
+    *args, **kwargs
+        Passed to `pl.scan_parquet`.
+    """
+    return pl.concat(
+        [
+            scan(path, partition_row(relative, spec), *args, **kwargs)
+            for path, relative in files
+        ],
+        how="diagonal_relaxed",
+    )
+
+
+def _hash_bucket(values: pl.Series, buckets: int) -> pl.Series:
+    """Returns the bucket of each value, stable across processes and versions.
+
+    Integers, such as dictionary codes, are bucketed by their value, other values by
+    the CRC32 of their string.
+    """
+    if values.dtype.is_integer():
+        return (values.fill_null(0) % buckets).cast(pl.Int16)
+    values = values.cast(pl.String)
+    mapping = {
+        value: zlib.crc32(value.encode()) % buckets
+        for value in values.unique().drop_nulls().to_list()
+    }
+    return values.replace_strict(mapping, default=0, return_dtype=pl.Int16)
+
+
+def load_spec(fs, path: str, period: list[str] = ("year", "month")):
+    """Returns the spec stored with a dataset, None if it has none."""
+    try:
+        with fs.open(f"{path.rstrip('/')}/{PARTITIONING}", "r") as f:
+            stored = json.load(f)
+    except FileNotFoundError:
+        return None
+    return PartitionSpec(**{"period": period, **stored})
+
+
+def save_spec(fs, path: str, spec: PartitionSpec):
+    """Stores the spec a dataset is written with."""
+    path = path.rstrip("/")
+    fs.makedirs(path, exist_ok=True)
+    tmp_path = f"{path}/{PARTITIONING}.tmp"
+    with fs.open(tmp_path, "w") as f:
+        json.dump(spec.to_dict(), f, indent=1)
+    fs.mv(tmp_path, f"{path}/{PARTITIONING}")
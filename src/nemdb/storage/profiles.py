@@ -0,0 +1,173 @@
+"""Compression and encoding profiles of the parquet files.
+
+A profile trades the size of the files for the speed of writing and decoding them:
+
+- `default`, zstd at its default level with dictionary encoding, the polars defaults;
+- `archive`, the smallest files, for large tables mostly read once: zstd at its highest
+  level, `DELTA_BINARY_PACKED` time columns, whose 5 minute sequences pack to a few
+  bits per value whatever the order of the rows, and `BYTE_STREAM_SPLIT` floats when
+  their values are mostly distinct and a dictionary would not hold them;
+- `hot`, the fastest decode, for small tables read over and over: lz4 with
+  dictionary encoding.
+
+Categorical columns are stored as integer codes and, like the other columns, keep
+the dictionary encoding in every profile. `benchmark_profile` measures a profile on
+real data.
+"""
+
+import glob
+import os
+import shutil
+import time
+from typing import NamedTuple
+
+import polars as pl
+
+from .writer import write_partitions
+
+# Fraction of distinct values above which floats are split rather than dictionary encoded
+_DISTINCT_FLOATS = 0.25
+
+
+class WriteProfile(NamedTuple):
+    """How the columns of the parquet files are compressed and encoded.
+
+    Parameters
+    ----------
+    compression : str
+        Compression codec of the pages.
+    compression_level : int, optional
+        Level of the codec, its default if None.
+    delta_temporal : bool
+        Write the time columns with `DELTA_BINARY_PACKED`.
+    split_floats : bool
+        Write the floats whose values are mostly distinct with `BYTE_STREAM_SPLIT`.
+    """
+
+    compression: str = "zstd"
+    compression_level: int = None
+    delta_temporal: bool = False
+    split_floats: bool = False
+
+    def encodings(self, data: pl.DataFrame) -> dict[str, str]:
+        """Returns the encoding of the columns of the data not dictionary encoded."""
+        encodings = {}
+        for col, dtype in data.schema.items():
+            if self.delta_temporal and dtype.is_temporal():
+                encodings[col] = "DELTA_BINARY_PACKED"
+            elif (
+                self.split_floats
+                and dtype.is_float()
+                and data[col].n_unique() > _DISTINCT_FLOATS * data.height
+            ):
+                encodings[col] = "BYTE_STREAM_SPLIT"
+        return encodings
+
+    def options(self, data: pl.DataFrame) -> dict:
+        """Returns the pyarrow options writing the columns of the data."""
+        encodings = self.encodings(data)
+        options = {
+            "compression": self.compression,
+            "compression_level": self.compression_level,
+        }
+        if encodings:
+            options["use_dictionary"] = [
+                col for col in data.columns if col not in encodings
+            ]
+            options["column_encoding"] = encodings
+        return options
+
+
+PROFILES = {
+    "default": WriteProfile(),
+    "archive": WriteProfile(
+        compression_level=19, delta_temporal=True, split_floats=True
+    ),
+    "hot": WriteProfile(compression="lz4"),
+}
+
+
+def get_profile(name: str) -> WriteProfile:
+    """Returns the profile of a name."""
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown write profile {name!r}, expected one of {list(PROFILES)}"
+        ) from None
+
+
+class ProfileReport(NamedTuple):
+    """The cost of writing and scanning data with a profile."""
+
+    profile: str
+    rows: int
+    files: int
+    bytes: int
+    write_seconds: float
+    scan_seconds: float
+
+
+def benchmark_profile(
+    data: pl.DataFrame,
+    path: str,
+    partition_cols: list[str],
+    profile: str,
+    sort_cols: list[str] = None,
+    repeat: int = 3,
+    **kwargs,
+) -> ProfileReport:
+    """Writes the data with a profile and measures the files and a full scan.
+
+    The data is written to a local directory, removed once measured. The scan time
+    is the best of `repeat` scans reading every column.
+
+    Parameters
+    ----------
+    data : pl.DataFrame
+        The rows, with their partition columns.
+    path : str
+        Local directory the data is written to, it must not exist.
+    partition_cols : list[str]
+        The hive partition columns.
+    profile : str
+        Name of the profile.
+    sort_cols : list[str], optional
+        Columns the rows of each partition are sorted by.
+    repeat : int
+        Number of scans timed.
+    **kwargs
+        Passed to `write_partitions`.
+    """
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists")
+    try:
+        start = time.perf_counter()
+        files = write_partitions(
+            data,
+            path,
+            partition_cols,
+            "benchmark-{i}.parquet",
+            sort_cols=sort_cols,
+            profile=get_profile(profile),
+            **kwargs,
+        )
+        write_seconds = time.perf_counter() - start
+        scan_seconds = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            pl.scan_parquet(
+                glob.glob(f"{path}/**/*.parquet", recursive=True),
+                hive_partitioning=True,
+            ).collect()
+            scan_seconds = min(scan_seconds, time.perf_counter() - start)
+        return ProfileReport(
+            profile,
+            sum(rows for _, rows in files),
+            len(files),
+            sum(os.path.getsize(file) for file, _ in files),
+            write_seconds,
+            scan_seconds,
+        )
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
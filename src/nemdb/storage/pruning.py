@@ -0,0 +1,105 @@
+"""Reports of how well the statistics of a parquet dataset prune reads.
+
+Readers skip the row groups whose min/max statistics exclude the value of a filter,
+and with a page index the pages within the row groups read. Statistics only prune
+when the values of the filtered column are clustered, which the sorting columns of
+the row groups record. The report probes a column with values taken from the
+statistics themselves and measures the row groups and rows an equality filter reads.
+"""
+
+from typing import NamedTuple
+
+import pyarrow.parquet as pq
+
+
+class PruningReport(NamedTuple):
+    """How an equality filter on a column is pruned by the statistics of the files."""
+
+    column: str
+    files: int
+    row_groups: int
+    probes: int
+    row_groups_read: float
+    rows_read: float
+    sort_position: int
+    page_index: float
+
+
+def row_group_stats(fs, paths: list[str], column: str) -> list[tuple]:
+    """Returns the (min, max, rows) of the column in every row group of the files.
+
+    Row groups without statistics get a None min and max. The sorting position of the
+    column, None if the rows are not sorted by it, and whether the column has a page
+    index are returned with each row group.
+    """
+    stats = []
+    for path in paths:
+        with fs.open(path, "rb") as f:
+            metadata = pq.ParquetFile(f).metadata
+        names = metadata.schema.names
+        if column not in names:
+            continue
+        index = names.index(column)
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            chunk = row_group.column(index)
+            statistics = chunk.statistics
+            has_min_max = statistics is not None and statistics.has_min_max
+            positions = [s.column_index for s in row_group.sorting_columns]
+            stats.append(
+                (
+                    statistics.min if has_min_max else None,
+                    statistics.max if has_min_max else None,
+                    row_group.num_rows,
+                    positions.index(index) if index in positions else None,
+                    chunk.has_column_index and chunk.has_offset_index,
+                )
+            )
+    return stats
+
+
+def pruning_report(fs, paths: list[str], column: str, probes: int = 20):
+    """Measures the row groups read by equality filters on a column.
+
+    Parameters
+    ----------
+    fs : fsspec.AbstractFileSystem
+        Filesystem of the dataset.
+    paths : list[str]
+        The parquet files of the dataset.
+    column : str
+        The filtered column.
+    probes : int
+        Number of values probed, spread over the range of the column.
+
+    Returns
+    -------
+    PruningReport
+        The mean number of row groups and fraction of rows read per probe, the
+        position of the column in the sorting columns of the row groups and the
+        fraction of row groups with a page index for the column.
+    """
+    stats = row_group_stats(fs, paths, column)
+    files = len(paths)
+    if not stats:
+        return PruningReport(column, files, 0, 0, 0.0, 0.0, None, 0.0)
+    values = sorted({low for low, *_ in stats if low is not None})
+    values = values[:: max(1, len(values) // probes)][:probes]
+    total_rows = sum(rows for _, _, rows, *_ in stats)
+    row_groups_read, rows_read = 0, 0
+    for value in values:
+        for low, high, rows, *_ in stats:
+            if low is None or low <= value <= high:
+                row_groups_read += 1
+                rows_read += rows
+    positions = {position for *_, position, _ in stats}
+    return PruningReport(
+        column,
+        files,
+        len(stats),
+        len(values),
+        row_groups_read / max(len(values), 1),
+        rows_read / max(len(values) * total_rows, 1),
+        positions.pop() if len(positions) == 1 else None,
+        sum(indexed for *_, indexed in stats) / len(stats),
+    )
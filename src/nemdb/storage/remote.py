@@ -0,0 +1,160 @@
+"""Datasets stored on remote filesystems, such as object stores.
+
+Every access to a dataset goes through its fsspec filesystem, built with the
+options of `Config.FILESYSTEM_OPTIONS`: writes, manifests and journals open their
+files on it. Scans of a remote dataset read local copies of its files instead, kept
+in a read-through `FileCache` which mirrors the directories of the datasets, so hive
+partitions are parsed from the cached paths as from the dataset.
+
+The files of a dataset are immutable, writers give them unique names and never
+rewrite them, so a cached copy is valid for as long as the file is listed by the
+manifest and is never checked against the remote file. Building a scan only reads
+the footers of the files. A file is downloaded when a query first reads it, and
+later queries open it from the local disk: a query stopping after a few rows, or
+filtering out the partitions of a file, does not download the others.
+"""
+
+import os
+import threading
+from pathlib import Path
+
+import polars as pl
+import pyarrow.parquet as pq
+from fsspec.implementations.local import LocalFileSystem
+from polars.io.plugins import register_io_source
+
+from nemdb.logger import log
+
+from .manifest import file_id
+from .partitioning import scan_file
+
+
+def is_local(fs) -> bool:
+    """Whether the filesystem is the local disk, whose files are scanned directly."""
+    return isinstance(fs, LocalFileSystem)
+
+
+def cache_path(fs, cache, path: str) -> Path:
+    """Returns the path of the local copy of a file of the filesystem."""
+    protocol = fs.protocol if isinstance(fs.protocol, str) else fs.protocol[0]
+    return cache.root / protocol / fs._strip_protocol(path).lstrip("/")
+
+
+def cached_files(fs, paths: list[str], cache) -> list[str]:
+    """Returns the local copies of the files, downloading the missing ones.
+
+    The files are pinned in the cache, so they are not evicted until released, and
+    the cache evicts the least recently used files over its budget.
+
+    Parameters
+    ----------
+    fs : fsspec.AbstractFileSystem
+        Filesystem of the files.
+    paths : list[str]
+        Paths of the files on the filesystem.
+    cache : FileCache
+        Recursive cache holding the copies.
+    """
+    local = [cache_path(fs, cache, path) for path in paths]
+    missing = [
+        (path, target) for path, target in zip(paths, local) if not target.exists()
+    ]
+    if missing:
+        log.info("Downloading %s files to %s", len(missing), cache.root)
+        tmp_paths = []
+        for _, target in missing:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp_paths.append(f"{target}.{file_id()}.part")
+        try:
+            fs.get([path for path, _ in missing], tmp_paths)
+            for tmp_path, (_, target) in zip(tmp_paths, missing):
+                os.replace(tmp_path, target)
+        finally:
+            for tmp_path in tmp_paths:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+    cache.touch_all(local)
+    return [str(target) for target in local]
+
+
+class ReadThroughCache:
+    """Scans the files of a filesystem, from local copies if it is remote.
+
+    A remote file is downloaded to the cache when a query reads it, and pinned only
+    while it is read, so the cache stays within its budget whatever the size of the
+    scanned dataset.
+
+    Parameters
+    ----------
+    fs : fsspec.AbstractFileSystem
+        Filesystem of the dataset.
+    cache : Callable[[], FileCache]
+        Returns the recursive cache of the copies, called on every read so the
+        cache follows the configuration.
+    """
+
+    def __init__(self, fs, cache):
+        self.fs = fs
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._footers = {}
+
+    def footer(self, path: str) -> tuple[pl.Schema, int]:
+        """Returns the schema and the number of rows of a file, read once."""
+        with self._lock:
+            footer = self._footers.get(path)
+        if footer is None:
+            with self.fs.open(path, "rb") as f:
+                metadata = pq.read_metadata(f)
+            schema = pl.from_arrow(metadata.schema.to_arrow_schema().empty_table())
+            footer = (schema.schema, metadata.num_rows)
+            with self._lock:
+                self._footers[path] = footer
+        return footer
+
+    def scan(self, path: str, partition: pl.DataFrame, *args, **kwargs) -> pl.LazyFrame:
+        """Scans a file with its partition row, see `scan_file`.
+
+        The file of a remote dataset is downloaded when the query reads it, unless
+        the query only reads partition columns, or its filters only use partition
+        columns and exclude the partition of the file.
+        """
+        if is_local(self.fs):
+            return scan_file(path, partition, *args, **kwargs)
+        schema, rows = self.footer(path)
+
+        def read(with_columns, predicate, n_rows, batch_size):
+            if predicate is not None and set(predicate.meta.root_names()) <= set(
+                partition.columns
+            ):
+                if partition.filter(predicate).is_empty():
+                    # Polars expects at least one frame from the source
+                    empty = pl.DataFrame(schema={**schema, **partition.schema})
+                    yield empty if with_columns is None else empty.select(with_columns)
+                    return
+                predicate = None
+            if (
+                predicate is None
+                and with_columns
+                and set(with_columns) <= set(partition.columns)
+            ):
+                # The values of the partition columns are known without the file
+                yield partition.select(with_columns).select(
+                    pl.all().repeat_by(min(rows, n_rows or rows)).explode()
+                )
+                return
+            cache = self.cache()
+            (local,) = cached_files(self.fs, [path], cache)
+            try:
+                data = scan_file(local, partition, *args, **kwargs)
+                if predicate is not None:
+                    data = data.filter(predicate)
+                if with_columns is not None:
+                    data = data.select(with_columns)
+                if n_rows is not None:
+                    data = data.head(n_rows)
+                yield data.collect()
+            finally:
+                cache.release(local)
+
+        return register_io_source(read, schema={**schema, **partition.schema})
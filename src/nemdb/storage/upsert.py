@@ -0,0 +1,195 @@
+"""Merge of corrected data into the partitions of a parquet dataset.
+
+AEMO republishes corrected archives. Rather than writing a corrected month again,
+its rows are merged by primary key into the files of the partition: rows whose key is
+new are inserted, rows whose values changed are updated and rows whose key is no
+longer published are deleted. Only the files holding updated or deleted rows are
+rewritten, the others are kept as they are, and the partition is published by a
+single commit of the manifest.
+
+Each primary key appears once in the merged partition, rows repeated in the data or
+in the files by earlier writes are dropped, so queries never have to deduplicate.
+"""
+
+from typing import NamedTuple
+
+import polars as pl
+
+from nemdb.logger import log
+
+from . import journal as _journal
+from .manifest import file_id, partition_key
+from .partitioning import hive_values
+from .writer import write_partitions
+
+
+class MergeReport(NamedTuple):
+    """The rows changed by the merge of a partition."""
+
+    inserted: int
+    updated: int
+    deleted: int
+    files_rewritten: int
+
+
+def _read_files(fs, root: str, files: list[str]):
+    """Reads the files of each directory, with the index of their file.
+
+    Returns the rows by directory and the number of rows of each file.
+    """
+    directories = {}
+    rows = []
+    for i, file in enumerate(files):
+        with fs.open(f"{root}/{file}", "rb") as f:
+            data = pl.read_parquet(f).with_columns(pl.lit(i, pl.Int32).alias("_file"))
+        rows.append(data.height)
+        key = tuple(hive_values(file).items())
+        directories.setdefault(key, []).append(data)
+    directories = {
+        key: pl.concat(frames, how="diagonal_relaxed")
+        for key, frames in directories.items()
+    }
+    return directories, rows
+
+
+def merge_partition(
+    fs,
+    manifest,
+    journal,
+    period: tuple,
+    data: pl.DataFrame,
+    partition_cols: list[str],
+    keys: list[str],
+    basename: str,
+    **kwargs,
+) -> MergeReport:
+    """Merges the rows of a partition into its files by primary key.
+
+    Parameters
+    ----------
+    fs : fsspec.AbstractFileSystem
+        Filesystem of the dataset.
+    manifest : PartitionManifest
+        Manifest of the dataset, updated with the files of the partition.
+    journal : Journal
+        Journal of the dataset.
+    period : tuple
+        The (year, month) or (year, month, day) of the partition.
+    data : pl.DataFrame
+        All the rows of the partition, with the partition columns, in the types of
+        the files.
+    partition_cols : list[str]
+        The hive partition columns of the dataset.
+    keys : list[str]
+        The primary keys of the table.
+    basename : str
+        Prefix of the names of the new files.
+    **kwargs
+        Passed to `write_partitions`.
+    """
+    year, month, day = (*period, None)[:3]
+    keys = [col for col in keys if col not in partition_cols]
+    if not keys:
+        raise ValueError("Merging a partition needs primary keys")
+    unique = data.unique(partition_cols + keys, keep="last", maintain_order=True)
+    if unique.height < data.height:
+        log.warning(
+            "Dropping %s rows of %s %s repeating a primary key",
+            data.height - unique.height,
+            manifest.path,
+            partition_key(*period),
+        )
+    partition = manifest.get(*period)
+    files = partition["files"] if partition else []
+    journal.record(year, month, _journal.WRITE, day=day)
+    old, file_rows = _read_files(fs, manifest.path, files)
+    new = {
+        tuple(zip(partition_cols, map(str, values))): rows
+        for values, rows in unique.partition_by(
+            partition_cols, as_dict=True, maintain_order=True
+        ).items()
+    }
+    inserted = updated = deleted = 0
+    affected = set()
+    changed = []
+    for directory in dict.fromkeys([*new, *old]):
+        rows = new.get(directory)
+        existing = old.get(directory)
+        if existing is None:
+            inserted += rows.height
+            changed.append(rows)
+            continue
+        # Copies of a key written by earlier writes are deleted with their files
+        first = existing.unique(keys, keep="first", maintain_order=True)
+        deleted += existing.height - first.height
+        repeated = set(existing.filter(pl.struct(keys).is_duplicated())["_file"])
+        if rows is None:
+            deleted += first.height
+            affected.update(existing["_file"])
+            continue
+        columns = [col for col in rows.columns if col not in partition_cols]
+        values = [col for col in columns if col not in keys]
+        first = first.with_columns(
+            pl.lit(None, rows.schema[col]).alias(col)
+            for col in columns
+            if col not in first.columns
+        ).select(*columns, "_file")
+        joined = first.join(
+            rows.select(columns).with_columns(pl.lit(True).alias("_new")),
+            on=keys,
+            how="full",
+            coalesce=True,
+            suffix="_new",
+        )
+        differs = pl.any_horizontal(
+            [pl.col(col).ne_missing(pl.col(f"{col}_new")) for col in values]
+            or [pl.lit(False)]
+        )
+        status = joined.select(
+            pl.col("_file"),
+            pl.col("_file").is_null().alias("inserted"),
+            pl.col("_new").is_null().alias("deleted"),
+            (pl.col("_file").is_not_null() & pl.col("_new") & differs).alias("updated"),
+        )
+        inserted += status["inserted"].sum()
+        deleted += status["deleted"].sum()
+        updated += status["updated"].sum()
+        rewritten = repeated | set(
+            status.filter(pl.col("deleted") | pl.col("updated"))["_file"]
+        )
+        affected.update(rewritten)
+        if rewritten or status["inserted"].any():
+            # The rows of the rewritten files and the inserted rows are written again
+            written_keys = first.filter(pl.col("_file").is_in(rewritten)).select(keys)
+            changed.append(
+                rows.join(written_keys, on=keys, how="semi").vstack(
+                    rows.join(first.select(keys), on=keys, how="anti")
+                )
+            )
+    written = []
+    changed = [rows for rows in changed if rows.height]
+    if changed:
+        written = write_partitions(
+            pl.concat(changed, how="diagonal_relaxed").sort(partition_cols + keys),
+            manifest.path,
+            partition_cols,
+            f"{basename}-{file_id()}-{{i}}.parquet",
+            sort_cols=keys,
+            fs=fs,
+            **kwargs,
+        )
+    kept = [
+        (f"{manifest.path}/{file}", file_rows[i])
+        for i, file in enumerate(files)
+        if i not in affected
+    ]
+    manifest.add(year, month, kept + written, day=day)
+    journal.record(year, month, _journal.COMMIT, day=day)
+    report = MergeReport(int(inserted), int(updated), int(deleted), len(affected))
+    log.info(
+        "Merged %s %s: %s inserted, %s updated, %s deleted, %s files rewritten",
+        manifest.path,
+        partition_key(*period),
+        *report,
+    )
+    return report
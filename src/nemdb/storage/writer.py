@@ -0,0 +1,222 @@
+import polars as pl
+import pyarrow.parquet as pq
+
+
+def sorting_columns(columns: list[str], sort_cols: list[str] = None) -> list:
+    """Returns the parquet metadata of rows sorted by the columns, in polars order.
+
+    The metadata stops at the first sort column that is not in the file, the order
+    of the columns after it is not known.
+    """
+    sorting = []
+    for col in sort_cols or []:
+        if col not in columns:
+            break
+        sorting.append(pq.SortingColumn(columns.index(col), nulls_first=True))
+    return sorting
+
+
+def file_options(
+    columns: list[str], sort_cols: list[str] = None, page_index: bool = True
+) -> dict:
+    """Returns the pyarrow options writing the statistics used to prune reads.
+
+    Files get column statistics, a page index when `page_index` is set, and the
+    sorting columns of their row groups.
+    """
+    return {
+        "write_statistics": True,
+        "write_page_index": page_index,
+        "sorting_columns": sorting_columns(columns, sort_cols) or None,
+    }
+
+
+def write_partitions(
+    data: pl.DataFrame,
+    path: str,
+    partition_cols: list[str],
+    basename_template: str,
+    sort_cols: list[str] = None,
+    page_index: bool = True,
+    profile=None,
+    fs=None,
+    **kwargs,
+):
+    """Writes the data to a hive partitioned parquet dataset.
+
+    The rows of each partition should be sorted by `sort_cols`, which are recorded
+    as the sorting columns of the row groups. With `row_group_size`, row groups hold
+    that many rows, whatever the size of the batches of the data. The columns are
+    compressed and encoded as the `WriteProfile` `profile`, the polars defaults if None.
+    The files are written on the fsspec filesystem `fs`, the one pyarrow infers from
+    `path` if None.
+
+    Returns
+    -------
+    list[tuple[str, int]]
+        The path and the number of rows of every file written.
+    """
+    written = []
+
+    def visit(file):
+        written.append((file.path, file.metadata.num_rows))
+
+    columns = [col for col in data.columns if col not in partition_cols]
+    sort_cols = [col for col in sort_cols or [] if col not in partition_cols]
+    options = file_options(columns, sort_cols, page_index)
+    if profile is not None:
+        options.update(profile.options(data.select(columns)))
+        kwargs = {
+            "compression": options.pop("compression"),
+            "compression_level": options.pop("compression_level"),
+            **kwargs,
+        }
+    if kwargs.get("row_group_size"):
+        options["min_rows_per_group"] = kwargs["row_group_size"]
+    if fs is not None:
+        options["filesystem"] = fs
+        path = fs._strip_protocol(path)
+    data.write_parquet(
+        path,
+        use_pyarrow=True,
+        pyarrow_options={
+            "partition_cols": partition_cols,
+            "existing_data_behavior": "overwrite_or_ignore",
+            "basename_template": basename_template,
+            "file_visitor": visit,
+            **options,
+        },
+        **kwargs,
+    )
+    return written
+
+
+class StreamingPartitionWriter:
+    """Writes a stream of DataFrames to a hive partitioned parquet dataset.
+
+    Rows are buffered per partition and written as row groups of `row_group_size` rows
+    through a single `ParquetWriter` per partition. When the buffers grow over
+    `max_buffer_bytes`, the largest partitions are flushed early, so memory does not
+    depend on the size of the input.
+
+    Parameters
+    ----------
+    fs : fsspec.AbstractFileSystem
+        Filesystem of the dataset.
+    path : str
+        Root directory of the dataset.
+    partition_cols : list[str]
+        Columns the dataset is partitioned by, they are not written to the files.
+    basename : str
+        Name of the file written in each partition.
+    sort_cols : list[str], optional
+        Columns every row group is sorted by, recorded in the metadata of the files.
+    row_group_size : int
+        Number of rows of the row groups.
+    max_buffer_bytes : int
+        Budget of the rows buffered across partitions.
+    data_page_size : int, optional
+        Approximate size of the data pages, the pyarrow default if None.
+    page_index : bool
+        Write the page index of the columns.
+    profile : WriteProfile, optional
+        Compression and encodings of the columns, the pyarrow defaults if None.
+    """
+
+    def __init__(
+        self,
+        fs,
+        path: str,
+        partition_cols: list[str],
+        basename: str,
+        sort_cols: list[str] = None,
+        row_group_size: int = 256 * 1024,
+        max_buffer_bytes: int = 128 * 2**20,
+        data_page_size: int = None,
+        page_index: bool = True,
+        profile=None,
+    ):
+        self.fs = fs
+        self.path = path.rstrip("/")
+        self.partition_cols = partition_cols
+        self.basename = basename
+        self.sort_cols = [col for col in sort_cols or [] if col not in partition_cols]
+        self.row_group_size = row_group_size
+        self.max_buffer_bytes = max_buffer_bytes
+        self.data_page_size = data_page_size
+        self.page_index = page_index
+        self.profile = profile
+        self._buffers: dict[tuple, list[pl.DataFrame]] = {}
+        self._buffered_bytes: dict[tuple, int] = {}
+        self._writers: dict[tuple, tuple] = {}
+        self._rows: dict[tuple, int] = {}
+
+    def write(self, data: pl.DataFrame):
+        """Buffers the rows of the data in their partitions, writing full row groups."""
+        parts = data.partition_by(self.partition_cols, as_dict=True, include_key=False)
+        for key, part in parts.items():
+            self._buffers.setdefault(key, []).append(part)
+            self._buffered_bytes[key] = (
+                self._buffered_bytes.get(key, 0) + part.estimated_size()
+            )
+            while self._buffered_rows(key) >= self.row_group_size:
+                self._flush(key, self.row_group_size)
+        while sum(self._buffered_bytes.values()) > self.max_buffer_bytes:
+            self._flush(max(self._buffered_bytes, key=self._buffered_bytes.get))
+
+    def _buffered_rows(self, key) -> int:
+        return sum(df.height for df in self._buffers.get(key, []))
+
+    def close(self) -> list[tuple[str, int]]:
+        """Writes the remaining rows and closes the files.
+
+        Returns
+        -------
+        list[tuple[str, int]]
+            The path and the number of rows of every file written.
+        """
+        for key in list(self._buffers):
+            self._flush(key)
+        return self.abort()
+
+    def abort(self) -> list[tuple[str, int]]:
+        """Closes the files, dropping the rows still buffered, returns the files written."""
+        self._buffers = {}
+        self._buffered_bytes = {}
+        files = []
+        for key, (writer, f, file_path) in self._writers.items():
+            writer.close()
+            f.close()
+            files.append((file_path, self._rows[key]))
+        self._writers = {}
+        return files
+
+    def _flush(self, key, rows: int = None):
+        data = pl.concat(self._buffers.pop(key))
+        self._buffered_bytes.pop(key)
+        if rows is not None and data.height > rows:
+            data, rest = data.head(rows), data.tail(-rows)
+            self._buffers[key] = [rest]
+            self._buffered_bytes[key] = rest.estimated_size()
+        if self.sort_cols:
+            data = data.sort(self.sort_cols)
+        table = data.to_arrow()
+        if key not in self._writers:
+            directory = "/".join(
+                [self.path]
+                + [f"{col}={value}" for col, value in zip(self.partition_cols, key)]
+            )
+            self.fs.makedirs(directory, exist_ok=True)
+            file_path = f"{directory}/{self.basename}"
+            f = self.fs.open(file_path, "wb")
+            writer = pq.ParquetWriter(
+                f,
+                table.schema,
+                data_page_size=self.data_page_size,
+                **file_options(table.schema.names, self.sort_cols, self.page_index),
+                **(self.profile.options(data) if self.profile is not None else {}),
+            )
+            self._writers[key] = (writer, f, file_path)
+            self._rows[key] = 0
+        self._writers[key][0].write_table(table, row_group_size=self.row_group_size)
+        self._rows[key] += table.num_rows
@@ -1,11 +1,10 @@
-import requests
 from typing import Any
 import functools
 import polars as pl
 import geopandas as gpd
 import pandas as pd
 
-from nemdb import log
+from nemdb import http, log
 
 import os
 
@@ -32,7 +31,8 @@ def download_file(url, path, stream=True):
         log.info("File already exists at %s", path)
         return path
     log.info("Downloading %s to %s", url, path)
-    with requests.get(url, stream=stream) as r:
+    with http.host_slot(url), http.get(url, stream=stream) as r:
+        r.raise_for_status()
         with open(path, "wb") as f:
             for chunk in r.iter_content(1024):
                 f.write(chunk)
@@ -41,12 +41,11 @@ def download_file(url, path, stream=True):
 
 
 def download_file_to_bytesio(url):
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-
     bytes_io = BytesIO()
-    for chunk in response.iter_content(chunk_size=4096):
-        bytes_io.write(chunk)
+    with http.host_slot(url), http.get(url, stream=True) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=1 << 16):
+            bytes_io.write(chunk)
 
     bytes_io.seek(0)
     return bytes_io
@@ -0,0 +1,34 @@
+from nemdb.cache import FileCache
+
+
+def _write(root, name, size):
+    path = root / name
+    path.write_bytes(b"0" * size)
+    return path
+
+
+def test_evicts_ingested_first(tmp_path):
+    cache = FileCache(tmp_path, max_bytes=250)
+    old = _write(tmp_path, "old.zip", 100)
+    cache.add(old)
+    cache.release(old)
+    ingested = _write(tmp_path, "ingested.zip", 100)
+    cache.add(ingested)
+    cache.mark_ingested(ingested)
+
+    cache.add(_write(tmp_path, "new.zip", 100))
+
+    assert set(cache.entries) == {"old.zip", "new.zip"}
+    assert not ingested.exists()
+
+
+def test_manifest_is_rebuilt_from_directory(tmp_path):
+    cache = FileCache(tmp_path)
+    cache.add(_write(tmp_path, "a.zip", 10))
+    cache.mark_ingested(tmp_path / "a.zip")
+    _write(tmp_path, "b.zip", 20)
+
+    reloaded = FileCache(tmp_path)
+
+    assert reloaded.entries["a.zip"]["ingested"]
+    assert reloaded.size() == 30
@@ -0,0 +1,85 @@
+import multiprocessing
+
+import fsspec
+import polars as pl
+
+from nemdb.nemweb.dimensions import Dimensions
+
+
+def test_dictionaries_are_append_only_and_persisted(tmp_path):
+    fs = fsspec.filesystem("file")
+    dims = Dimensions(fs, str(tmp_path))
+    dims["DUID"].extend(["BW01", "AGLHAL"])
+    dims["DUID"].extend(["ER01", "AGLHAL", None])
+
+    reloaded = Dimensions(fs, str(tmp_path))
+
+    assert reloaded["DUID"].values == ["BW01", "AGLHAL", "ER01"]
+    assert reloaded["DUID"].version == 2
+    assert reloaded["REGIONFROM"] is reloaded["REGIONID"]
+
+
+def test_encode_writes_codes_and_decode_restores_enums(tmp_path):
+    fs = fsspec.filesystem("file")
+    dims = Dimensions(fs, str(tmp_path))
+    dims["REGIONID"].extend(["VIC1"])
+    data = pl.DataFrame(
+        {"DUID": ["BW01", "ER01"], "REGIONID": ["NSW1", "VIC1"], "MW": [1.0, 2.0]}
+    )
+
+    encoded = dims.encode(data, ["DUID", "REGIONID"], keep=["DUID"])
+    decoded = dims.decode(encoded, ["DUID", "REGIONID"])
+
+    assert encoded["REGIONID"].to_list() == [1, 0]
+    assert encoded["DUID"].dtype == pl.String
+    assert decoded["REGIONID"].dtype == pl.Enum(["VIC1", "NSW1"])
+    assert decoded["DUID"].to_list() == ["BW01", "ER01"]
+
+
+def test_decode_reads_values_added_by_other_processes(tmp_path):
+    fs = fsspec.filesystem("file")
+    reader = Dimensions(fs, str(tmp_path))
+    reader["DUID"].extend(["BW01", "ER01"])
+    assert reader["DUID"].values == ["BW01", "ER01"]
+
+    # Another process, such as a populate run, adds a value
+    Dimensions(fs, str(tmp_path))["DUID"].extend(["AGLHAL"])
+    codes = pl.DataFrame({"DUID": [2, 0]}, schema={"DUID": pl.UInt32})
+
+    assert reader.decode(codes, ["DUID"])["DUID"].to_list() == ["AGLHAL", "BW01"]
+    lazy = reader.decode(codes.lazy(), ["DUID"]).collect()
+    assert lazy["DUID"].to_list() == ["AGLHAL", "BW01"]
+
+
+def test_decode_adds_the_values_of_string_columns(tmp_path):
+    dims = Dimensions(fsspec.filesystem("file"), str(tmp_path))
+    dims["DUID"].extend(["BW01"])
+    data = pl.LazyFrame({"DUID": ["ER01", "BW01"], "MW": [1.0, 2.0]})
+
+    decoded = dims.decode(data, ["DUID"]).collect()
+
+    assert decoded["DUID"].to_list() == ["ER01", "BW01"]
+    assert dims["DUID"].values == ["BW01", "ER01"]
+
+
+def _extend(path, prefix, rounds):
+    dims = Dimensions(fsspec.filesystem("file"), path)
+    for i in range(rounds):
+        dims["DUID"].extend([f"{prefix}{i}"])
+
+
+def test_processes_extending_a_dictionary_keep_each_others_values(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_extend, args=(str(tmp_path), prefix, 30))
+        for prefix in ("A", "B")
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    values = Dimensions(fsspec.filesystem("file"), str(tmp_path))["DUID"].values
+    assert [process.exitcode for process in processes] == [0, 0]
+    assert sorted(values) == sorted(f"{p}{i}" for p in "AB" for i in range(30))
+    assert not list(tmp_path.glob("_dimensions/*.lock"))
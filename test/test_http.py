@@ -0,0 +1,174 @@
+import io
+import threading
+import time
+import zipfile
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from nemdb import Config, http
+from nemdb.nemweb import nemweb
+from nemdb.nemweb.utils import cache_response_zip, read_meta, write_meta
+
+
+class StubAdapter(HTTPAdapter):
+    """Answers the requests of the session with `handler(request)`."""
+
+    def __init__(self, handler):
+        super().__init__()
+        self.handler = handler
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        status, headers, body = self.handler(request)
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response.raw = io.BytesIO(body)
+        response.url = request.url
+        response.request = request
+        return response
+
+
+@pytest.fixture
+def stub(monkeypatch, tmp_path):
+    """Routes the shared session to a stub adapter and the caches to tmp_path."""
+    monkeypatch.setattr(Config, "TEMP_DIR", tmp_path)
+    monkeypatch.setattr(http, "_HOST_SLOTS", {})
+
+    def install(handler):
+        adapter = StubAdapter(handler)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        monkeypatch.setattr(http, "_SESSION", session)
+        monkeypatch.setattr(http, "_SESSION_KEY", http._session_key())
+        return adapter
+
+    return install
+
+
+def _zip(size):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as z:
+        z.writestr("data.csv", "x" * size)
+    return buffer.getvalue()
+
+
+def test_session_is_shared_and_follows_config(monkeypatch):
+    monkeypatch.setattr(http, "_SESSION", None)
+    session = http.get_session()
+    assert http.get_session() is session
+    adapter = session.get_adapter("https://nemweb.com.au")
+    assert adapter._pool_maxsize == Config.MAX_CONNECTIONS_PER_HOST
+    assert adapter.max_retries.total == Config.HTTP_RETRIES
+
+    monkeypatch.setattr(Config, "HTTP_RETRIES", Config.HTTP_RETRIES + 1)
+    rebuilt = http.get_session()
+    assert rebuilt is not session
+    assert rebuilt.get_adapter("https://x").max_retries.total == Config.HTTP_RETRIES
+
+
+def test_host_slots_bound_concurrent_requests(stub, monkeypatch):
+    monkeypatch.setattr(Config, "MAX_CONNECTIONS_PER_HOST", 2)
+    lock = threading.Lock()
+    active = []
+    peak = []
+
+    def handler(request):
+        with lock:
+            active.append(request)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.remove(request)
+        return 200, {}, b""
+
+    stub(handler)
+    threads = [
+        threading.Thread(target=http.get, args=(f"https://nemweb.com.au/{i}",))
+        for i in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(peak) == 6
+    assert max(peak) == 2
+
+
+def test_download_resumes_partial_file(stub, tmp_path):
+    body = _zip(10_000)
+    url = "https://nemweb.com.au/ARCHIVE.zip"
+    part = tmp_path / "ARCHIVE.zip.part"
+    part.write_bytes(body[:1000])
+    write_meta(part, {"etag": '"v1"', "content_length": len(body)})
+
+    def handler(request):
+        assert request.headers["Range"] == "bytes=1000-"
+        assert request.headers["If-Range"] == '"v1"'
+        headers = {
+            "ETag": '"v1"',
+            "Content-Range": f"bytes 1000-{len(body) - 1}/{len(body)}",
+            "Content-Length": str(len(body) - 1000),
+        }
+        return 206, headers, body[1000:]
+
+    adapter = stub(handler)
+    path = cache_response_zip(url)
+
+    assert len(adapter.requests) == 1
+    assert open(path, "rb").read() == body
+    assert read_meta(path)["etag"] == '"v1"'
+    assert not part.exists()
+
+
+def test_cached_file_is_revalidated_with_its_etag(stub):
+    versions = {"etag": '"v1"', "body": _zip(100)}
+
+    def handler(request):
+        headers = {
+            "ETag": versions["etag"],
+            "Content-Length": str(len(versions["body"])),
+        }
+        body = b"" if request.method == "HEAD" else versions["body"]
+        return 200, headers, body
+
+    adapter = stub(handler)
+    url = "https://nemweb.com.au/ARCHIVE.zip"
+    path = cache_response_zip(url)
+    assert cache_response_zip(url) == path
+    # The second call only asks whether the file changed
+    assert [r.method for r in adapter.requests] == ["GET", "HEAD"]
+
+    versions.update(etag='"v2"', body=_zip(200))
+    cache_response_zip(url)
+
+    assert [r.method for r in adapter.requests][2:] == ["HEAD", "GET"]
+    assert open(path, "rb").read() == versions["body"]
+    assert read_meta(path)["etag"] == '"v2"'
+
+
+def test_listings_are_reused_within_ttl_then_revalidated(stub, monkeypatch):
+    monkeypatch.setattr(nemweb, "_LISTINGS", {})
+    monkeypatch.setattr(Config, "LISTING_TTL", 600)
+
+    def handler(request):
+        if request.headers.get("If-None-Match") == '"listing"':
+            return 304, {}, b""
+        return 200, {"ETag": '"listing"'}, b'<a href="a.zip">a.zip</a>'
+
+    adapter = stub(handler)
+    url = "https://nemweb.com.au/Reports/Current/"
+    assert nemweb.__read_links(url) == ["a.zip"]
+    assert nemweb.__read_links(url) == ["a.zip"]
+    assert len(adapter.requests) == 1
+
+    monkeypatch.setattr(Config, "LISTING_TTL", 0)
+    assert nemweb.__read_links(url) == ["a.zip"]
+
+    assert len(adapter.requests) == 2
+    assert adapter.requests[1].headers["If-None-Match"] == '"listing"'
@@ -1,8 +1,11 @@
+import zipfile
+
+import polars as pl
 import pytest
 from datetime import datetime, timedelta
 
 from nemdb import Config
-from nemdb.nemweb.dbloader import NEMWEBManager
+from nemdb.nemweb.dbloader import BySettlementDate, NEMWEBManager
 
 
 def __select_date():
@@ -30,3 +33,127 @@ def test_scan():
     pds = NEMWEBManager(Config.CACHE_DIR)
     # pds.DISPATCHLOAD.scan()
     assert pds.DISPATCHLOAD.scan().head().collect().shape[0] > 0
+
+
+def _price_archive(path, year, month, intervention=0):
+    rows = [
+        f'D,DISPATCH,PRICE,5,"{year}/{month:02d}/01 00:{minute:02d}:00",{region},'
+        f"{minute}.5,{intervention}"
+        for minute in range(5, 60, 5)
+        for region in ("NSW1", "QLD1", "SA1", "TAS1", "VIC1")
+    ]
+    lines = [
+        "C,NEMP.WORLD,DVD_DISPATCHPRICE,AEMO,PUBLIC,2024/03/08,10:33:03,1,,1",
+        "I,DISPATCH,PRICE,5,SETTLEMENTDATE,REGIONID,RRP,INTERVENTION",
+        *rows,
+        'C,"END OF REPORT",60',
+    ]
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("PUBLIC_DVD_DISPATCHPRICE.CSV", "\r\n".join(lines))
+    return str(path)
+
+
+def test_get_data_reads_the_partition_pruned_to_one_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "TEMP_DIR", tmp_path / "temp")
+    config = type("TestConfig", (Config,), {"CACHE_DIR": str(tmp_path / "cache")})
+    source = BySettlementDate(
+        config=config,
+        table_name="DISPATCHPRICE",
+        table_columns=["SETTLEMENTDATE", "REGIONID", "RRP"],
+        table_primary_keys=["SETTLEMENTDATE", "REGIONID"],
+    )
+    for month in (1, 2):
+        archive = _price_archive(tmp_path / f"{month}.zip", 2024, month)
+        source.write_period(source.parse_period(archive, 2024, month), 2024, month)
+
+    date_time = "2024/02/01 00:10:00"
+    periods = source.prune(datetime(2024, 2, 1, 0, 10), datetime(2024, 2, 1, 0, 10))
+    data = source.get_data(date_time)
+
+    assert len(source.manifest.files(periods=periods)) == 1
+    assert data.shape == (5, 5)
+    assert [len(col) for col in data.get_columns()] == [5] * 5
+    assert data["RRP"].to_list() == [10.5] * 5
+    assert data["month"].to_list() == [2] * 5
+    assert data["REGIONID"].dtype == pl.Enum(["NSW1", "QLD1", "SA1", "TAS1", "VIC1"])
+
+
+def test_files_written_before_a_widening_are_cast_when_scanned(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "TEMP_DIR", tmp_path / "temp")
+    config = type("TestConfig", (Config,), {"CACHE_DIR": str(tmp_path / "cache")})
+    source = BySettlementDate(
+        config=config,
+        table_name="DISPATCHPRICE",
+        table_columns=["SETTLEMENTDATE", "REGIONID", "RRP", "INTERVENTION"],
+        table_primary_keys=["SETTLEMENTDATE", "REGIONID"],
+    )
+    archive = _price_archive(tmp_path / "1.zip", 2024, 1)
+    source.write_period(source.parse_period(archive, 2024, 1), 2024, 1)
+    january = source.manifest.files(periods=[(2024, 1)])
+
+    archive = _price_archive(tmp_path / "2.zip", 2024, 2, intervention=1000)
+    source.write_period(source.parse_period(archive, 2024, 2), 2024, 2)
+
+    # The files of January are not rewritten, their narrower type is cast at scan
+    assert source.manifest.files(periods=[(2024, 1)]) == january
+    assert pl.read_parquet(january[0]).schema["INTERVENTION"] == pl.Int8
+    data = source.scan().collect()
+    assert data.schema["INTERVENTION"] == pl.Int16
+    assert sorted(data["INTERVENTION"].unique().to_list()) == [0, 1000]
+
+
+def test_readers_see_columns_widened_by_another_writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "TEMP_DIR", tmp_path / "temp")
+    config = type("TestConfig", (Config,), {"CACHE_DIR": str(tmp_path / "cache")})
+    reader, writer = (
+        BySettlementDate(
+            config=config,
+            table_name="DISPATCHPRICE",
+            table_columns=["SETTLEMENTDATE", "REGIONID", "RRP", "INTERVENTION"],
+            table_primary_keys=["SETTLEMENTDATE", "REGIONID"],
+        )
+        for _ in range(2)
+    )
+    archive = _price_archive(tmp_path / "1.zip", 2024, 1)
+    writer.write_period(writer.parse_period(archive, 2024, 1), 2024, 1)
+    assert reader.scan().collect().schema["INTERVENTION"] == pl.Int8
+
+    archive = _price_archive(tmp_path / "2.zip", 2024, 2, intervention=1000)
+    writer.write_period(writer.parse_period(archive, 2024, 2), 2024, 2)
+
+    data = reader.scan().collect()
+    assert data.schema["INTERVENTION"] == pl.Int16
+    assert data["INTERVENTION"].max() == 1000
+
+
+def test_migrate_rewrites_a_dataset_partitioned_by_duid(tmp_path):
+    config = type("TestConfig", (Config,), {"CACHE_DIR": str(tmp_path)})
+    # The layout written before the series partitions, strings in the directories
+    for duid, mw in (("BW01", 100.0), ("ER01", 200.0)):
+        directory = tmp_path / "DISPATCHLOAD" / f"DUID={duid}" / "year=2024" / "month=1"
+        directory.mkdir(parents=True)
+        pl.DataFrame(
+            {
+                "SETTLEMENTDATE": [
+                    datetime(2024, 1, 1, 0, 5),
+                    datetime(2024, 1, 1, 0, 10),
+                ],
+                "TOTALCLEARED": [mw, mw + 1],
+            }
+        ).write_parquet(directory / "DISPATCHLOAD-0.parquet")
+    source = BySettlementDate(
+        config=config,
+        table_name="DISPATCHLOAD",
+        table_columns=["SETTLEMENTDATE", "DUID", "TOTALCLEARED"],
+        table_primary_keys=["SETTLEMENTDATE", "DUID"],
+    )
+    assert source.partitions == ["DUID", "year", "month"]
+    before = source.scan().collect().sort("DUID", "SETTLEMENTDATE")
+
+    assert source.migrate() == [(2024, 1)]
+
+    assert source.partitions == ["year", "month"]
+    assert all("DUID=" not in path for path in source.manifest.files())
+    after = source.scan().collect().sort("DUID", "SETTLEMENTDATE")
+    assert after.select(before.columns).equals(before)
+    assert after["DUID"].cast(pl.String).to_list() == ["BW01", "BW01", "ER01", "ER01"]
@@ -0,0 +1,50 @@
+import time
+
+import pytest
+
+from nemdb.pipeline import Stage, run_pipeline
+
+
+def test_items_go_through_all_stages():
+    written = []
+    run_pipeline(
+        range(10),
+        [
+            Stage("double", lambda x: 2 * x, workers=3),
+            Stage("keep_multiples_of_four", lambda x: None if x % 4 else x),
+            Stage("write", written.append, workers=2),
+        ],
+    )
+    assert sorted(written) == [0, 4, 8, 12, 16]
+
+
+def test_first_error_is_raised():
+    def fail(x):
+        if x == 3:
+            raise ValueError("boom")
+        return x
+
+    with pytest.raises(ValueError, match="boom"):
+        run_pipeline(range(100), [Stage("fail", fail, workers=2), Stage("id", id)])
+
+
+def test_items_dropped_after_an_error_are_discarded():
+    processed = []
+    discarded = []
+
+    def fail(x):
+        if x == 3:
+            raise ValueError("boom")
+        return x
+
+    def slow(x):
+        time.sleep(0.1)
+        processed.append(x)
+
+    with pytest.raises(ValueError, match="boom"):
+        run_pipeline(
+            range(10),
+            [Stage("fail", fail), Stage("slow", slow, discard=discarded.append)],
+        )
+    assert discarded
+    assert sorted(processed + discarded) == [0, 1, 2]
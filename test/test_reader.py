@@ -0,0 +1,75 @@
+import io
+import zipfile
+from datetime import datetime
+
+import polars as pl
+from structlog.testing import capture_logs
+
+from nemdb.nemweb.reader import read_mmsdm, read_mmsdm_csv, sniff_header
+
+CSV = "\r\n".join(
+    [
+        "C,NEMP.WORLD,DVD_DISPATCHPRICE,AEMO,PUBLIC,2024/02/08,10:33:03,1,,1",
+        "I,DISPATCH,PRICE,5,SETTLEMENTDATE,REGIONID,RRP,LASTCHANGED",
+        'D,DISPATCH,PRICE,5,"2024/01/01 00:05:00",NSW1,85.5,"2024/01/01 00:00:10"',
+        'D,DISPATCH,PRICE,5,"2024/01/01 00:05:00",VIC1,-10.25,',
+        'C,"END OF REPORT",4',
+    ]
+)
+DTYPES = {
+    "SETTLEMENTDATE": pl.Datetime,
+    "REGIONID": pl.Categorical,
+    "RRP": pl.Float32,
+    "LASTCHANGED": pl.Datetime,
+    "EFFECTIVEDATE": pl.Date,
+}
+
+
+def test_reads_zipped_mmsdm_csv(tmp_path):
+    archive = tmp_path / "PUBLIC_DVD_DISPATCHPRICE_202401010000.zip"
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("PUBLIC_DVD_DISPATCHPRICE_202401010000.CSV", CSV)
+
+    columns = ["SETTLEMENTDATE", "REGIONID", "RRP", "LASTCHANGED", "EFFECTIVEDATE"]
+    with pl.StringCache():
+        header, df = read_mmsdm(str(archive), columns, DTYPES)
+
+    assert (header.table, header.version) == ("DISPATCH_PRICE", "5")
+    assert df.columns == columns
+    assert dict(df.schema) == {k: DTYPES[k] for k in columns}
+    assert df.height == 2
+    assert df["SETTLEMENTDATE"][0] == datetime(2024, 1, 1, 0, 5)
+    assert df["REGIONID"].cast(pl.String).to_list() == ["NSW1", "VIC1"]
+    assert df["LASTCHANGED"].null_count() == 1
+    assert df["EFFECTIVEDATE"].null_count() == 2
+
+
+def test_header_is_sniffed_from_the_stream():
+    f = io.BytesIO(CSV.encode())
+
+    header = sniff_header(f)
+
+    assert (header.table, header.version) == ("DISPATCH_PRICE", "5")
+    assert header.missing(["RRP", "EEP"]) == ["EEP"]
+    assert f.readline().startswith(b"D,DISPATCH,PRICE,5")
+    assert sniff_header(io.BytesIO(CSV.encode())) is header
+
+
+def test_malformed_data_records_are_reported(tmp_path):
+    lines = CSV.split("\r\n")
+    # A truncated data record, and a record of another table of the file
+    lines[3:3] = [
+        'D,DISPATCH,PRICE,5,"2024/01/01 00:05:00",QLD1',
+        "D,DISPATCH,REGIONSUM,5,x",
+    ]
+    path = tmp_path / "PUBLIC_DVD_DISPATCHPRICE_202401010000.CSV"
+    path.write_text("\r\n".join(lines))
+
+    with pl.StringCache(), capture_logs() as logs:
+        df = read_mmsdm_csv(str(path), ["REGIONID", "RRP"], DTYPES)
+
+    assert df["REGIONID"].cast(pl.String).to_list() == ["NSW1", "VIC1"]
+    warnings = [log for log in logs if log["log_level"] == "warning"]
+    assert len(warnings) == 1
+    assert warnings[0]["event"].startswith("Skipped 1 malformed records")
+    assert "QLD1" in warnings[0]["event"]
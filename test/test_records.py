@@ -0,0 +1,37 @@
+from datetime import datetime
+
+import polars as pl
+
+from nemdb.nemweb.records import read_sections, split_sections
+
+BIDMOVE = b"\r\n".join(
+    [
+        b"C,NEMP.WORLD,BIDMOVE_COMPLETE,AEMO,PUBLIC,2024/01/02,04:05:00,1,,1",
+        b"I,BID,BIDDAYOFFER_D,2,SETTLEMENTDATE,DUID,BIDTYPE,PRICEBAND1",
+        b'D,BID,BIDDAYOFFER_D,2,"2024/01/01 00:00:00",AGLHAL,ENERGY,-1000',
+        b'D,BID,BIDDAYOFFER_D,2,"2024/01/01 00:00:00",BW01,ENERGY,-999.5',
+        b"I,BID,BIDPEROFFER_D,2,INTERVAL_DATETIME,DUID,BIDTYPE,MAXAVAIL",
+        b'D,BID,BIDPEROFFER_D,2,"2024/01/01 04:05:00",AGLHAL,ENERGY,180',
+        b'C,"END OF REPORT",6',
+        b"",
+    ]
+)
+
+
+def test_sections_are_split_on_record_boundaries():
+    sections = split_sections(BIDMOVE)
+
+    assert [(s.table, s.version) for s in sections] == [
+        ("BID_BIDDAYOFFER_D", "2"),
+        ("BID_BIDPEROFFER_D", "2"),
+    ]
+    assert BIDMOVE[sections[1].start : sections[1].end].count(b"\n") == 2
+
+
+def test_sections_are_parsed_with_types():
+    price, volume = read_sections(BIDMOVE).values()
+
+    assert price.height == 2
+    assert price["PRICEBAND1"].dtype == pl.Float64
+    assert volume["INTERVAL_DATETIME"].to_list() == [datetime(2024, 1, 1, 4, 5)]
+    assert volume["MAXAVAIL"].to_list() == [180]
@@ -0,0 +1,56 @@
+import fsspec
+import polars as pl
+
+from nemdb.nemweb.schema import TableSchema
+
+
+def _data(versions, mw):
+    return pl.DataFrame(
+        {
+            "VERSIONNO": versions,
+            "RRP": [12345.12345] * len(versions),
+            "TOTALCLEARED": mw,
+            "DUID": ["BW01"] * len(versions),
+        },
+        schema_overrides={"VERSIONNO": pl.Int64},
+    )
+
+
+def test_types_are_chosen_from_observed_values(tmp_path):
+    schema = TableSchema(fsspec.filesystem("file"), str(tmp_path), "TABLE")
+
+    reports = schema.check(_data([1, 3], [10.5, 1234.56789]), version="5")
+
+    assert schema.dtypes == {
+        "VERSIONNO": pl.Int32,
+        "RRP": pl.Float64,
+        "TOTALCLEARED": pl.Float32,
+    }
+    assert [(r.column, r.lossy) for r in reports] == [("TOTALCLEARED", 1)]
+    assert schema.cast(_data([1], [1.0])).schema["VERSIONNO"] == pl.Int32
+
+
+def test_integers_start_from_the_declared_type(tmp_path):
+    fs = fsspec.filesystem("file")
+    declared = TableSchema(fs, str(tmp_path / "a"), "TABLE", {"VERSIONNO": pl.Int8})
+    declared.check(_data([1, 3], [1.0, 1.0]))
+    assert declared.dtypes["VERSIONNO"] == pl.Int8
+
+    # The first month does not bound the values of the later ones
+    wide = TableSchema(fs, str(tmp_path / "b"), "TABLE", {"VERSIONNO": pl.Int8})
+    wide.check(_data([1, 200_000_000], [1.0, 1.0]))
+    assert wide.dtypes["VERSIONNO"] == pl.Int64
+
+
+def test_overflowing_columns_are_widened_and_persisted(tmp_path):
+    fs = fsspec.filesystem("file")
+    schema = TableSchema(fs, str(tmp_path), "TABLE", {"VERSIONNO": pl.Int8})
+    schema.check(_data([1], [1.0]), version="5")
+
+    reports = schema.check(_data([1, 300], [1.0, 1.0]), version="6")
+
+    reloaded = TableSchema(fs, str(tmp_path), "TABLE")
+    assert reports[0].column == "VERSIONNO" and reports[0].overflow == 1
+    assert reloaded.dtypes["VERSIONNO"] == pl.Int16
+    assert reloaded.revision == 1
+    assert reloaded.versions == {"5": 0, "6": 1}
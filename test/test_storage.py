@@ -0,0 +1,554 @@
+import functools
+import json
+import multiprocessing
+import os
+import socket
+from datetime import date, datetime
+
+import fsspec
+import polars as pl
+import pyarrow.parquet as pq
+import pytest
+
+from nemdb.storage import (
+    Journal,
+    PartitionManifest,
+    PartitionSpec,
+    StreamingPartitionWriter,
+    benchmark_profile,
+    compact_partition,
+    get_profile,
+    merge_partition,
+    pruning_report,
+    write_partitions,
+)
+from nemdb.cache import FileCache
+from nemdb.storage import compaction
+from nemdb.storage.catalog import catalog_frame, overlaps, partition_stats
+from nemdb.storage.journal import COMMIT, DOWNLOAD, REWRITE, WRITE
+from nemdb.storage.partitioning import scan_partitions
+from nemdb.storage.remote import ReadThroughCache
+
+
+def _data(year, month, rows):
+    return pl.DataFrame(
+        {
+            "value": list(range(rows)),
+            "year": [year] * rows,
+            "month": [month] * rows,
+        }
+    )
+
+
+def test_manifest_records_written_partitions(tmp_path):
+    fs = fsspec.filesystem("file")
+    manifest = PartitionManifest(fs, str(tmp_path))
+    files = write_partitions(
+        _data(2024, 1, 5), str(tmp_path), ["year", "month"], "table-{i}.parquet"
+    )
+    manifest.add(2024, 1, files)
+
+    reloaded = PartitionManifest(fs, str(tmp_path))
+    assert (2024, 1) in reloaded
+    assert (2024, 2) not in reloaded
+    assert reloaded.get(2024, 1)["files"] == ["year=2024/month=1/table-0.parquet"]
+
+
+def test_manifest_is_rebuilt_from_dataset(tmp_path):
+    fs = fsspec.filesystem("file")
+    for month, rows in ((1, 3), (2, 4)):
+        write_partitions(
+            _data(2024, month, rows),
+            str(tmp_path),
+            ["year", "month"],
+            "table-{i}.parquet",
+        )
+
+    manifest = PartitionManifest(fs, str(tmp_path))
+    assert not manifest.exists()
+    assert not (tmp_path / "_manifest.json").exists()
+
+    assert manifest.get(2024, 1)["rows"] == 3
+    assert manifest.get(2024, 2)["rows"] == 4
+    assert manifest.exists()
+    assert (tmp_path / "_manifest.json").exists()
+
+
+def test_journal_recovers_interrupted_writes(tmp_path):
+    fs = fsspec.filesystem("file")
+    manifest = PartitionManifest(fs, str(tmp_path))
+    journal = Journal(fs, str(tmp_path), "table")
+    files = {}
+    for month in (1, 2):
+        journal.record(2024, month, WRITE)
+        files[month] = write_partitions(
+            _data(2024, month, 3),
+            str(tmp_path),
+            ["year", "month"],
+            "table-{i}.parquet",
+        )
+    manifest.add(2024, 1, files[1])
+    journal.record(2024, 1, COMMIT)
+    journal.record(2024, 3, DOWNLOAD)
+
+    assert sorted(journal.recover(manifest)) == [(2024, 2), (2024, 3)]
+    assert not (tmp_path / "year=2024" / "month=2" / "table-0.parquet").exists()
+    assert (tmp_path / "year=2024" / "month=1" / "table-0.parquet").exists()
+    assert len(journal.entries()) == 2
+
+
+def test_journal_leaves_the_writes_of_live_processes(tmp_path):
+    fs = fsspec.filesystem("file")
+    manifest = PartitionManifest(fs, str(tmp_path))
+    manifest.add(2023, 12, [])
+    journal = Journal(fs, str(tmp_path), "table")
+    finished = multiprocessing.get_context("spawn").Process(target=int)
+    finished.start()
+    finished.join()
+    owners = {
+        1: os.getppid(),  # still writing
+        2: finished.pid,  # died while writing
+        3: finished.pid,  # died while migrating a committed partition
+    }
+    with open(journal.journal_path, "w") as f:
+        for month, pid in owners.items():
+            entry = {
+                "table": "table",
+                "year": 2024,
+                "month": month,
+                "stage": REWRITE if month == 3 else WRITE,
+                "time": 0,
+                "owner": f"{socket.gethostname()}:{pid}",
+            }
+            f.write(json.dumps(entry) + "\n")
+            write_partitions(
+                _data(2024, month, 3),
+                str(tmp_path),
+                ["year", "month"],
+                "table-{i}.parquet",
+            )
+
+    assert journal.recover(manifest) == [(2024, 2)]
+    assert (tmp_path / "year=2024" / "month=1" / "table-0.parquet").exists()
+    assert not (tmp_path / "year=2024" / "month=2" / "table-0.parquet").exists()
+    assert not (tmp_path / "year=2024" / "month=3" / "table-0.parquet").exists()
+
+
+def test_manifest_tracks_day_partitions(tmp_path):
+    fs = fsspec.filesystem("file")
+    data = _data(2024, 1, 2).with_columns(day=pl.lit(3))
+    write_partitions(data, str(tmp_path), ["year", "month", "day"], "t-{i}.parquet")
+
+    manifest = PartitionManifest(fs, str(tmp_path))
+
+    assert (2024, 1, 3) in manifest
+    assert (2024, 1) not in manifest
+    assert manifest.files_on_disk(2024, 1, 3)
+
+
+def test_streaming_writer_writes_one_file_per_partition(tmp_path):
+    fs = fsspec.filesystem("file")
+    writer = StreamingPartitionWriter(
+        fs,
+        str(tmp_path),
+        ["year", "month"],
+        "t-0.parquet",
+        sort_cols=["value"],
+        row_group_size=4,
+        max_buffer_bytes=1,
+    )
+    for month in (1, 2, 1):
+        writer.write(_data(2024, month, 5).with_columns(pl.col("value") * -1))
+
+    files = dict(writer.close())
+
+    january = str(tmp_path / "year=2024" / "month=1" / "t-0.parquet")
+    assert files[january] == 10
+    assert pq.ParquetFile(january).metadata.num_row_groups == 4
+    assert pl.read_parquet(january)["value"].head(4).to_list() == [-3, -2, -1, 0]
+    assert PartitionManifest(fs, str(tmp_path)).get(2024, 2)["rows"] == 5
+
+
+def test_compaction_merges_small_files_sorted(tmp_path):
+    fs = fsspec.filesystem("file")
+    manifest = PartitionManifest(fs, str(tmp_path))
+    journal = Journal(fs, str(tmp_path), "table")
+    files = []
+    for i in range(3):
+        files += write_partitions(
+            _data(2024, 1, 4).with_columns(pl.col("value") * 3 + i),
+            str(tmp_path),
+            ["year", "month"],
+            f"table-{i}-{{i}}.parquet",
+        )
+    manifest.add(2024, 1, files)
+
+    assert compact_partition(
+        fs, manifest, journal, (2024, 1), "table", ["value"], 2**20
+    )
+
+    merged = manifest.files()
+    assert len(merged) == 1 and "/table-compact-" in merged[0]
+    assert pl.read_parquet(merged[0])["value"].to_list() == list(range(12))
+    assert manifest.get(2024, 1)["rows"] == 12
+    assert journal.incomplete() == {}
+    manifest.expire(0)
+    directory = tmp_path / "year=2024" / "month=1"
+    assert [str(f) for f in directory.iterdir()] == merged
+
+
+def test_compaction_keeps_files_committed_while_it_merges(tmp_path, monkeypatch):
+    fs = fsspec.filesystem("file")
+    manifest = PartitionManifest(fs, str(tmp_path))
+    journal = Journal(fs, str(tmp_path), "table")
+    files = []
+    for i in range(3):
+        files += write_partitions(
+            _data(2024, 1, 4),
+            str(tmp_path),
+            ["year", "month"],
+            f"table-{i}-{{i}}.parquet",
+        )
+    manifest.add(2024, 1, files)
+    merge_files = compaction.merge_files
+
+    def concurrent_write(*args, **kwargs):
+        merged = merge_files(*args, **kwargs)
+        # Another writer adds a file to the partition before the compaction commits
+        written = write_partitions(
+            _data(2024, 1, 2), str(tmp_path), ["year", "month"], "other-{i}.parquet"
+        )
+        PartitionManifest(fs, str(tmp_path)).add(2024, 1, files + written)
+        return merged
+
+    monkeypatch.setattr(compaction, "merge_files", concurrent_write)
+    assert compact_partition(
+        fs, manifest, journal, (2024, 1), "table", ["value"], 2**20
+    )
+
+    committed = manifest.files()
+    assert len(committed) == 2
+    assert any("/other-0.parquet" in path for path in committed)
+    assert manifest.get(2024, 1)["rows"] == 14
+
+
+def test_interrupted_compaction_keeps_the_partition_committed(tmp_path, monkeypatch):
+    fs = fsspec.filesystem("file")
+    manifest = PartitionManifest(fs, str(tmp_path))
+    journal = Journal(fs, str(tmp_path), "table")
+    files = []
+    for i in range(3):
+        files += write_partitions(
+            _data(2024, 1, 4),
+            str(tmp_path),
+            ["year", "month"],
+            f"table-{i}-{{i}}.parquet",
+        )
+    manifest.add(2024, 1, files)
+    merge_files = compaction.merge_files
+
+    def interrupted(*args, **kwargs):
+        merge_files(*args, **kwargs)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(compaction, "merge_files", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        compact_partition(fs, manifest, journal, (2024, 1), "table", ["value"], 2**20)
+
+    assert journal.recover(manifest) == []
+    assert manifest.files() == [path for path, _ in files]
+    directory = tmp_path / "year=2024" / "month=1"
+    assert sorted(str(f) for f in directory.iterdir()) == manifest.files()
+
+
+def test_sorted_row_groups_prune_equality_filters(tmp_path):
+    fs = fsspec.filesystem("file")
+    data = _data(2024, 1, 10_000).with_columns((pl.col("value") % 7).alias("unit"))
+    files = write_partitions(
+        data,
+        str(tmp_path),
+        ["year", "month"],
+        "table-{i}.parquet",
+        sort_cols=["year", "value", "unit"],
+        row_group_size=1_000,
+    )
+    paths = [path for path, _ in files]
+
+    by_value = pruning_report(fs, paths, "value", probes=5)
+    by_unit = pruning_report(fs, paths, "unit", probes=5)
+
+    metadata = pq.ParquetFile(paths[0]).metadata
+    assert metadata.num_row_groups == 10
+    assert [s.column_index for s in metadata.row_group(0).sorting_columns] == [0, 1]
+    assert by_value.row_groups_read == 1 and by_value.rows_read == 0.1
+    assert by_value.sort_position == 0 and by_value.page_index == 1.0
+    assert by_unit.row_groups_read == 10 and by_unit.sort_position == 1
+
+
+def test_profiles_choose_codec_and_encodings(tmp_path):
+    data = _data(2024, 1, 10_000).with_columns(
+        pl.datetime_range(
+            pl.datetime(2024, 1, 1), pl.datetime(2024, 2, 10), "5m", eager=True
+        )
+        .head(10_000)
+        .alias("SETTLEMENTDATE"),
+        (pl.col("value") / 7).cast(pl.Float32).alias("mw"),
+        (pl.col("value") % 3).cast(pl.Float32).alias("ramp"),
+    )
+    files = write_partitions(
+        data,
+        str(tmp_path / "archive"),
+        ["year", "month"],
+        "table-{i}.parquet",
+        profile=get_profile("archive"),
+    )
+    columns = pq.ParquetFile(files[0][0]).metadata.row_group(0)
+    chunks = {columns.column(i).path_in_schema: columns.column(i) for i in range(4)}
+
+    assert chunks["value"].compression == "ZSTD"
+    assert "DELTA_BINARY_PACKED" in chunks["SETTLEMENTDATE"].encodings
+    assert "BYTE_STREAM_SPLIT" in chunks["mw"].encodings
+    assert "RLE_DICTIONARY" in chunks["ramp"].encodings
+
+    report = benchmark_profile(data, str(tmp_path / "hot"), ["year", "month"], "hot")
+    assert report.rows == 10_000 and report.files == 1 and report.bytes > 0
+    assert not (tmp_path / "hot").exists()
+
+
+def test_partition_spec_derives_bucket_partitions(tmp_path):
+    spec = PartitionSpec.parse("network, day:time, hash:DUID:4")
+    data = pl.DataFrame(
+        {
+            "network": ["a", "a", "b"],
+            "DUID": ["BW01", "ER01", "BW01"],
+            "time": pl.datetime_range(
+                pl.datetime(2024, 1, 1), pl.datetime(2024, 1, 3), "1d", eager=True
+            ),
+        }
+    )
+
+    data = spec.add_columns(data)
+    files = write_partitions(
+        data.with_columns(year=pl.lit(2024), month=pl.lit(1)),
+        str(tmp_path),
+        spec.partitions,
+        "table-{i}.parquet",
+    )
+
+    assert str(spec) == "network,day:time,hash:DUID:4"
+    assert spec.partitions == ["network", "year", "month", "day", "DUID_bucket"]
+    assert data["day"].to_list() == [1, 2, 3]
+    assert data["DUID_bucket"][0] == data["DUID_bucket"][2]
+    relative = [path[len(str(tmp_path)) + 1 :] for path, _ in files]
+    assert all(spec.matches(path) for path in relative)
+    assert PartitionSpec.infer(relative[0]) == PartitionSpec(columns=["network"])
+
+
+def test_commits_publish_snapshots_and_keep_replaced_files(tmp_path):
+    fs = fsspec.filesystem("file")
+    manifest = PartitionManifest(fs, str(tmp_path))
+    first = write_partitions(
+        _data(2024, 1, 3), str(tmp_path), ["year", "month"], "table-a-{i}.parquet"
+    )
+    manifest.add(2024, 1, first)
+    pinned = manifest.version
+    second = write_partitions(
+        _data(2024, 1, 5), str(tmp_path), ["year", "month"], "table-b-{i}.parquet"
+    )
+    # Written but not committed yet, readers of the current snapshot don't see it
+    assert manifest.files() == [path for path, _ in first]
+
+    reader = PartitionManifest(fs, str(tmp_path))
+    manifest.add(2024, 1, second)
+    reader.refresh()
+
+    assert reader.version == pinned + 1
+    assert reader.files() == [path for path, _ in second]
+    assert reader.files(pinned) == [path for path, _ in first]
+    assert manifest.expire(3600) == []
+    assert manifest.expire(0) == [path for path, _ in first]
+    assert manifest.versions() == [reader.version]
+
+
+def _commit_partitions(path, year, partitions):
+    manifest = PartitionManifest(fsspec.filesystem("file"), path)
+    for month in range(1, partitions + 1):
+        manifest.add(year, month, [(f"{path}/{year}-{month}.parquet", month)])
+
+
+def test_processes_committing_at_once_keep_each_others_partitions(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_commit_partitions, args=(str(tmp_path), year, 12))
+        for year in range(2020, 2026)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    manifest = PartitionManifest(fsspec.filesystem("file"), str(tmp_path))
+    assert [process.exitcode for process in processes] == [0] * 6
+    assert len(manifest.partitions) == 72
+    assert manifest.version == 72
+    assert not list(tmp_path.glob("_manifest.json.*"))
+
+
+def _readings(month, duids):
+    times = pl.datetime_range(
+        datetime(2024, month, 1),
+        datetime(2024, month, 1, 23, 55),
+        "5m",
+        eager=True,
+    )
+    return pl.DataFrame(
+        {
+            "SETTLEMENTDATE": times.to_list() * len(duids),
+            "DUID": [duid for duid in duids for _ in times],
+            "year": 2024,
+            "month": month,
+        }
+    )
+
+
+def test_catalog_records_partition_stats_and_prunes(tmp_path):
+    fs = fsspec.filesystem("file")
+    stats = functools.partial(
+        partition_stats, fs, time_column="SETTLEMENTDATE", distinct_columns=["DUID"]
+    )
+    first = write_partitions(
+        _readings(1, ["A", "B"]), str(tmp_path), ["year", "month"], "t-{i}.parquet"
+    )
+    # Committed without statistics, as by older versions
+    PartitionManifest(fs, str(tmp_path)).add(2024, 1, first)
+    manifest = PartitionManifest(fs, str(tmp_path), stats=stats)
+    second = write_partitions(
+        _readings(2, ["A"]), str(tmp_path), ["year", "month"], "t-{i}.parquet"
+    )
+    manifest.add(2024, 2, second)
+
+    assert "bytes" not in manifest.get(2024, 1)
+    assert manifest.get(2024, 2)["distinct"] == {"DUID": 1}
+    assert manifest.get(2024, 2)["min"] == "2024-02-01T00:00:00"
+
+    partitions = manifest.catalog()
+    assert manifest.get(2024, 1)["max"] == "2024-01-01T23:55:00"
+    frame = catalog_frame("TABLE", partitions, "SETTLEMENTDATE")
+    assert frame["month"].to_list() == [1, 2]
+    assert frame["rows"].to_list() == [576, 288]
+    assert frame["distinct_DUID"].to_list() == [2, 1]
+    assert frame["bytes"].to_list() == [fs.size(path) for path, _ in first + second]
+
+    kept = [p["month"] for p in partitions if overlaps(p, date(2024, 2, 1))]
+    assert kept == [2]
+    assert overlaps({"min": None, "max": None}, date(2030, 1, 1))
+
+
+def test_one_file_snapshot_scans_with_its_partition_values(tmp_path):
+    fs = fsspec.filesystem("file")
+    manifest = PartitionManifest(fs, str(tmp_path))
+    manifest.add(
+        2024,
+        1,
+        write_partitions(
+            _data(2024, 1, 60), str(tmp_path), ["year", "month"], "t-{i}.parquet"
+        ),
+    )
+    files = manifest.files()
+    relative = [path[len(manifest.path) + 1 :] for path in files]
+
+    data = scan_partitions(list(zip(files, relative)), PartitionSpec())
+    filtered = data.filter(pl.col("value") < 2).collect()
+
+    assert len(files) == 1
+    assert filtered.shape == (2, 3)
+    assert [len(col) for col in filtered.get_columns()] == [2, 2, 2]
+    assert filtered["month"].to_list() == [1, 1]
+    assert data.collect().shape == (60, 3)
+
+
+def test_remote_scans_read_through_local_cache(tmp_path):
+    fs = fsspec.filesystem("memory")
+    root = f"memory://{tmp_path.name}/table"
+    manifest = PartitionManifest(fs, root)
+    for month in (1, 2, 3):
+        manifest.add(
+            2024,
+            month,
+            write_partitions(
+                _data(2024, month, 100),
+                root,
+                ["year", "month"],
+                "table-{i}.parquet",
+                fs=fs,
+            ),
+        )
+    cache = FileCache(tmp_path / "cache", recursive=True)
+    scan_files = ReadThroughCache(fs, lambda: cache)
+    files = [(path, path[len(root) + 1 :]) for path in manifest.files()]
+    spec = PartitionSpec()
+    copies = tmp_path / "cache" / "memory" / tmp_path.name / "table" / "year=2024"
+
+    def cached():
+        return sorted(path.parent.name for path in copies.rglob("*.parquet"))
+
+    data = scan_partitions(files, spec, scan=scan_files.scan)
+    # Building the scan, counting rows by partition and reading the first rows
+    # download nothing but the files read
+    assert cached() == []
+    assert data.group_by("month").len().collect()["len"].to_list() == [100] * 3
+    assert data.head(5).collect()["month"].to_list() == [1] * 5
+    assert cached() == ["month=1"]
+    february = data.filter(pl.col("month") == 2).collect()
+    assert february["value"].to_list() == list(range(100))
+    assert cached() == ["month=1", "month=2"]
+
+    # Files are immutable, later scans do not read them from the store again
+    fs.rm(f"{root}/year=2024/month=2", recursive=True)
+    assert data.filter(pl.col("month") == 2).collect().equals(february)
+
+    # The files read are not pinned, the cache evicts them over the budget
+    cache.max_bytes = cache.size() // 2
+    assert data.filter(pl.col("month") == 3).collect().height == 100
+    assert cached() == ["month=3"]
+
+
+def test_merge_rewrites_only_changed_files(tmp_path):
+    fs = fsspec.filesystem("file")
+    manifest = PartitionManifest(fs, str(tmp_path))
+    journal = Journal(fs, str(tmp_path), "table")
+    files = []
+    for i in range(2):
+        files += write_partitions(
+            _data(2024, 1, 3).with_columns(pl.col("value") + 3 * i, mw=pl.lit(1.0)),
+            str(tmp_path),
+            ["year", "month"],
+            f"table-{i}-{{i}}.parquet",
+        )
+    manifest.add(2024, 1, files)
+    corrected = (
+        _data(2024, 1, 7)
+        .with_columns(mw=pl.lit(1.0))
+        .with_columns(
+            pl.when(pl.col("value") == 1).then(2.0).otherwise("mw").alias("mw")
+        )
+        .filter(pl.col("value") != 2)
+    )
+
+    report = merge_partition(
+        fs,
+        manifest,
+        journal,
+        (2024, 1),
+        pl.concat([corrected, corrected.head(1)]),
+        ["year", "month"],
+        ["value"],
+        "table",
+    )
+
+    merged = pl.read_parquet(manifest.files()).sort("value")
+    assert report == (1, 1, 1, 1)
+    assert files[1][0] in manifest.files() and files[0][0] not in manifest.files()
+    assert merged["value"].to_list() == [0, 1, 3, 4, 5, 6]
+    assert merged["mw"].to_list() == [1.0, 2.0, 1.0, 1.0, 1.0, 1.0]
+    assert manifest.get(2024, 1)["rows"] == 6